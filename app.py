@@ -2,26 +2,74 @@ from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File,
 from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from scanner import EternalsSearchScanner
-from database import Database
+from database import Database, AsyncDatabase
+from facets import parse_facet_fields
+from export import EXPORT_FORMATS, get_exporter, gzip_stream, export_ndjson
+from scan_events import format_sse
+from static_assets import Asset, PrecompressedStaticFiles, Template
 from ip_utils import RIPEManager
+from target_stream import TargetStream
 import threading
-import csv
-from io import StringIO
+import uuid
+import json
+import asyncio
 from pydantic import BaseModel
 from models import UserCreate, UserResponse, UserLogin
 import sqlite3
 from datetime import datetime
 import shutil
 import os
-from auth import get_password_hash, verify_password
+from auth import (
+    get_password_hash, verify_password, create_access_token, decode_access_token,
+    UserCache, ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, status
 import logging
 from pathlib import Path
 from typing import List
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Berapa bulan observasi mentah disimpan sebelum di-rollup dan di-drop
+OBSERVATION_RETENTION_MONTHS = 6
+# Interval komentar keepalive untuk stream SSE /api/scan/events
+SSE_KEEPALIVE_SECONDS = 15
+# Kompresi banner di database: None (teks biasa), 'zlib' atau 'zstd'
+BANNER_COMPRESSION = None
+# Jumlah maksimum hasil query (search/devices/history) yang di-cache di memori
+QUERY_CACHE_SIZE = 256
+# Batas jumlah IP/CIDR per request /api/devices/bulk
+BULK_LOOKUP_MAX_TARGETS = 100000
+# Body JSON harus di-parse utuh, jadi ukurannya dibatasi (teks dibaca per chunk)
+BULK_LOOKUP_MAX_JSON_BYTES = BULK_LOOKUP_MAX_TARGETS * 64
+
+ripe = RIPEManager()
+# Country/ASN untuk setiap hasil scan dari index lokal (rir/delegated-*, rir/ip2asn-v4.tsv)
+db = Database(
+    observation_retention_months=OBSERVATION_RETENTION_MONTHS,
+    banner_compression=BANNER_COMPRESSION,
+    enricher=ripe.enricher()
+)
+async_db = AsyncDatabase(db.db_name, codec=db.codec, cache_size=QUERY_CACHE_SIZE)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await async_db.connect()
+    await run_in_threadpool(db.compact_observations)
+    yield
+    await async_db.close()
+
+app = FastAPI(lifespan=lifespan)
+# Static files dimuat sekali ke memori, dengan varian gzip/brotli dan ETag
+static_files = PrecompressedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
+
+# Template dibaca dan di-split sekali saat startup
+templates = {
+    name: Template(f"templates/{name}.html", static_files)
+    for name in ("index", "login", "profile")
+}
 
 # Definisikan direktori upload
 UPLOAD_DIR = "uploads"
@@ -30,10 +78,8 @@ Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
 # Tambahkan route untuk melayani file upload
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
-db = Database()
 scanner = EternalsSearchScanner()
 scanner.db = db
-ripe = RIPEManager()
 
 class ScanConfig(BaseModel):
     scan_type: str
@@ -41,6 +87,7 @@ class ScanConfig(BaseModel):
     speed: str = "normal"
     country_codes: list[str] = None
     ip_range: str = None
+    exclude_ranges: str = None
 
 class DeviceHistory(BaseModel):
     ip: str
@@ -54,6 +101,8 @@ class DeviceScanRequest(BaseModel):
     port: int
 
 security = HTTPBearer(auto_error=False)
+# Cache user per id supaya request terautentikasi tidak perlu query database
+user_cache = UserCache(ttl=60)
 
 # Definisikan logger kustom
 logger = logging.getLogger("myapp_logger")
@@ -66,6 +115,19 @@ if not logger.hasHandlers():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
+async def get_user_from_token(token):
+    """Verify a signed session token and return the user row (cached), None if invalid"""
+    user_id = decode_access_token(token) if token else None
+    if user_id is None:
+        return None
+
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await async_db.get_user_by_id(user_id)
+        if user:
+            user_cache.set(user_id, user)
+    return user
+
 async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = None
@@ -82,14 +144,12 @@ async def get_current_user(request: Request, credentials: HTTPAuthorizationCrede
         
         logging.debug(f"Using token: {token}")
         
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user = c.execute('SELECT * FROM users WHERE id = ?', (token,)).fetchone()
-            if not user:
-                logging.debug("User not found for given token")
-                raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-            logging.debug(f"Authenticated user: {user[1]}")
-            return user
+        user = await get_user_from_token(token)
+        if not user:
+            logging.debug("User not found for given token")
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        logging.debug(f"Authenticated user: {user[1]}")
+        return user
     except Exception as e:
         logging.exception("Error in get_current_user")
         raise HTTPException(status_code=401, detail="Could not validate credentials")
@@ -102,28 +162,86 @@ async def index(request: Request):
     
     # Verifikasi token
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user = c.execute('SELECT * FROM users WHERE id = ?', (token,)).fetchone()
-            if not user:
-                response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-                response.delete_cookie("token", path="/")
-                logger.info("Cookie 'token' has been deleted.")
-                return response
+        user = await get_user_from_token(token)
+        if not user:
+            response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+            response.delete_cookie("token", path="/")
+            logger.info("Cookie 'token' has been deleted.")
+            return response
     except:
         response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
         response.delete_cookie("token", path="/")
         logger.info("Cookie 'token' has been deleted.")
         return response
     
-    with open("templates/index.html") as f:
-        return HTMLResponse(content=f.read())
+    return templates["index"].asset.response(request.headers)
 
 @app.get("/api/devices")
 async def get_devices(ip: str = None, limit: int = 100):
     if ip:
-        return db.get_devices_by_ip(ip)
-    return db.get_latest_devices(limit)
+        return await async_db.get_devices_by_ip(ip)
+    return await async_db.get_latest_devices(limit)
+
+def _check_target_count(targets: list):
+    if len(targets) > BULK_LOOKUP_MAX_TARGETS:
+        raise ValueError(f"Too many targets (max {BULK_LOOKUP_MAX_TARGETS})")
+
+async def _read_text_targets(request: Request) -> list:
+    """IPs/CIDRs from a text body, tokenized chunk by chunk as it arrives"""
+    targets = []
+    remainder = b''
+    async for chunk in request.stream():
+        data = remainder + chunk.replace(b',', b' ')
+        tokens = data.split()
+        # Token terakhir bisa terpotong di batas chunk, simpan untuk chunk berikutnya
+        remainder = tokens.pop() if tokens and not data[-1:].isspace() else b''
+        targets.extend(token.decode('utf-8') for token in tokens)
+        # Terlalu banyak target: tolak tanpa membaca sisa body
+        _check_target_count(targets)
+    if remainder:
+        targets.append(remainder.decode('utf-8'))
+        _check_target_count(targets)
+    return targets
+
+async def _read_json_targets(request: Request) -> list:
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > BULK_LOOKUP_MAX_JSON_BYTES:
+            raise ValueError(f"JSON body too large (max {BULK_LOOKUP_MAX_JSON_BYTES} bytes), send text instead")
+    data = json.loads(body or b'[]')
+    targets = data.get('targets', []) if isinstance(data, dict) else data
+    if not isinstance(targets, list):
+        raise ValueError("targets must be a list of IPs or CIDRs")
+    _check_target_count(targets)
+    return targets
+
+@app.post("/api/devices/bulk")
+async def bulk_lookup_devices(
+    request: Request,
+    port: int = Query(None),
+    gzip: bool = Query(False)
+):
+    """Stream devices matching many IPs/CIDRs as NDJSON
+
+    Body is either JSON ({"targets": [...]} or a plain list) or text with one
+    IP or CIDR per line (commas and whitespace also separate entries).
+    """
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            targets = await _read_json_targets(request)
+        else:
+            targets = await _read_text_targets(request)
+        batches = await run_in_threadpool(db.iter_devices_bulk, targets, port)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    content = export_ndjson(batches)
+    headers = {}
+    if gzip:
+        content = gzip_stream(content)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(content, media_type="application/x-ndjson", headers=headers)
 
 @app.post("/api/scan")
 async def start_scan(config: ScanConfig):
@@ -132,14 +250,13 @@ async def start_scan(config: ScanConfig):
             if not config.country_codes:
                 raise HTTPException(status_code=400, detail="Country codes required")
             
-            ip_ranges = []
-            for code in config.country_codes:
-                ranges = ripe.get_country_ip_ranges(code)
-                if ranges:
-                    ip_ranges.extend(ranges)
+            ip_ranges = await ripe.fetch_country_ip_ranges(config.country_codes)
         else:
             ip_ranges = config.ip_range.split('\n') if config.ip_range else []
-            
+        exclude_ranges = config.exclude_ranges.split('\n') if config.exclude_ranges else []
+
+        # Gabungkan overlap dan kurangi exclude sekali di sini, scanner menerima CIDR yang sudah unik
+        ip_ranges = await run_in_threadpool(ripe.validate_ip_ranges, ip_ranges, exclude_ranges)
         if not ip_ranges:
             raise HTTPException(status_code=400, detail="No valid IP ranges found")
             
@@ -162,48 +279,132 @@ async def start_scan(config: ScanConfig):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/scan/upload")
+async def upload_scan_targets(request: Request, exclude_ranges: str = Query(None)):
+    """Start a scan from a target file sent as the raw request body
+
+    One IP, CIDR or 'first-last' range per line. The body is streamed to
+    uploads/ and parsed in batches; the scan starts with the first batch
+    while the rest of the file is still arriving.
+    """
+    if scanner.is_scanning:
+        raise HTTPException(status_code=409, detail="Scan is already running")
+
+    # uuid supaya dua upload di detik yang sama tidak menulis ke file yang sama
+    path = os.path.join(UPLOAD_DIR, f"targets_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex}.txt")
+    excludes = exclude_ranges.replace(',', '\n').split() if exclude_ranges else []
+    targets = TargetStream(path, excludes)
+    scan_thread = threading.Thread(
+        target=scanner.scan_network,
+        kwargs={'ip_ranges': [path], 'targets': targets}
+    )
+    scan_thread.daemon = True
+    # Klaim scanner sebelum body dibaca (tanpa await sejak cek di atas), upload lain langsung dapat 409
+    scanner.is_scanning = True
+
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(targets.write, chunk)
+            if targets.size and scan_thread.ident is None:
+                scan_thread.start()
+    finally:
+        # Juga saat client putus: scan lanjut dengan target yang sudah masuk
+        await run_in_threadpool(targets.close)
+        if scan_thread.ident is None and targets.size:
+            scan_thread.start()
+        if scan_thread.ident is None:
+            # Tidak ada target valid: lepas klaim dan hapus file upload-nya
+            scanner.is_scanning = False
+            await run_in_threadpool(os.remove, path)
+
+    if not targets.size:
+        raise HTTPException(status_code=400, detail="No valid IP ranges found")
+
+    return {
+        "success": True,
+        "message": f"Scan started for {targets.size} IPs from {targets.entries} entries",
+        **targets.summary()
+    }
+
 @app.get("/api/status")
-async def get_status(current_user: dict = Depends(get_current_user)):
+async def get_status(
+    since: int = Query(None, ge=0),
+    limit: int = Query(500, gt=0, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    status = "idle"
-    if scanner.is_active:
-        status = "Scanning" if not scanner._is_paused else "paused"
+
+    if since is not None:
+        # Mode incremental: counter + device baru sejak cursor saja
+        return {
+            **scanner.status_snapshot(),
+            **scanner.discovered_since(since, limit)
+        }
     
     return {
-        "status": status,
-        "is_scanning": scanner._is_scanning,
-        "progress": scanner.progress,
-        "current_ip": scanner.current_ip,
+        **scanner.status_snapshot(),
         "results": scanner.results,
-        "start_time": scanner.scan_start_time.isoformat() if scanner.scan_start_time else None,
         "discovered_devices": scanner.discovered_devices
     }
 
+@app.get("/api/scan/events")
+async def scan_events(request: Request, current_user: dict = Depends(get_current_user)):
+    """Server-Sent Events stream of scan status, progress ticks and discovered devices"""
+    queue = scanner.events.subscribe()
+
+    async def event_stream():
+        try:
+            # Snapshot awal supaya client langsung punya state terbaru
+            yield format_sse('status', scanner.status_snapshot())
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            scanner.events.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/export")
-async def export_devices(format: str = "csv"):
-    devices = db.get_latest_devices()
-    
-    if format == "csv":
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['IP', 'Port', 'Banner', 'Timestamp'])
-        for device in devices:
-            writer.writerow([
-                device['ip'],
-                device['port'],
-                device['banner'],
-                device['timestamp']
-            ])
-        
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=devices.csv"}
-        )
-    
-    raise HTTPException(status_code=400, detail="Unsupported format")
+async def export_devices(
+    format: str = "csv",
+    query: str = Query(None),
+    port: int = Query(None),
+    banner: str = Query(None),
+    cidr: str = Query(None),
+    q: str = Query(None),
+    gzip: bool = Query(False)
+):
+    try:
+        exporter = get_exporter(format)
+        batches = db.iter_devices(query, port, banner, cidr, q=q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Cursor dibaca di satu thread sendiri (iter_devices), exporter sync jalan di threadpool Starlette
+    content = exporter(batches)
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"devices.{extension}"
+    if gzip:
+        content = gzip_stream(content)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 @app.get("/api/countries")
 async def get_countries():
@@ -211,7 +412,7 @@ async def get_countries():
 
 @app.get("/api/country/{country_code}/ranges")
 async def get_country_ranges(country_code: str):
-    ranges = ripe.get_country_ip_ranges(country_code.upper())
+    ranges = await ripe.fetch_country_ip_ranges([country_code])
     return ranges
 
 @app.post("/api/preview")
@@ -220,9 +421,8 @@ async def preview_scan(request: Request):
     ranges = data.get('ranges', [])
     exclude_ranges = data.get('exclude_ranges', [])
     
-    # Validate and get preview
-    valid_ranges = ripe.validate_ip_ranges(ranges, exclude_ranges)
-    preview = ripe.preview_ranges(valid_ranges)
+    # Normalisasi (merge overlap, kurangi exclude) lalu hitung IP unik
+    preview = await run_in_threadpool(ripe.preview_ranges, ranges, exclude_ranges)
     
     return preview
 
@@ -255,7 +455,7 @@ async def get_scan_history():
     """Get scan history with device counts"""
     try:
         # Ambil history dari database
-        history = db.get_scan_history()
+        history = await async_db.get_scan_history()
         return history
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -263,8 +463,7 @@ async def get_scan_history():
 @app.get("/api/devices/history", response_model=List[DeviceHistory])
 async def get_devices_history(limit: int = Query(100, gt=0, le=1000)):
     try:
-        # Panggil fungsi dari scanner
-        history = scanner.get_scan_history(limit)
+        history = await async_db.get_recent_devices(limit)
         
         # Format response
         return [{
@@ -278,29 +477,45 @@ async def get_devices_history(limit: int = Query(100, gt=0, le=1000)):
         logger.error(f"Error getting devices history: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/api/observations")
+async def get_observations(
+    ip: str = Query(...),
+    port: int = Query(None),
+    limit: int = Query(100, gt=0, le=1000)
+):
+    try:
+        return await async_db.get_observations(ip, port, limit)
+    except Exception as e:
+        logger.error(f"Error getting observations: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/observations/compact")
+async def compact_observations(retention_months: int = Query(None, ge=0)):
+    try:
+        dropped = await run_in_threadpool(db.compact_observations, retention_months)
+        return {
+            "success": True,
+            "dropped_partitions": dropped
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/users", response_model=UserResponse)
 async def create_user(user: UserCreate):
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            password_hash = get_password_hash(user.password)
-            c.execute('''
-                INSERT INTO users (username, full_name, profile_pic, password_hash)
-                VALUES (?, ?, ?, ?)
-            ''', (user.username, user.full_name, user.profile_pic, password_hash))
-            conn.commit()
-            
-            # Get the created user
-            user_id = c.lastrowid
-            created_user = c.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-            
-            return {
-                "id": created_user[0],
-                "username": created_user[1],
-                "full_name": created_user[2],
-                "profile_pic": created_user[3],
-                "created_at": created_user[5]
-            }
+        # bcrypt berat di CPU, jalankan di threadpool
+        password_hash = await run_in_threadpool(get_password_hash, user.password)
+        created_user = await async_db.create_user(
+            user.username, user.full_name, user.profile_pic, password_hash
+        )
+        
+        return {
+            "id": created_user[0],
+            "username": created_user[1],
+            "full_name": created_user[2],
+            "profile_pic": created_user[3],
+            "created_at": created_user[5]
+        }
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Username already exists")
     except Exception as e:
@@ -309,28 +524,30 @@ async def create_user(user: UserCreate):
 @app.post("/api/login")
 async def login(user: UserLogin, response: Response):
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user_data = c.execute('SELECT * FROM users WHERE username = ?', (user.username,)).fetchone()
-            
-            if not user_data or not verify_password(user.password, user_data[4]):
-                raise HTTPException(status_code=401, detail="Invalid username or password")
-            
-            # Set cookie
-            response.set_cookie(
-                key="token",
-                value=str(user_data[0]),
-                httponly=True,
-                path="/"
-            )
-            
-            return {
-                "id": user_data[0],
-                "username": user_data[1],
-                "full_name": user_data[2],
-                "profile_pic": user_data[3],
-                "created_at": user_data[5]
-            }
+        user_data = await async_db.get_user_by_username(user.username)
+        
+        if not user_data or not await run_in_threadpool(verify_password, user.password, user_data[4]):
+            raise HTTPException(status_code=401, detail="Invalid username or password")
+        
+        # Set cookie berisi token sesi yang ditandatangani
+        access_token = create_access_token(user_data[0])
+        response.set_cookie(
+            key="token",
+            value=access_token,
+            httponly=True,
+            max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            path="/"
+        )
+        
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "id": user_data[0],
+            "username": user_data[1],
+            "full_name": user_data[2],
+            "profile_pic": user_data[3],
+            "created_at": user_data[5]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -349,66 +566,54 @@ async def get_current_user_api(current_user: dict = Depends(get_current_user)):
 @app.get("/api/users/{user_id}", response_model=UserResponse)
 async def get_user(user_id: int):
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user = c.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-            
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            return {
-                "id": user[0],
-                "username": user[1],
-                "full_name": user[2],
-                "profile_pic": user[3],
-                "created_at": user[4]
-            }
+        user = await async_db.get_user_by_id(user_id)
+        
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        return {
+            "id": user[0],
+            "username": user[1],
+            "full_name": user[2],
+            "profile_pic": user[3],
+            "created_at": user[4]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/users/{user_id}", response_model=UserResponse)
 async def update_user(user_id: int, user: UserCreate):
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            c.execute('''
-                UPDATE users
-                SET username = ?, full_name = ?, profile_pic = ?
-                WHERE id = ?
-            ''', (user.username, user.full_name, user.profile_pic, user_id))
-            conn.commit()
-            
-            updated_user = c.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-            return {
-                "id": updated_user[0],
-                "username": updated_user[1],
-                "full_name": updated_user[2],
-                "profile_pic": updated_user[3],
-                "created_at": updated_user[4]
-            }
+        updated_user = await async_db.update_user(
+            user_id, user.username, user.full_name, user.profile_pic
+        )
+        user_cache.invalidate(user_id)
+        return {
+            "id": updated_user[0],
+            "username": updated_user[1],
+            "full_name": updated_user[2],
+            "profile_pic": updated_user[3],
+            "created_at": updated_user[4]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _save_upload(file: UploadFile, file_location: str):
+    """Copy an uploaded file to disk (blocking, run it in the threadpool)"""
+    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+    with open(file_location, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
 @app.post("/api/users/{user_id}/upload-profile-pic")
 async def upload_profile_pic(user_id: int, file: UploadFile = File(...)):
     try:
-        # Create upload directory if not exists
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
         # Save file
         file_location = f"{UPLOAD_DIR}/{user_id}_{file.filename}"
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await run_in_threadpool(_save_upload, file, file_location)
         
         # Update user profile pic in database
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            c.execute('''
-                UPDATE users
-                SET profile_pic = ?
-                WHERE id = ?
-            ''', (file_location, user_id))
-            conn.commit()
+        await async_db.update_profile_pic(user_id, file_location)
+        user_cache.invalidate(user_id)
         
         return {"success": True, "file_path": file_location}
     except Exception as e:
@@ -426,38 +631,27 @@ async def update_current_user(
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user = c.execute('SELECT * FROM users WHERE id = ?', (token,)).fetchone()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
+        user = await get_user_from_token(token)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        profile_pic = user[3]
+        if file:
+            # Buat nama file unik
+            file_location = f"{UPLOAD_DIR}/{user[0]}_{file.filename}"
             
-            profile_pic = user[3]
-            if file:
-                # Pastikan direktori upload ada
-                if not os.path.exists(UPLOAD_DIR):
-                    os.makedirs(UPLOAD_DIR)
-                
-                # Buat nama file unik
-                file_location = f"{UPLOAD_DIR}/{user[0]}_{file.filename}"
-                
-                # Simpan file
-                with open(file_location, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-                profile_pic = file_location
-
-            password_hash = user[4]
-            if password:
-                password_hash = get_password_hash(password)
-
-            c.execute('''
-                UPDATE users
-                SET username = ?, full_name = ?, profile_pic = ?, password_hash = ?
-                WHERE id = ?
-            ''', (username, full_name, profile_pic, password_hash, user[0]))
-            conn.commit()
-
-            return {"message": "Profile updated successfully"}
+            # Simpan file di threadpool, copy ke disk tidak memblok event loop
+            await run_in_threadpool(_save_upload, file, file_location)
+            profile_pic = file_location
+
+        password_hash = user[4]
+        if password:
+            password_hash = await run_in_threadpool(get_password_hash, password)
+
+        await async_db.update_user(user[0], username, full_name, profile_pic, password_hash)
+        user_cache.invalidate(user[0])
+
+        return {"message": "Profile updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -490,25 +684,22 @@ async def login_page(request: Request):
     if token:
         # Verifikasi token
         try:
-            with sqlite3.connect(db.db_name) as conn:
-                c = conn.cursor()
-                user = c.execute('SELECT * FROM users WHERE id = ?', (token,)).fetchone()
-                if user:
-                    return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
-                else:
-                    # Token invalid, hapus cookie dan redirect ke /login
-                    response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-                    response.delete_cookie("token", path="/")
-                    logger.info("Cookie 'token' has been deleted.")
-                    return response
+            user = await get_user_from_token(token)
+            if user:
+                return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+            else:
+                # Token invalid, hapus cookie dan redirect ke /login
+                response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+                response.delete_cookie("token", path="/")
+                logger.info("Cookie 'token' has been deleted.")
+                return response
         except:
             response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
             response.delete_cookie("token", path="/")
             logger.info("Cookie 'token' has been deleted.")
             return response
     else:
-        with open("templates/login.html") as f:
-            return HTMLResponse(content=f.read())
+        return templates["login"].asset.response(request.headers)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -524,26 +715,22 @@ async def profile_page(request: Request):
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
     
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            c = conn.cursor()
-            user = c.execute('SELECT * FROM users WHERE id = ?', (token,)).fetchone()
-            if not user:
-                response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-                response.delete_cookie("token", path="/")
-                logger.info("Cookie 'token' has been deleted.")
-                return response
+        user = await get_user_from_token(token)
+        if not user:
+            response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+            response.delete_cookie("token", path="/")
+            logger.info("Cookie 'token' has been deleted.")
+            return response
+        
+        # Render template (sudah di-load saat startup) dengan data user
+        content = templates["profile"].render(
+            username=user[1] or '',
+            full_name=user[2] or '',
+            profile_pic=user[3] or static_files.versioned_url('img/default-avatar.png')
+        )
+        # Halaman per-user: ETag tetap dipakai, tapi tidak boleh di-cache shared
+        return Asset(content.encode('utf-8'), 'text/html').response(request.headers, 'private, no-cache')
             
-            # Baca template dan inject data user
-            with open("templates/profile.html") as f:
-                template = f.read()
-                
-                # Replace placeholder dengan data user
-                template = template.replace('{{ username }}', user[1] or '')
-                template = template.replace('{{ full_name }}', user[2] or '')
-                template = template.replace('{{ profile_pic }}', user[3] or '/static/img/default-avatar.png')
-                
-                return HTMLResponse(content=template)
-                
     except Exception as e:
         logger.error(f"Error loading profile: {str(e)}")
         response = RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
@@ -557,120 +744,55 @@ async def get_history(
     per_page: int = Query(100, le=100)  # maksimal 100 item per page
 ):
     try:
-        with sqlite3.connect(scanner.db.db_name) as conn:
-            c = conn.cursor()
-            
-            # Hitung total records
-            total_count = c.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
-            
-            # Hitung offset untuk pagination
-            offset = (page - 1) * per_page
-            
-            # Query dengan pagination
-            c.execute('''
-                SELECT ip, port, banner, timestamp 
-                FROM devices 
-                ORDER BY timestamp DESC 
-                LIMIT ? OFFSET ?
-            ''', (per_page, offset))
-            
-            rows = c.fetchall()
-            history = []
-            
-            for row in rows:
-                history.append({
-                    "ip": row[0],
-                    "port": row[1],
-                    "banner": row[2],
-                    "timestamp": row[3]
-                })
-            
-            # Hitung total pages
-            total_pages = (total_count + per_page - 1) // per_page
-                
-            return {
-                "items": history,
-                "pagination": {
-                    "page": page,
-                    "per_page": per_page,
-                    "total_items": total_count,
-                    "total_pages": total_pages
-                }
-            }
+        return await async_db.get_history(page, per_page)
             
     except Exception as e:
         logger.error(f"Error getting history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/facets")
+async def get_facets(
+    fields: str = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+    query: str = Query(None),
+    port: int = Query(None),
+    banner: str = Query(None),
+    cidr: str = Query(None),
+    q: str = Query(None)
+):
+    """Top-N ports, tags, vulns, CPEs and server headers, optionally scoped like /api/search"""
+    try:
+        return await async_db.get_facets(parse_facet_fields(fields), limit, query, port, banner, cidr, q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting facets: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/search")
 async def search_devices(
     query: str = Query(None),
     port: int = Query(None),
     banner: str = Query(None),
+    cidr: str = Query(None),
+    q: str = Query(None),  # structured query, mis. port:22 tag:cloud NOT vuln:CVE-2021-44228
+    explain: bool = Query(False),
     page: int = Query(1, ge=1),
     per_page: int = Query(100, le=100)
 ):
     try:
-        with sqlite3.connect(db.db_name) as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            
-            # Buat query dasar untuk total count
-            count_parts = ["SELECT COUNT(*) FROM devices WHERE 1=1"]
-            query_parts = ["SELECT * FROM devices WHERE 1=1"]
-            params = []
-            
-            # Tambah filter berdasarkan parameter
-            if query:
-                # Mencari di IP dan banner
-                condition = "AND (ip LIKE ? OR banner LIKE ?)"
-                count_parts.append(condition)
-                query_parts.append(condition)
-                params.extend([f"%{query}%", f"%{query}%"])
-            
-            if port:
-                condition = "AND port = ?"
-                count_parts.append(condition)
-                query_parts.append(condition)
-                params.append(port)
-                
-            if banner:
-                condition = "AND banner LIKE ?"
-                count_parts.append(condition)
-                query_parts.append(condition)
-                params.append(f"%{banner}%")
-            
-            # Hitung total records
-            total_count = c.execute(" ".join(count_parts), params).fetchone()[0]
-            
-            # Tambah pagination
-            offset = (page - 1) * per_page
-            query_parts.append("ORDER BY timestamp DESC LIMIT ? OFFSET ?")
-            params.extend([per_page, offset])
-            
-            # Execute query
-            results = c.execute(" ".join(query_parts), params).fetchall()
-            
-            # Hitung total pages
-            total_pages = (total_count + per_page - 1) // per_page
-            
-            return {
-                "items": [dict(row) for row in results],
-                "pagination": {
-                    "page": page,
-                    "per_page": per_page,
-                    "total_items": total_count,
-                    "total_pages": total_pages
-                }
-            }
+        return await async_db.search_devices(query, port, banner, page, per_page, cidr, q, explain)
             
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/scan/device")
 async def scan_single_device(request: DeviceScanRequest):
     try:
-        result = scanner.scan_single_device(request.ip, request.port)
+        # requests.get + retry/sleep + tulis sqlite: blocking, jalankan di threadpool
+        result = await run_in_threadpool(scanner.scan_single_device, request.ip, request.port)
         return {
             "success": True,
             "message": "Device scan completed",
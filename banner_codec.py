@@ -0,0 +1,165 @@
+import json
+import zlib
+import struct
+import logging
+import threading
+from collections import Counter
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd opsional, zlib selalu tersedia
+    zstandard = None
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+# Header blob: 1 byte codec + 4 byte dictionary id (0 = tanpa dictionary)
+_HEADER = struct.Struct('>BI')
+
+class BannerCodec:
+    """Compress banner JSON for storage and transparently decode it back to text
+
+    Plain TEXT values are passed through untouched, so databases with a mix of
+    old uncompressed rows and compressed BLOB rows read back the same way.
+    """
+
+    def __init__(self, mode: Optional[str] = None, store=None):
+        if mode and mode not in CODEC_NAMES:
+            raise ValueError(f"Unsupported banner compression: {mode}")
+        if mode == 'zstd' and zstandard is None:
+            raise ValueError("Banner compression 'zstd' requires the zstandard package")
+        self.mode = mode
+        # store menyediakan load_banner_dictionary(id) dan latest_banner_dictionary(codec)
+        self.store = store
+        self._dictionaries = {}
+        self._active_dict_id = None
+        self._active_loaded = False
+        # Objek zstandard tidak thread-safe (scanner, reader pool, export jalan
+        # bersamaan), jadi compressor/decompressor di-cache per thread
+        self._local = threading.local()
+
+    def add_dictionary(self, dict_id: int, codec: str, data: bytes, active: bool = False):
+        self._dictionaries[dict_id] = (CODEC_NAMES[codec], data)
+        if active:
+            self._active_dict_id = dict_id
+            self._active_loaded = True
+
+    def _get_dictionary(self, dict_id: int):
+        if dict_id not in self._dictionaries and self.store is not None:
+            row = self.store.load_banner_dictionary(dict_id)
+            if row:
+                self.add_dictionary(dict_id, row[0], row[1])
+        if dict_id not in self._dictionaries:
+            raise ValueError(f"Unknown banner dictionary id: {dict_id}")
+        return self._dictionaries[dict_id][1]
+
+    def _active_dictionary_id(self) -> int:
+        if not self._active_loaded:
+            self._active_loaded = True
+            if self.store is not None:
+                try:
+                    row = self.store.latest_banner_dictionary(self.mode)
+                    if row:
+                        self.add_dictionary(row[0], self.mode, row[1], active=True)
+                except Exception as e:
+                    logging.warning(f"Could not load banner dictionary: {str(e)}")
+        return self._active_dict_id or 0
+
+    def _thread_cache(self, name: str) -> dict:
+        """Per-thread {dict_id: zstd object} cache"""
+        cache = getattr(self._local, name, None)
+        if cache is None:
+            cache = {}
+            setattr(self._local, name, cache)
+        return cache
+
+    def encode(self, text):
+        """Encode banner text for storage (returns text unchanged if compression is off)"""
+        if text is None or not self.mode:
+            return text
+        raw = text.encode('utf-8')
+        codec = CODEC_NAMES[self.mode]
+        dict_id = self._active_dictionary_id()
+
+        if codec == CODEC_ZSTD:
+            compressors = self._thread_cache('compressors')
+            compressor = compressors.get(dict_id)
+            if compressor is None:
+                zdict = zstandard.ZstdCompressionDict(self._get_dictionary(dict_id)) if dict_id else None
+                compressor = zstandard.ZstdCompressor(level=3, dict_data=zdict)
+                compressors[dict_id] = compressor
+            payload = compressor.compress(raw)
+        else:
+            if dict_id:
+                compressor = zlib.compressobj(6, zdict=self._get_dictionary(dict_id))
+            else:
+                compressor = zlib.compressobj(6)
+            payload = compressor.compress(raw) + compressor.flush()
+
+        return _HEADER.pack(codec, dict_id) + payload
+
+    def decode(self, value):
+        """Decode a stored banner back to its JSON text"""
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        codec, dict_id = _HEADER.unpack_from(value)
+        payload = value[_HEADER.size:]
+
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("zstd banner found but zstandard is not installed")
+            decompressors = self._thread_cache('decompressors')
+            decompressor = decompressors.get(dict_id)
+            if decompressor is None:
+                zdict = zstandard.ZstdCompressionDict(self._get_dictionary(dict_id)) if dict_id else None
+                decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+                decompressors[dict_id] = decompressor
+            raw = decompressor.decompress(payload)
+        elif codec == CODEC_ZLIB:
+            if dict_id:
+                decompressor = zlib.decompressobj(zdict=self._get_dictionary(dict_id))
+            else:
+                decompressor = zlib.decompressobj()
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            raise ValueError(f"Unknown banner codec: {codec}")
+
+        return raw.decode('utf-8')
+
+def train_dictionary(samples: List[str], mode: str, dict_size: int = 16384) -> bytes:
+    """Train a compression dictionary from sample banners"""
+    if mode == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd dictionary training requires the zstandard package")
+        return zstandard.train_dictionary(dict_size, [s.encode('utf-8') for s in samples]).as_bytes()
+
+    # zlib hanya mendukung preset dictionary maks 32KB: kumpulkan fragmen JSON
+    # yang paling sering muncul (key/value hostnames, cpes, tags, dst)
+    dict_size = min(dict_size, 32768)
+    fragments = Counter()
+    for sample in samples:
+        try:
+            data = json.loads(sample)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        for key, value in data.items():
+            fragments[f'"{key}": {json.dumps(value)}'] += 1
+            fragments[f'"{key}": '] += 1
+
+    # Fragmen paling sering ditaruh di akhir karena jaraknya paling dekat ke data
+    chosen = []
+    size = 0
+    for fragment, count in fragments.most_common():
+        if count < 2:
+            break
+        encoded = fragment.encode('utf-8')
+        if size + len(encoded) > dict_size:
+            continue
+        chosen.append(encoded)
+        size += len(encoded)
+    return b''.join(reversed(chosen))
@@ -1,16 +1,224 @@
 import sqlite3
-from datetime import datetime
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import re
+import aiosqlite
+from ip_utils import ip_to_int, cidr_bounds, parse_lookup_targets
+from banner_codec import BannerCodec, train_dictionary
+from query_cache import QueryCache, bump_generation
+from facets import banner_facets, host_facets, facet_value
+from rir_index import IPEnricher
+from search_query import compile_query
 from auth import get_password_hash
 import json
+import queue
 import logging
+import threading
+
+# Kolom devices untuk read path; banner_text() men-decode banner terkompresi
+DEVICE_COLUMNS = "ip, port, banner_text(banner) AS banner, timestamp"
+
+def _row_to_device(d):
+    """Convert a devices row into the API dict with decoded banner"""
+    return {
+        'ip': d['ip'],
+        'port': d['port'],
+        'banner': json.loads(d['banner']) if d['banner'] else None,
+        'timestamp': d['timestamp']
+    }
+
+def _iter_in_thread(produce, maxsize=4):
+    """Yield the items of produce() while it runs in one dedicated thread
+
+    sqlite3 connections and cursors must stay on the thread that created them,
+    but StreamingResponse pulls a sync iterator from whichever threadpool
+    worker is free. The producer (which owns the connection) therefore runs on
+    its own thread and hands batches over through a bounded queue; closing
+    this generator early (client disconnect) stops the producer.
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        batches = produce()
+        try:
+            for batch in batches:
+                if not put(('batch', batch)):
+                    return
+            put(('done', None))
+        except Exception as e:
+            put(('error', e))
+        finally:
+            batches.close()
+
+    threading.Thread(target=run, name='db-stream', daemon=True).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+def _get_meta(c, key):
+    row = c.execute('SELECT value FROM db_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(c, key, value):
+    c.execute('INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+OBSERVATION_TABLE_PREFIX = 'observations_'
+_OBSERVATION_TABLE_RE = re.compile(r'^observations_(\d{4})_(\d{2})$')
+
+def _observation_partition(when=None):
+    """Partition table name (observations_YYYY_MM) for a UTC datetime"""
+    when = when or datetime.now(timezone.utc)
+    return f"{OBSERVATION_TABLE_PREFIX}{when.year:04d}_{when.month:02d}"
+
+def _partition_month_index(table):
+    """Month number (year*12 + month-1) of a partition table, None if not a partition"""
+    match = _OBSERVATION_TABLE_RE.match(table)
+    if not match:
+        return None
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+def _list_partitions_sql():
+    return f"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '{OBSERVATION_TABLE_PREFIX}%'"
+
+def _sorted_partitions(names):
+    """Valid partition names, newest first"""
+    return sorted((n for n in names if _partition_month_index(n) is not None), reverse=True)
+
+def _observations_query(table, port=None):
+    sql = f"SELECT ip, port, banner_text(banner) AS banner, observed_at FROM {table} WHERE ip = ?"
+    if port is not None:
+        sql += " AND port = ?"
+    return sql + " ORDER BY observed_at DESC LIMIT ?"
+
+def _row_to_history(h):
+    """Convert a scan_history_daily row into the API dict"""
+    return {
+        'date': h[0],
+        'devices_found': h[1],
+        'timestamp': h[2],
+        'services_found': h[3]
+    }
+
+def _search_conditions(query=None, port=None, banner=None, cidr=None, q=None):
+    """Build WHERE conditions and params shared by sync and async search
+
+    q is a structured query (see search_query), compiled and ANDed with the
+    other filters; raises ValueError if it does not parse.
+    """
+    conditions = []
+    params = []
+
+    if q:
+        sql, q_params = compile_query(q)
+        conditions.append(f"AND ({sql})")
+        params.extend(q_params)
+
+    if query:
+        # Mencari di IP dan banner
+        conditions.append("AND (ip LIKE ? OR banner_text(banner) LIKE ?)")
+        params.extend([f"%{query}%", f"%{query}%"])
+
+    if port:
+        conditions.append("AND port = ?")
+        params.append(port)
+
+    if banner:
+        conditions.append("AND banner_text(banner) LIKE ?")
+        params.append(f"%{banner}%")
+
+    if cidr:
+        # Range scan di index ip_int, ValueError kalau CIDR tidak valid
+        first, last = cidr_bounds(cidr)
+        conditions.append("AND ip_int BETWEEN ? AND ?")
+        params.extend([first, last])
+
+    return conditions, params
+
+def _normalize_filters(query=None, port=None, banner=None, cidr=None, q=None):
+    """Drop empty filters and build a cache key part; validates cidr and q (ValueError)
+
+    Semantically equal filters share a key: CIDRs by their bounds and structured
+    queries by their compiled SQL.
+    """
+    query = (query or '').strip() or None
+    banner = (banner or '').strip() or None
+    cidr = (cidr or '').strip() or None
+    q = (q or '').strip() or None
+    port = port or None
+    compiled = compile_query(q) if q else None
+    key = (query, port, banner, cidr_bounds(cidr) if cidr else None,
+           (compiled[0], tuple(compiled[1])) if compiled else None)
+    return (query, port, banner, cidr, q), key
+
+def _facet_query(field, limit, query=None, port=None, banner=None, cidr=None, q=None):
+    """SQL for top-N values of one facet; unscoped reads the counters, scoped joins the filtered devices"""
+    conditions, params = _search_conditions(query, port, banner, cidr, q)
+    if not conditions:
+        sql = '''
+            SELECT value, count FROM facet_counts
+            WHERE facet = ? AND count > 0
+            ORDER BY count DESC, value
+            LIMIT ?
+        '''
+        return sql, [field, limit]
+
+    where = " ".join(["WHERE 1=1"] + conditions)
+    sql = f'''
+        WITH scoped AS (SELECT ip, port FROM devices {where})
+        SELECT f.value, count(DISTINCT f.ip) AS count
+        FROM scoped s CROSS JOIN device_facets f
+            ON f.ip = s.ip AND f.port = s.port AND f.facet = ?
+        GROUP BY f.value
+        ORDER BY count DESC, f.value
+        LIMIT ?
+    '''
+    return sql, params + [field, limit]
 
 class Database:
-    def __init__(self, db_name='eternals_search.db'):
+    def __init__(self, db_name='eternals_search.db', observation_retention_months=6, banner_compression=None,
+                 enricher=None):
         self.db_name = db_name
+        # Lookup country/ASN dari interval index saat hasil scan ditulis
+        self.enricher = enricher or IPEnricher()
+        # Partisi observasi lebih tua dari ini di-rollup lalu di-drop oleh compact_observations
+        self.observation_retention_months = observation_retention_months
+        self._observation_partitions = set()
+        # None (teks biasa), 'zlib' atau 'zstd'
+        self.codec = BannerCodec(banner_compression, store=self)
+
+    def connect(self):
+        """Open a sqlite3 connection with the banner_text() decode function registered"""
+        conn = sqlite3.connect(self.db_name)
+        conn.create_function('banner_text', 1, self.codec.decode, deterministic=True)
+        return conn
 
     def init_db(self):
-        with sqlite3.connect(self.db_name) as conn:
+        with self.connect() as conn:
             c = conn.cursor()
+
+            # WAL supaya reader async tidak terblokir oleh writer scanner
+            c.execute('PRAGMA journal_mode=WAL')
+
+            # Status migrasi/backfill (key -> value), supaya backfill bisa dilanjutkan dan tidak diulang
+            c.execute('CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT)')
             
             # Create devices table if not exists
             c.execute('''
@@ -19,9 +227,125 @@ class Database:
                     port INTEGER,
                     banner JSON,  -- Ubah ke JSON type untuk menyimpan semua info
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    ip_int INTEGER,
                     PRIMARY KEY (ip, port)
                 )
             ''')
+
+            # Migrasi: tambah kolom ip_int untuk database lama lalu backfill
+            columns = [row[1] for row in c.execute('PRAGMA table_info(devices)')]
+            if 'ip_int' not in columns:
+                c.execute('ALTER TABLE devices ADD COLUMN ip_int INTEGER')
+            # Migrasi: kolom enrichment country/ASN
+            if 'country' not in columns:
+                c.execute('ALTER TABLE devices ADD COLUMN country TEXT')
+            if 'asn' not in columns:
+                c.execute('ALTER TABLE devices ADD COLUMN asn INTEGER')
+            conn.create_function('ip_to_int', 1, ip_to_int, deterministic=True)
+            c.execute('UPDATE devices SET ip_int = ip_to_int(ip) WHERE ip_int IS NULL')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_devices_ip_int ON devices (ip_int, port)')
+            # Index untuk filter port:/after:/before: dan urutan timestamp di search
+            c.execute('CREATE INDEX IF NOT EXISTS idx_devices_port ON devices (port)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_devices_timestamp ON devices (timestamp)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_devices_country ON devices (country, port)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_devices_asn ON devices (asn)')
+
+            # Rollup harian, diupdate saat hasil scan ditulis
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS scan_history_daily (
+                    scan_date TEXT PRIMARY KEY,
+                    devices_found INTEGER NOT NULL DEFAULT 0,
+                    services_found INTEGER NOT NULL DEFAULT 0,
+                    first_seen DATETIME
+                )
+            ''')
+            # Host/port yang sudah dihitung hari ini, supaya rescan tidak dihitung dua kali
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS scan_history_seen (
+                    scan_date TEXT,
+                    ip TEXT,
+                    port INTEGER,
+                    PRIMARY KEY (scan_date, ip, port)
+                ) WITHOUT ROWID
+            ''')
+            c.execute("DELETE FROM scan_history_seen WHERE scan_date < date('now')")
+
+            # Ringkasan per bulan dari partisi observasi yang sudah di-compact
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS observations_rollup (
+                    month TEXT,
+                    ip TEXT,
+                    port INTEGER,
+                    first_seen DATETIME,
+                    last_seen DATETIME,
+                    observations INTEGER,
+                    PRIMARY KEY (month, ip, port)
+                ) WITHOUT ROWID
+            ''')
+
+            # Facet per service (port/tag/vuln/cpe/server) dan jumlah host per nilai,
+            # diupdate incremental saat hasil scan ditulis
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS device_facets (
+                    ip TEXT,
+                    port INTEGER,
+                    facet TEXT,
+                    value TEXT,
+                    PRIMARY KEY (ip, port, facet, value)
+                ) WITHOUT ROWID
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_device_facets_value ON device_facets (facet, value, ip)')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS facet_counts (
+                    facet TEXT,
+                    value TEXT,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (facet, value)
+                ) WITHOUT ROWID
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_facet_counts_top ON facet_counts (facet, count DESC)')
+            if _get_meta(c, 'facets_backfilled') is None:
+                if (c.execute('SELECT 1 FROM device_facets LIMIT 1').fetchone()
+                        and _get_meta(c, 'facet_backfill_rowid') is None):
+                    # Sudah dibangun versi sebelumnya dalam satu transaksi
+                    _set_meta(c, 'facets_backfilled', '1')
+                else:
+                    self._backfill_facets(conn)
+            # Backfill hanya sekali per versi data index; device yang memang tidak punya
+            # country/ASN (range privat/tidak dikenal) tidak discan ulang setiap start
+            if self.enricher:
+                fingerprint = self.enricher.fingerprint()
+                if _get_meta(c, 'enrichment_fingerprint') != fingerprint:
+                    self._backfill_enrichment(c)
+                    _set_meta(c, 'enrichment_fingerprint', fingerprint)
+
+            # Dictionary kompresi banner hasil training
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS banner_dicts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    codec TEXT,
+                    data BLOB,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Seed rollup dari data lama kalau tabel masih kosong
+            if not c.execute('SELECT 1 FROM scan_history_daily LIMIT 1').fetchone():
+                c.execute('''
+                    INSERT INTO scan_history_daily (scan_date, devices_found, services_found, first_seen)
+                    SELECT date(timestamp), count(distinct ip), count(*), min(timestamp)
+                    FROM devices
+                    WHERE timestamp IS NOT NULL
+                    GROUP BY date(timestamp)
+                ''')
+                # Host/port yang sudah masuk rollup hari ini ditandai seen, supaya
+                # scan pertama setelah migrasi tidak menghitungnya lagi
+                c.execute('''
+                    INSERT OR IGNORE INTO scan_history_seen (scan_date, ip, port)
+                    SELECT date(timestamp), ip, port
+                    FROM devices
+                    WHERE date(timestamp) = date('now')
+                ''')
             
             # Create users table
             c.execute('''
@@ -36,87 +360,378 @@ class Database:
             ''')
             
             conn.commit()
+            bump_generation(self.db_name)
 
     def save_device(self, ip, port, banner):
+        with self.connect() as conn:
+            c = conn.cursor()
+            ip_int = ip_to_int(ip)
+            country, asn = self.enricher.lookup_int(ip_int)
+            # Timestamp UTC seperti datetime('now') di rollup harian dan filter after:/before:
+            c.execute("INSERT INTO devices (ip, port, banner, timestamp, ip_int, country, asn) VALUES (?,?,?,datetime('now'),?,?,?)", 
+                     (ip, port, self.codec.encode(banner), ip_int, country, asn))
+            self.record_scan_history(c, ip, [port])
+            self.record_observations(c, ip, [(port, banner)])
+            self.record_facets(c, ip, [(port, banner)], host_facets(country, asn))
+            conn.commit()
+            bump_generation(self.db_name)
+
+    def save_scan_result(self, ip, services):
+        """Upsert current state for one host and append its history in one transaction
+
+        services: list of (port, banner_json)
+        """
+        if not services:
+            return
+        with self.connect() as conn:
+            c = conn.cursor()
+            ip_int = ip_to_int(ip)
+            # Enrichment satu kali per host: bisect di array interval yang sudah di memori
+            country, asn = self.enricher.lookup_int(ip_int)
+            for port, banner in services:
+                c.execute('''
+                    INSERT INTO devices (ip, port, banner, timestamp, ip_int, country, asn)
+                    VALUES (?, ?, ?, datetime('now'), ?, ?, ?)
+                    ON CONFLICT(ip, port) DO UPDATE SET
+                        banner = excluded.banner,
+                        timestamp = datetime('now'),
+                        country = excluded.country,
+                        asn = excluded.asn
+                ''', (ip, port, self.codec.encode(banner), ip_int, country, asn))
+
+            self.record_scan_history(c, ip, [port for port, _ in services])
+            self.record_observations(c, ip, services)
+            self.record_facets(c, ip, services, host_facets(country, asn))
+            conn.commit()
+            bump_generation(self.db_name)
+
+    def _ensure_observation_partition(self, c, table):
+        if table in self._observation_partitions:
+            return
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                ip TEXT,
+                port INTEGER,
+                banner JSON,
+                observed_at DATETIME
+            )
+        ''')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_ip ON {table} (ip, port, observed_at)')
+        self._observation_partitions.add(table)
+
+    def record_observations(self, c, ip, services):
+        """Append one observation per (port, banner) to this month's partition"""
+        now = datetime.now(timezone.utc)
+        table = _observation_partition(now)
+        self._ensure_observation_partition(c, table)
+        observed_at = now.strftime('%Y-%m-%d %H:%M:%S')
+        c.executemany(
+            f'INSERT INTO {table} (ip, port, banner, observed_at) VALUES (?, ?, ?, ?)',
+            [(ip, port, self.codec.encode(banner), observed_at) for port, banner in services]
+        )
+
+    def record_facets(self, c, ip, services, extra=frozenset()):
+        """Replace the facets of each (port, banner) and adjust per-host facet counts
+
+        extra holds host-level facets (country/ASN) added to every service.
+        """
+        for port, banner in services:
+            old = set(c.execute('SELECT facet, value FROM device_facets WHERE ip = ? AND port = ?', (ip, port)))
+            new = banner_facets(port, banner) | extra
+
+            for facet, value in old - new:
+                c.execute('DELETE FROM device_facets WHERE ip = ? AND port = ? AND facet = ? AND value = ?',
+                          (ip, port, facet, value))
+                # Host masih dihitung selama ada port lain dengan nilai yang sama
+                if not c.execute('SELECT 1 FROM device_facets WHERE facet = ? AND value = ? AND ip = ? LIMIT 1',
+                                 (facet, value, ip)).fetchone():
+                    c.execute('UPDATE facet_counts SET count = count - 1 WHERE facet = ? AND value = ?',
+                              (facet, value))
+                    c.execute('DELETE FROM facet_counts WHERE facet = ? AND value = ? AND count <= 0',
+                              (facet, value))
+
+            for facet, value in new - old:
+                new_host = not c.execute('SELECT 1 FROM device_facets WHERE facet = ? AND value = ? AND ip = ? LIMIT 1',
+                                         (facet, value, ip)).fetchone()
+                c.execute('INSERT INTO device_facets (ip, port, facet, value) VALUES (?, ?, ?, ?)',
+                          (ip, port, facet, value))
+                if new_host:
+                    c.execute('''
+                        INSERT INTO facet_counts (facet, value, count) VALUES (?, ?, 1)
+                        ON CONFLICT(facet, value) DO UPDATE SET count = count + 1
+                    ''', (facet, value))
+
+    def _backfill_facets(self, conn, batch_size=5000):
+        """Build facet tables from existing devices (first start after upgrade)
+
+        Walks devices by rowid in batches and commits each one, so memory and
+        the write lock stay bounded; progress is kept in db_meta and an
+        interrupted backfill resumes where it stopped.
+        """
+        c = conn.cursor()
+        last_rowid = int(_get_meta(c, 'facet_backfill_rowid') or 0)
+        backfilled = 0
+        while True:
+            rows = c.execute('''
+                SELECT rowid, ip, port, banner_text(banner), country, asn FROM devices
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            c.executemany(
+                'INSERT OR IGNORE INTO device_facets (ip, port, facet, value) VALUES (?, ?, ?, ?)',
+                ((ip, port, facet, value) for _, ip, port, banner, country, asn in rows
+                 for facet, value in banner_facets(port, banner) | host_facets(country, asn))
+            )
+            last_rowid = rows[-1][0]
+            _set_meta(c, 'facet_backfill_rowid', last_rowid)
+            conn.commit()
+            backfilled += len(rows)
+
+        c.execute('DELETE FROM facet_counts')
+        c.execute('''
+            INSERT INTO facet_counts (facet, value, count)
+            SELECT facet, value, count(DISTINCT ip) FROM device_facets GROUP BY facet, value
+        ''')
+        _set_meta(c, 'facets_backfilled', '1')
+        c.execute("DELETE FROM db_meta WHERE key = 'facet_backfill_rowid'")
+        if backfilled:
+            logging.info(f"Backfilled facets for {backfilled} services")
+
+    def _backfill_enrichment(self, c, batch_size=10000):
+        """Fill country/ASN for devices written before enrichment data was available"""
+        enriched = 0
+        last_rowid = 0
+        while True:
+            rows = c.execute('''
+                SELECT rowid, ip, port, ip_int FROM devices
+                WHERE rowid > ? AND country IS NULL AND asn IS NULL AND ip_int IS NOT NULL
+                ORDER BY rowid
+                LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = []
+            for rowid, ip, port, ip_int in rows:
+                country, asn = self.enricher.lookup_int(ip_int)
+                if country or asn:
+                    updates.append((rowid, ip, port, country, asn))
+            c.executemany('UPDATE devices SET country = ?, asn = ? WHERE rowid = ?',
+                          [(country, asn, rowid) for rowid, _, _, country, asn in updates])
+            c.executemany(
+                'INSERT OR IGNORE INTO device_facets (ip, port, facet, value) VALUES (?, ?, ?, ?)',
+                ((ip, port, facet, value) for _, ip, port, country, asn in updates
+                 for facet, value in host_facets(country, asn))
+            )
+            enriched += len(updates)
+
+        if enriched:
+            c.execute("DELETE FROM facet_counts WHERE facet IN ('country', 'asn')")
+            c.execute('''
+                INSERT INTO facet_counts (facet, value, count)
+                SELECT facet, value, count(DISTINCT ip) FROM device_facets
+                WHERE facet IN ('country', 'asn')
+                GROUP BY facet, value
+            ''')
+            logging.info(f"Enriched {enriched} existing devices with country/ASN")
+
+    def get_observations(self, ip, port=None, limit=100):
+        """Observation history of one host across partitions, newest first"""
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            tables = _sorted_partitions(row[0] for row in c.execute(_list_partitions_sql()))
+
+            observations = []
+            for table in tables:
+                remaining = limit - len(observations)
+                if remaining <= 0:
+                    break
+                params = [ip] + ([port] if port is not None else []) + [remaining]
+                observations.extend(dict(row) for row in c.execute(_observations_query(table, port), params))
+            return observations
+
+    def compact_observations(self, retention_months=None, rollup=True):
+        """Roll up and drop observation partitions older than the retention window"""
+        if retention_months is None:
+            retention_months = self.observation_retention_months
+        now = datetime.now(timezone.utc)
+        cutoff = now.year * 12 + now.month - 1 - retention_months
+
+        dropped = []
+        with self.connect() as conn:
+            c = conn.cursor()
+            tables = _sorted_partitions(row[0] for row in c.execute(_list_partitions_sql()))
+            for table in tables:
+                if _partition_month_index(table) >= cutoff:
+                    continue
+                if rollup:
+                    month = table[len(OBSERVATION_TABLE_PREFIX):].replace('_', '-')
+                    c.execute(f'''
+                        INSERT INTO observations_rollup (month, ip, port, first_seen, last_seen, observations)
+                        SELECT ?, ip, port, min(observed_at), max(observed_at), count(*)
+                        FROM {table}
+                        GROUP BY ip, port
+                        ON CONFLICT(month, ip, port) DO UPDATE SET
+                            first_seen = min(first_seen, excluded.first_seen),
+                            last_seen = max(last_seen, excluded.last_seen),
+                            observations = observations + excluded.observations
+                    ''', (month,))
+                c.execute(f'DROP TABLE {table}')
+                self._observation_partitions.discard(table)
+                dropped.append(table)
+            conn.commit()
+            bump_generation(self.db_name)
+
+        if dropped:
+            logging.info(f"Compacted observation partitions: {', '.join(dropped)}")
+        return dropped
+
+    def load_banner_dictionary(self, dict_id):
+        """Return (codec, data) of a stored banner dictionary"""
+        with sqlite3.connect(self.db_name) as conn:
+            return conn.execute('SELECT codec, data FROM banner_dicts WHERE id = ?', (dict_id,)).fetchone()
+
+    def latest_banner_dictionary(self, codec):
+        """Return (id, data) of the newest dictionary for a codec"""
         with sqlite3.connect(self.db_name) as conn:
+            return conn.execute('''
+                SELECT id, data FROM banner_dicts
+                WHERE codec = ?
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (codec,)).fetchone()
+
+    def train_banner_dictionary(self, sample_size=2000, dict_size=16384):
+        """Train a dictionary from stored banners and make it active for new writes"""
+        if not self.codec.mode:
+            raise ValueError("Banner compression is disabled")
+        with self.connect() as conn:
             c = conn.cursor()
-            c.execute("INSERT INTO devices VALUES (?,?,?,?)", 
-                     (ip, port, banner, datetime.now().isoformat()))
+            samples = [row[0] for row in c.execute('''
+                SELECT banner_text(banner) FROM devices
+                WHERE banner IS NOT NULL
+                ORDER BY random()
+                LIMIT ?
+            ''', (sample_size,))]
+            data = train_dictionary(samples, self.codec.mode, dict_size)
+            if not data:
+                raise ValueError("Not enough banners to train a dictionary")
+            c.execute('INSERT INTO banner_dicts (codec, data) VALUES (?, ?)', (self.codec.mode, data))
+            dict_id = c.lastrowid
             conn.commit()
+            bump_generation(self.db_name)
+        self.codec.add_dictionary(dict_id, self.codec.mode, data, active=True)
+        logging.info(f"Trained {self.codec.mode} banner dictionary #{dict_id} ({len(data)} bytes, {len(samples)} samples)")
+        return dict_id
+
+    def recompress_banners(self, batch_size=1000):
+        """Re-encode all stored device banners with the current codec and dictionary"""
+        updated = 0
+        last_rowid = 0
+        with self.connect() as conn:
+            c = conn.cursor()
+            while True:
+                rows = c.execute('''
+                    SELECT rowid, banner_text(banner) FROM devices
+                    WHERE rowid > ? AND banner IS NOT NULL
+                    ORDER BY rowid
+                    LIMIT ?
+                ''', (last_rowid, batch_size)).fetchall()
+                if not rows:
+                    break
+                c.executemany('UPDATE devices SET banner = ? WHERE rowid = ?',
+                              [(self.codec.encode(text), rowid) for rowid, text in rows])
+                conn.commit()
+                bump_generation(self.db_name)
+                updated += len(rows)
+                last_rowid = rows[-1][0]
+        return updated
+
+    def record_scan_history(self, c, ip, ports):
+        """Update today's rollup for one host, using the caller's cursor/transaction"""
+        # Tulisan pertama di hari baru: buang data seen hari sebelumnya
+        if not c.execute("SELECT 1 FROM scan_history_daily WHERE scan_date = date('now')").fetchone():
+            c.execute("DELETE FROM scan_history_seen WHERE scan_date < date('now')")
+
+        new_host = not c.execute('''
+            SELECT 1 FROM scan_history_seen
+            WHERE scan_date = date('now') AND ip = ?
+            LIMIT 1
+        ''', (ip,)).fetchone()
+
+        new_services = 0
+        for port in ports:
+            c.execute('''
+                INSERT OR IGNORE INTO scan_history_seen (scan_date, ip, port)
+                VALUES (date('now'), ?, ?)
+            ''', (ip, port))
+            new_services += c.rowcount
+
+        if not new_services:
+            return
+
+        c.execute('''
+            INSERT INTO scan_history_daily (scan_date, devices_found, services_found, first_seen)
+            VALUES (date('now'), ?, ?, datetime('now'))
+            ON CONFLICT(scan_date) DO UPDATE SET
+                devices_found = devices_found + excluded.devices_found,
+                services_found = services_found + excluded.services_found
+        ''', (1 if new_host else 0, new_services))
 
     def get_all_devices(self):
         """Get all devices with JSON banner"""
-        with sqlite3.connect(self.db_name) as conn:
+        with self.connect() as conn:
             conn.row_factory = sqlite3.Row
             c = conn.cursor()
-            devices = c.execute('SELECT * FROM devices').fetchall()
-            return [{
-                'ip': d['ip'],
-                'port': d['port'],
-                'banner': json.loads(d['banner']) if d['banner'] else None,
-                'timestamp': d['timestamp']
-            } for d in devices]
+            devices = c.execute(f'SELECT {DEVICE_COLUMNS} FROM devices').fetchall()
+            return [_row_to_device(d) for d in devices]
 
     def get_total_devices(self):
         """Get total number of devices in database"""
-        with sqlite3.connect(self.db_name) as conn:
+        with self.connect() as conn:
             c = conn.cursor()
             return c.execute('SELECT COUNT(DISTINCT ip) FROM devices').fetchone()[0]
 
     def get_latest_devices(self, limit=100):
         """Get latest devices with pagination"""
-        with sqlite3.connect(self.db_name) as conn:
+        with self.connect() as conn:
             conn.row_factory = sqlite3.Row
             c = conn.cursor()
-            devices = c.execute('''
-                SELECT * FROM devices 
+            devices = c.execute(f'''
+                SELECT {DEVICE_COLUMNS} FROM devices 
                 ORDER BY timestamp DESC 
                 LIMIT ?
             ''', (limit,)).fetchall()
-            return [{
-                'ip': d['ip'],
-                'port': d['port'],
-                'banner': json.loads(d['banner']) if d['banner'] else None,
-                'timestamp': d['timestamp']
-            } for d in devices]
+            return [_row_to_device(d) for d in devices]
 
     def get_devices_by_ip(self, ip):
         """Get devices filtered by IP"""
-        with sqlite3.connect(self.db_name) as conn:
+        with self.connect() as conn:
             conn.row_factory = sqlite3.Row
             c = conn.cursor()
-            devices = c.execute('SELECT * FROM devices WHERE ip = ?', (ip,)).fetchall()
-            return [{
-                'ip': d['ip'],
-                'port': d['port'],
-                'banner': json.loads(d['banner']) if d['banner'] else None,
-                'timestamp': d['timestamp']
-            } for d in devices]
+            devices = c.execute(f'SELECT {DEVICE_COLUMNS} FROM devices WHERE ip = ?', (ip,)).fetchall()
+            return [_row_to_device(d) for d in devices]
 
     def get_scan_history(self):
-        """Get scan history with aggregated device counts"""
-        with sqlite3.connect(self.db_name) as conn:
+        """Get scan history from the daily rollup table"""
+        with self.connect() as conn:
             c = conn.cursor()
             history = c.execute('''
-                SELECT 
-                    date(timestamp) as scan_date,
-                    count(distinct ip) as devices_found,
-                    min(timestamp) as timestamp
-                FROM devices 
-                GROUP BY date(timestamp)
+                SELECT scan_date, devices_found, first_seen, services_found
+                FROM scan_history_daily
                 ORDER BY scan_date DESC
                 LIMIT 30
             ''').fetchall()
             
-            return [{
-                'date': h[0],
-                'devices_found': h[1],
-                'timestamp': h[2]
-            } for h in history]
+            return [_row_to_history(h) for h in history]
 
     def create_default_user(self):
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            with self.connect() as conn:
                 c = conn.cursor()
                 
                 # Check if default user exists
@@ -131,39 +746,88 @@ class Database:
                     VALUES (?, ?, ?)
                 ''', ('admin', 'Administrator', password_hash))
                 conn.commit()
+                bump_generation(self.db_name)
                 print("Default user created successfully!")
         except Exception as e:
             print(f"Error creating default user: {str(e)}")
 
-    def search_devices(self, query=None, port=None, banner=None, page=1, per_page=100):
+    def iter_devices(self, query=None, port=None, banner=None, cidr=None, batch_size=1000, q=None):
+        """Return an iterator of (ip, port, banner, timestamp) batches for all matching devices
+
+        Rows come straight off one cursor in storage order (no sort), so memory
+        stays constant and the first batch is available immediately. Filters are
+        validated eagerly (ValueError), before any row is read.
+        """
+        conditions, params = _search_conditions(query, port, banner, cidr, q)
+        sql = " ".join([f"SELECT {DEVICE_COLUMNS} FROM devices WHERE 1=1"] + conditions)
+        return _iter_in_thread(lambda: self._iter_batches(sql, params, batch_size))
+
+    def iter_devices_bulk(self, targets, port=None, batch_size=1000):
+        """Return an iterator of device batches matching a list of IPs and/or CIDRs
+
+        Targets are parsed eagerly (ValueError). Lookups are set-based: IPs and
+        merged CIDR ranges go into temp tables that are joined against the
+        (ip_int, port) index, so each address is resolved by one index probe or
+        range scan instead of one query per IP.
+        """
+        ips, ranges = parse_lookup_targets(targets)
+        return _iter_in_thread(lambda: self._iter_bulk_batches(ips, ranges, port, batch_size))
+
+    def _iter_bulk_batches(self, ips, ranges, port, batch_size):
+        if not ips and not ranges:
+            return
+        conn = self.connect()
+        try:
+            conn.execute('CREATE TEMP TABLE lookup_ips (ip_value INTEGER PRIMARY KEY)')
+            conn.execute('CREATE TEMP TABLE lookup_ranges (first_value INTEGER, last_value INTEGER)')
+            conn.executemany('INSERT INTO lookup_ips VALUES (?)', ((value,) for value in ips))
+            conn.executemany('INSERT INTO lookup_ranges VALUES (?, ?)', ranges)
+
+            port_filter = "AND d.port = ?" if port else ""
+            # CROSS JOIN memaksa lookup table di loop luar, devices di-probe lewat index ip_int
+            sql = f'''
+                SELECT {DEVICE_COLUMNS} FROM lookup_ips l
+                CROSS JOIN devices d ON d.ip_int = l.ip_value {port_filter}
+                UNION ALL
+                SELECT {DEVICE_COLUMNS} FROM lookup_ranges r
+                CROSS JOIN devices d ON d.ip_int BETWEEN r.first_value AND r.last_value {port_filter}
+            '''
+            cursor = conn.execute(sql, [port, port] if port else [])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def _iter_batches(self, sql, params, batch_size):
+        conn = self.connect()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def search_devices(self, query=None, port=None, banner=None, page=1, per_page=100, cidr=None):
         """Search devices with pagination"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            with self.connect() as conn:
                 conn.row_factory = sqlite3.Row
                 c = conn.cursor()
                 
                 # Build query
-                query_parts = ["SELECT * FROM devices WHERE 1=1"]
+                query_parts = [f"SELECT {DEVICE_COLUMNS} FROM devices WHERE 1=1"]
                 count_parts = ["SELECT COUNT(*) FROM devices WHERE 1=1"]
                 params = []
                 
-                if query:
-                    condition = "AND (ip LIKE ? OR banner LIKE ?)"
-                    query_parts.append(condition)
-                    count_parts.append(condition)
-                    params.extend([f"%{query}%", f"%{query}%"])
-                
-                if port:
-                    condition = "AND port = ?"
-                    query_parts.append(condition)
-                    count_parts.append(condition)
-                    params.append(port)
-                    
-                if banner:
-                    condition = "AND banner LIKE ?"
-                    query_parts.append(condition)
-                    count_parts.append(condition)
-                    params.append(f"%{banner}%")
+                conditions, params = _search_conditions(query, port, banner, cidr)
+                query_parts.extend(conditions)
+                count_parts.extend(conditions)
                 
                 # Get total count
                 total = c.execute(" ".join(count_parts), params).fetchone()[0]
@@ -176,12 +840,7 @@ class Database:
                 devices = c.execute(" ".join(query_parts), params).fetchall()
                 
                 return {
-                    'items': [{
-                        'ip': d['ip'],
-                        'port': d['port'],
-                        'banner': json.loads(d['banner']) if d['banner'] else None,
-                        'timestamp': d['timestamp']
-                    } for d in devices],
+                    'items': [_row_to_device(d) for d in devices],
                     'pagination': {
                         'total': total,
                         'page': page,
@@ -192,4 +851,310 @@ class Database:
                 
         except Exception as e:
             logging.error(f"Error searching devices: {str(e)}")
-            return {'items': [], 'pagination': {'total': 0, 'page': 1, 'per_page': per_page, 'pages': 0}} 
\ No newline at end of file
+            return {'items': [], 'pagination': {'total': 0, 'page': 1, 'per_page': per_page, 'pages': 0}}
+
+class AsyncDatabase:
+    """Async repository untuk handler FastAPI dengan pool reader aiosqlite terbatas"""
+
+    def __init__(self, db_name='eternals_search.db', pool_size=4, codec=None, cache_size=256):
+        self.db_name = db_name
+        self.pool_size = pool_size
+        # Hasil query device/search/history di-cache sampai ada commit berikutnya
+        self.cache = QueryCache(db_name, cache_size)
+        # Share codec dengan Database supaya dictionary yang sama dipakai untuk decode
+        self.codec = codec or BannerCodec()
+        self._readers = None
+        self._all_readers = []
+        self._writer = None
+        self._write_lock = None
+        self._connect_lock = None
+
+    async def connect(self):
+        """Open reader pool and the single writer connection"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._readers is not None:
+                return
+
+            readers = asyncio.Queue(maxsize=self.pool_size)
+            for _ in range(self.pool_size):
+                conn = await aiosqlite.connect(self.db_name)
+                conn.row_factory = aiosqlite.Row
+                await conn.execute('PRAGMA query_only = ON')
+                await conn.create_function('banner_text', 1, self.codec.decode, deterministic=True)
+                self._all_readers.append(conn)
+                readers.put_nowait(conn)
+
+            self._writer = await aiosqlite.connect(self.db_name)
+            self._writer.row_factory = aiosqlite.Row
+            await self._writer.create_function('banner_text', 1, self.codec.decode, deterministic=True)
+            self._write_lock = asyncio.Lock()
+            self._readers = readers
+
+    async def close(self):
+        """Close all pooled connections"""
+        for conn in self._all_readers:
+            await conn.close()
+        if self._writer is not None:
+            await self._writer.close()
+        self._all_readers = []
+        self._readers = None
+        self._writer = None
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrow a read-only connection, waiting if the pool is exhausted"""
+        if self._readers is None:
+            await self.connect()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Serialize writes through one connection and commit on success"""
+        if self._readers is None:
+            await self.connect()
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+                bump_generation(self.db_name)
+            except Exception:
+                await self._writer.rollback()
+                raise
+
+    async def fetchone(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def cached(self, key, load):
+        """Return the cached result for key, or await load() and cache it at the current write generation"""
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        generation = self.cache.generation()
+        value = await load()
+        self.cache.set(key, value, generation)
+        return value
+
+    # Users
+
+    async def get_user_by_id(self, user_id):
+        return await self.fetchone('SELECT * FROM users WHERE id = ?', (user_id,))
+
+    async def get_user_by_username(self, username):
+        return await self.fetchone('SELECT * FROM users WHERE username = ?', (username,))
+
+    async def create_user(self, username, full_name, profile_pic, password_hash):
+        """Insert user and return the created row"""
+        async with self.writer() as conn:
+            cursor = await conn.execute('''
+                INSERT INTO users (username, full_name, profile_pic, password_hash)
+                VALUES (?, ?, ?, ?)
+            ''', (username, full_name, profile_pic, password_hash))
+            user_id = cursor.lastrowid
+            async with conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)) as c:
+                return await c.fetchone()
+
+    async def update_user(self, user_id, username, full_name, profile_pic, password_hash=None):
+        """Update user profile (and password if given) and return the updated row"""
+        async with self.writer() as conn:
+            if password_hash is None:
+                await conn.execute('''
+                    UPDATE users
+                    SET username = ?, full_name = ?, profile_pic = ?
+                    WHERE id = ?
+                ''', (username, full_name, profile_pic, user_id))
+            else:
+                await conn.execute('''
+                    UPDATE users
+                    SET username = ?, full_name = ?, profile_pic = ?, password_hash = ?
+                    WHERE id = ?
+                ''', (username, full_name, profile_pic, password_hash, user_id))
+            async with conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)) as c:
+                return await c.fetchone()
+
+    async def update_profile_pic(self, user_id, profile_pic):
+        async with self.writer() as conn:
+            await conn.execute('''
+                UPDATE users
+                SET profile_pic = ?
+                WHERE id = ?
+            ''', (profile_pic, user_id))
+
+    # Devices
+
+    async def get_latest_devices(self, limit=100):
+        """Get latest devices with decoded banner"""
+        return await self.cached(('latest', limit), lambda: self._get_latest_devices(limit))
+
+    async def _get_latest_devices(self, limit):
+        devices = await self.fetchall(f'''
+            SELECT {DEVICE_COLUMNS} FROM devices 
+            ORDER BY timestamp DESC 
+            LIMIT ?
+        ''', (limit,))
+        return [_row_to_device(d) for d in devices]
+
+    async def get_devices_by_ip(self, ip):
+        """Get devices filtered by IP with decoded banner"""
+        ip = ip.strip()
+        return await self.cached(('ip', ip), lambda: self._get_devices_by_ip(ip))
+
+    async def _get_devices_by_ip(self, ip):
+        devices = await self.fetchall(f'SELECT {DEVICE_COLUMNS} FROM devices WHERE ip = ?', (ip,))
+        return [_row_to_device(d) for d in devices]
+
+    async def get_recent_devices(self, limit=100):
+        """Get latest device rows with banner as JSON text"""
+        return await self.cached(('recent', limit), lambda: self._get_recent_devices(limit))
+
+    async def _get_recent_devices(self, limit):
+        rows = await self.fetchall(f'''
+            SELECT {DEVICE_COLUMNS}
+            FROM devices
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
+        return [dict(row) for row in rows]
+
+    async def get_history(self, page=1, per_page=100):
+        """Paginated raw device history"""
+        return await self.cached(('history', page, per_page), lambda: self._get_history(page, per_page))
+
+    async def _get_history(self, page, per_page):
+        async with self.reader() as conn:
+            async with conn.execute('SELECT COUNT(*) FROM devices') as c:
+                total_count = (await c.fetchone())[0]
+
+            offset = (page - 1) * per_page
+            async with conn.execute(f'''
+                SELECT {DEVICE_COLUMNS} 
+                FROM devices 
+                ORDER BY timestamp DESC 
+                LIMIT ? OFFSET ?
+            ''', (per_page, offset)) as c:
+                rows = await c.fetchall()
+
+        return {
+            "items": [dict(row) for row in rows],
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "total_items": total_count,
+                "total_pages": (total_count + per_page - 1) // per_page
+            }
+        }
+
+    async def search_devices(self, query=None, port=None, banner=None, page=1, per_page=100, cidr=None,
+                             q=None, explain=False):
+        """Search raw device rows with pagination
+
+        q is a structured query ('port:22 tag:cloud NOT vuln:CVE-...'); with
+        explain=True the response also carries the SQL and SQLite query plan.
+        """
+        # Normalisasi parameter supaya query yang sama secara makna berbagi satu entry cache
+        filters, key = _normalize_filters(query, port, banner, cidr, q)
+        return await self.cached(('search', key, page, per_page, explain),
+                                 lambda: self._search_devices(*filters, page, per_page, explain))
+
+    async def _search_devices(self, query, port, banner, cidr, q, page, per_page, explain):
+        conditions, params = _search_conditions(query, port, banner, cidr, q)
+        where = " ".join(["WHERE 1=1"] + conditions)
+        sql = f"SELECT {DEVICE_COLUMNS} FROM devices {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?"
+        offset = (page - 1) * per_page
+
+        async with self.reader() as conn:
+            async with conn.execute(f"SELECT COUNT(*) FROM devices {where}", params) as c:
+                total_count = (await c.fetchone())[0]
+
+            async with conn.execute(sql, params + [per_page, offset]) as c:
+                rows = await c.fetchall()
+
+            if explain:
+                async with conn.execute(f"EXPLAIN QUERY PLAN {sql}", params + [per_page, offset]) as c:
+                    steps = [{"id": row[0], "parent": row[1], "detail": row[3]} for row in await c.fetchall()]
+
+        result = {
+            "items": [dict(row) for row in rows],
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "total_items": total_count,
+                "total_pages": (total_count + per_page - 1) // per_page
+            }
+        }
+        if explain:
+            result["plan"] = {"sql": sql, "params": params + [per_page, offset], "steps": steps}
+        return result
+
+    async def get_observations(self, ip, port=None, limit=100):
+        """Observation history of one host across partitions, plus compacted monthly rollups"""
+        async with self.reader() as conn:
+            async with conn.execute(_list_partitions_sql()) as c:
+                tables = _sorted_partitions(row[0] for row in await c.fetchall())
+
+            observations = []
+            for table in tables:
+                remaining = limit - len(observations)
+                if remaining <= 0:
+                    break
+                params = [ip] + ([port] if port is not None else []) + [remaining]
+                async with conn.execute(_observations_query(table, port), params) as c:
+                    observations.extend(dict(row) for row in await c.fetchall())
+
+            rollup_sql = 'SELECT month, ip, port, first_seen, last_seen, observations FROM observations_rollup WHERE ip = ?'
+            rollup_params = [ip]
+            if port is not None:
+                rollup_sql += ' AND port = ?'
+                rollup_params.append(port)
+            try:
+                async with conn.execute(rollup_sql + ' ORDER BY month DESC', rollup_params) as c:
+                    compacted = [dict(row) for row in await c.fetchall()]
+            except sqlite3.OperationalError:
+                # Database belum di-init_db, belum ada tabel rollup
+                compacted = []
+
+        return {
+            "ip": ip,
+            "observations": observations,
+            "compacted": compacted
+        }
+
+    async def get_facets(self, fields, limit=10, query=None, port=None, banner=None, cidr=None, q=None):
+        """Top-N counts (distinct hosts) per facet field, optionally scoped by search filters"""
+        filters, key = _normalize_filters(query, port, banner, cidr, q)
+        return await self.cached(('facets', tuple(fields), limit, key),
+                                 lambda: self._get_facets(fields, limit, *filters))
+
+    async def _get_facets(self, fields, limit, query, port, banner, cidr, q):
+        facets = {}
+        async with self.reader() as conn:
+            for field in fields:
+                sql, params = _facet_query(field, limit, query, port, banner, cidr, q)
+                async with conn.execute(sql, params) as c:
+                    facets[field] = [
+                        {"value": facet_value(field, row[0]), "count": row[1]}
+                        for row in await c.fetchall()
+                    ]
+        return facets
+
+    async def get_scan_history(self):
+        """Get scan history from the daily rollup table"""
+        history = await self.fetchall('''
+            SELECT scan_date, devices_found, first_seen, services_found
+            FROM scan_history_daily
+            ORDER BY scan_date DESC
+            LIMIT 30
+        ''')
+        return [_row_to_history(h) for h in history]
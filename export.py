@@ -0,0 +1,122 @@
+import csv
+import json
+import zlib
+from io import StringIO
+from typing import Iterable, Iterator, List, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # pyarrow opsional, hanya untuk format parquet
+    pyarrow = None
+    parquet = None
+
+EXPORT_COLUMNS = ['ip', 'port', 'banner', 'timestamp']
+
+# format -> (media type, ekstensi file)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+def export_csv(batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """Stream device rows as CSV, one chunk per batch"""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['IP', 'Port', 'Banner', 'Timestamp'])
+    yield output.getvalue().encode('utf-8')
+
+    for batch in batches:
+        output.seek(0)
+        output.truncate()
+        writer.writerows(batch)
+        yield output.getvalue().encode('utf-8')
+
+def export_ndjson(batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """Stream device rows as newline-delimited JSON"""
+    for batch in batches:
+        lines = []
+        for ip, port, banner, timestamp in batch:
+            # Banner sudah JSON text, langsung disisipkan tanpa parse ulang
+            lines.append(
+                f'{{"ip": {json.dumps(ip)}, "port": {json.dumps(port)}, '
+                f'"banner": {banner or "null"}, "timestamp": {json.dumps(timestamp)}}}\n'
+            )
+        yield ''.join(lines).encode('utf-8')
+
+class _ChunkSink:
+    """Minimal file-like object that collects what ParquetWriter writes"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_parquet(batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """Stream device rows as Parquet, one row group per batch"""
+    if pyarrow is None:
+        raise ValueError("Parquet export requires the pyarrow package")
+
+    schema = pyarrow.schema([
+        ('ip', pyarrow.string()),
+        ('port', pyarrow.int32()),
+        ('banner', pyarrow.string()),
+        ('timestamp', pyarrow.string()),
+    ])
+    sink = _ChunkSink()
+    writer = parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in batches:
+            columns = list(zip(*batch)) if batch else [[], [], [], []]
+            table = pyarrow.Table.from_arrays([pyarrow.array(col) for col in columns], schema=schema)
+            writer.write_table(table)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+EXPORTERS = {
+    'csv': export_csv,
+    'ndjson': export_ndjson,
+    'parquet': export_parquet,
+}
+
+def get_exporter(fmt: str):
+    """Return the exporter for a format, raises ValueError if unsupported"""
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if fmt == 'parquet' and pyarrow is None:
+        raise ValueError("Parquet export requires the pyarrow package")
+    return EXPORTERS[fmt]
@@ -0,0 +1,61 @@
+import json
+
+# Field facet yang didukung /api/facets, urutan ini juga default response
+FACET_FIELDS = ('port', 'tag', 'vuln', 'cpe', 'server', 'country', 'asn')
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
+def banner_facets(port, banner) -> set:
+    """Extract (facet, value) pairs for one service from its banner JSON text"""
+    values = {('port', str(port))}
+    try:
+        data = json.loads(banner) if banner else {}
+    except (TypeError, ValueError):
+        return values
+    if not isinstance(data, dict):
+        return values
+
+    for tag in _as_list(data.get('tags')):
+        values.add(('tag', str(tag)))
+    for vuln in _as_list(data.get('vulns')):
+        values.add(('vuln', str(vuln).upper()))
+    for cpe in _as_list(data.get('cpes')):
+        values.add(('cpe', str(cpe)))
+
+    # InternetDB tidak mengirim header HTTP; diisi kalau sumber banner punya field server
+    http = data.get('http') if isinstance(data.get('http'), dict) else {}
+    server = data.get('server') or http.get('server')
+    if isinstance(server, str) and server.strip():
+        values.add(('server', server.strip()))
+    return values
+
+def host_facets(country=None, asn=None) -> set:
+    """(facet, value) pairs from the host's enrichment columns"""
+    values = set()
+    if country:
+        values.add(('country', country))
+    if asn:
+        values.add(('asn', str(asn)))
+    return values
+
+def parse_facet_fields(fields) -> list:
+    """Parse a comma separated field list, raises ValueError for unknown fields"""
+    if not fields:
+        return list(FACET_FIELDS)
+    parsed = []
+    for field in fields.split(','):
+        field = field.strip().lower()
+        if not field:
+            continue
+        if field not in FACET_FIELDS:
+            raise ValueError(f"Unsupported facet: {field} (use {', '.join(FACET_FIELDS)})")
+        if field not in parsed:
+            parsed.append(field)
+    return parsed
+
+def facet_value(field, value):
+    """Convert a stored facet value back to its API type"""
+    return int(value) if field in ('port', 'asn') else value
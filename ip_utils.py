@@ -1,140 +1,389 @@
 import requests
-import json
-from typing import List, Dict
+import httpx
+import asyncio
+from typing import List, Dict, Optional
 import time
 import os
-from datetime import datetime, timedelta
+from datetime import timedelta
+from functools import partial
 import pycountry
+from tiered_cache import TieredCache
 import logging
+import ipaddress
+import bisect
+import socket
+import struct
+
+def ip_to_int(ip: str):
+    """Convert an IPv4 address string to its integer value, None if invalid"""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if addr.version != 4:
+        return None
+    return int(addr)
+
+def cidr_bounds(cidr: str) -> tuple:
+    """Return (first, last) integer addresses of an IPv4 CIDR, raises ValueError if invalid"""
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    if network.version != 4:
+        raise ValueError(f"Only IPv4 CIDR is supported: {cidr}")
+    return int(network.network_address), int(network.broadcast_address)
+
+def int_to_ip(value: int) -> str:
+    return socket.inet_ntoa(struct.pack('>I', value))
+
+def interval_to_cidrs(first: int, last: int) -> List[str]:
+    """Split an inclusive integer IPv4 interval into the minimal list of CIDRs"""
+    cidrs = []
+    while first <= last:
+        # Blok terbesar yang align di first dan tidak melewati last
+        align = (first & -first).bit_length() - 1 if first else 32
+        fit = (last - first + 1).bit_length() - 1
+        bits = min(align, fit)
+        cidrs.append(f"{int_to_ip(first)}/{32 - bits}")
+        first += 1 << bits
+    return cidrs
+
+def merge_ranges(ranges) -> List[tuple]:
+    """Merge overlapping or adjacent (first, last) integer ranges into a sorted list"""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+def subtract_ranges(ranges: List[tuple], excludes: List[tuple]) -> List[tuple]:
+    """Remove merged exclude intervals from merged ranges (both sorted, inclusive)"""
+    result = []
+    j = 0
+    for first, last in ranges:
+        while j < len(excludes) and excludes[j][1] < first:
+            j += 1
+        k = j
+        while k < len(excludes) and excludes[k][0] <= last:
+            ex_first, ex_last = excludes[k]
+            if ex_first > first:
+                result.append((first, ex_first - 1))
+            first = max(first, ex_last + 1)
+            if first > last:
+                break
+            k += 1
+        if first <= last:
+            result.append((first, last))
+    return result
+
+def parse_range_entry(entry: str) -> tuple:
+    """(first, last, normalized) for a CIDR, single IP or 'first-last' range, raises ValueError if invalid
+
+    normalized is the corrected CIDR when entry has host bits set, otherwise None.
+    """
+    if '/' in entry:
+        network = ipaddress.ip_network(entry, strict=False)
+        if network.version != 4:
+            raise ValueError(entry)
+        # mis. 10.0.0.5/8 -> 10.0.0.0/8
+        normalized = str(network) if str(network) != entry else None
+        return int(network.network_address), int(network.broadcast_address), normalized
+    if '-' in entry:
+        start, end = (ip_to_int(part.strip()) for part in entry.split('-', 1))
+        if start is None or end is None or start > end:
+            raise ValueError(entry)
+        return start, end, None
+    value = ip_to_int(entry)
+    if value is None:
+        raise ValueError(entry)
+    return value, value, None
+
+class RangeSet:
+    """Normalized set of IPv4 addresses as sorted, disjoint, inclusive integer intervals
+
+    Built from CIDRs, single IPs or 'first-last' ranges. Overlaps and duplicates
+    collapse, so size is the true number of unique addresses.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = merge_ranges(intervals)
+        # Entri input yang tidak valid, dan CIDR dengan host bits yang dinormalisasi
+        self.invalid = []
+        self.adjusted = []
+
+    @classmethod
+    def parse(cls, entries) -> 'RangeSet':
+        intervals = []
+        invalid = []
+        adjusted = []
+        for entry in entries or []:
+            entry = str(entry).strip()
+            if not entry:
+                continue
+            try:
+                first, last, normalized = parse_range_entry(entry)
+            except ValueError:
+                invalid.append(entry)
+                continue
+            if normalized:
+                adjusted.append({'input': entry, 'normalized': normalized})
+            intervals.append((first, last))
+
+        range_set = cls(intervals)
+        range_set.invalid = invalid
+        range_set.adjusted = adjusted
+        return range_set
+
+    def subtract(self, other: 'RangeSet') -> 'RangeSet':
+        result = RangeSet()
+        result.intervals = subtract_ranges(self.intervals, other.intervals)
+        result.invalid = list(self.invalid)
+        result.adjusted = list(self.adjusted)
+        return result
+
+    @property
+    def size(self) -> int:
+        return sum(last - first + 1 for first, last in self.intervals)
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def to_cidrs(self) -> List[str]:
+        cidrs = []
+        for first, last in self.intervals:
+            cidrs.extend(interval_to_cidrs(first, last))
+        return cidrs
+
+    def iter_ips(self):
+        """Yield every address once, in ascending order"""
+        for first, last in self.intervals:
+            for value in range(first, last + 1):
+                yield int_to_ip(value)
+
+def parse_lookup_targets(targets) -> tuple:
+    """Split IPs and CIDRs into (sorted ip ints, merged ranges) with no overlap
+
+    IPs already covered by a CIDR are dropped so every address is matched once.
+    Raises ValueError on the first invalid entry.
+    """
+    ips = set()
+    ranges = []
+    for target in targets:
+        target = str(target).strip()
+        if not target:
+            continue
+        if '/' in target:
+            first, last = cidr_bounds(target)
+            if first == last:
+                ips.add(first)
+            else:
+                ranges.append((first, last))
+        else:
+            value = ip_to_int(target)
+            if value is None:
+                raise ValueError(f"Invalid IPv4 address: {target}")
+            ips.add(value)
+
+    ranges = merge_ranges(ranges)
+    starts = [first for first, _ in ranges]
+    uncovered = []
+    for value in sorted(ips):
+        i = bisect.bisect_right(starts, value) - 1
+        if i < 0 or value > ranges[i][1]:
+            uncovered.append(value)
+    return uncovered, ranges
 
 class RIPEManager:
     def __init__(self):
         self.base_url = "https://stat.ripe.net/data"
         self.cache_dir = "cache"
         self.cache_duration = timedelta(hours=24)  # Cache valid for 24 hours
+        # Maksimum request RIPE yang berjalan bersamaan saat resolve banyak negara
+        self.max_concurrent_requests = 4
+        self.request_timeout = 30
+        # File RIR delegated-*-extended lokal; kalau ada, negara -> range tanpa network
+        self.rir_dir = "rir"
+        self.rir_index_path = os.path.join(self.cache_dir, "rir_country.idx")
+        self.asn_index_path = os.path.join(self.cache_dir, "rir_asn.idx")
+        self._country_index = None
+        self._country_index_loaded = False
         
-        # Create cache directory if not exists
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-    
-    def _get_cache_path(self, key: str) -> str:
-        return os.path.join(self.cache_dir, f"{key}.json")
-    
-    def _is_cache_valid(self, cache_path: str) -> bool:
-        if not os.path.exists(cache_path):
-            return False
-            
-        file_time = datetime.fromtimestamp(os.path.getmtime(cache_path))
-        return datetime.now() - file_time < self.cache_duration
+        # LRU di memori di depan folder cache/ (juga membuat folder kalau belum ada);
+        # entry kadaluarsa masih dipakai sambil di-refresh di background
+        self.cache = TieredCache(self.cache_dir, self.cache_duration)
     
     def _read_cache(self, key: str) -> Dict:
-        cache_path = self._get_cache_path(key)
-        if self._is_cache_valid(cache_path):
-            with open(cache_path, 'r') as f:
-                return json.load(f)
-        return None
+        return self.cache.get(key)
     
     def _write_cache(self, key: str, data: Dict):
-        cache_path = self._get_cache_path(key)
-        with open(cache_path, 'w') as f:
-            json.dump(data, f)
+        self.cache.set(key, data)
+
+    @staticmethod
+    def _build_country_list() -> List[Dict]:
+        countries = []
+        # Get all countries from pycountry
+        for country in pycountry.countries:
+            countries.append({
+                'code': country.alpha_2,
+                'name': country.name
+            })
+        return sorted(countries, key=lambda x: x['name'])
 
     def get_country_list(self) -> List[Dict]:
         """Get list of all countries with their codes"""
-        cache_data = self._read_cache('countries')
-        if cache_data:
-            return cache_data
-            
         try:
-            countries = []
-            # Get all countries from pycountry
-            for country in pycountry.countries:
-                countries.append({
-                    'code': country.alpha_2,
-                    'name': country.name
-                })
-            
-            countries = sorted(countries, key=lambda x: x['name'])
-            self._write_cache('countries', countries)
-            return countries
-            
+            return self.cache.get_or_load('countries', self._build_country_list)
         except Exception as e:
             print(f"Error fetching country list: {str(e)}")
             return []
     
-    def get_country_ip_ranges(self, country_codes: List[str]) -> List[str]:
-        """Get all IPv4 ranges for multiple countries"""
-        all_ranges = []
-        
+    def country_index(self):
+        """Offline country interval index built from rir/delegated-* files, None if there are none"""
+        if not self._country_index_loaded:
+            from rir_index import load_country_index
+            try:
+                self._country_index = load_country_index(self.rir_dir, self.rir_index_path)
+            except Exception as e:
+                logging.error(f"Error loading RIR delegated stats: {str(e)}")
+            self._country_index_loaded = True
+        return self._country_index
+
+    def reload_country_index(self):
+        """Pick up new delegated files on the next lookup"""
+        self._country_index_loaded = False
+
+    def enricher(self):
+        """IPEnricher for the write path: country from the RIR index, ASN from rir/ip2asn-v4*.tsv"""
+        from rir_index import IPEnricher, load_asn_index
+        try:
+            asn_index = load_asn_index(self.rir_dir, self.asn_index_path)
+        except Exception as e:
+            logging.error(f"Error loading ASN ranges: {str(e)}")
+            asn_index = None
+        return IPEnricher(self.country_index(), asn_index)
+
+    def country_for_ip(self, ip: str) -> Optional[str]:
+        """Country code of an IP from the offline index (binary search), None if unknown"""
+        index = self.country_index()
+        return index.lookup(ip) if index is not None else None
+
+    def _offline_country_ranges(self, code: str) -> Optional[List[str]]:
+        index = self.country_index()
+        if index is None or code not in index.labels:
+            return None
+        return index.cidrs(code)
+
+    def _country_ranges_url(self, code: str) -> str:
+        return f"{self.base_url}/country-resource-list/data.json?resource={code}"
+
+    @staticmethod
+    def _extract_ipv4_ranges(data: Dict) -> List[str]:
+        if data and 'data' in data and 'resources' in data['data']:
+            return data['data']['resources'].get('ipv4', [])
+        return []
+
+    @staticmethod
+    def _normalize_codes(country_codes) -> List[str]:
         # Convert single string to list if needed
         if isinstance(country_codes, str):
             country_codes = [country_codes]
+        return list(dict.fromkeys(code.strip().upper() for code in country_codes if code and code.strip()))
+
+    def get_country_ip_ranges(self, country_codes: List[str]) -> List[str]:
+        """Get all IPv4 ranges for multiple countries (blocking, for scripts)"""
+        all_ranges = []
         
-        for code in country_codes:
-            try:
-                url = f"https://stat.ripe.net/data/country-resource-list/data.json?resource={code}"
-                response = requests.get(url)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Extract IPv4 ranges from response
-                if data and 'data' in data and 'resources' in data['data']:
-                    ipv4_ranges = data['data']['resources'].get('ipv4', [])
-                    all_ranges.extend(ipv4_ranges)
-                    
-                logging.debug(f"Found {len(ipv4_ranges)} IP ranges for {code}")
-                    
-            except Exception as e:
-                logging.error(f"Error fetching IP ranges for {code}: {str(e)}")
-                continue
+        for code in self._normalize_codes(country_codes):
+            ipv4_ranges = self._offline_country_ranges(code)
+            if ipv4_ranges is None:
+                try:
+                    ipv4_ranges = self.cache.get_or_load(f"ranges_{code}", partial(self._download_country_ranges, code))
+                except Exception as e:
+                    logging.error(f"Error fetching IP ranges for {code}: {str(e)}")
+                    continue
+
+            all_ranges.extend(ipv4_ranges)
+            logging.debug(f"Found {len(ipv4_ranges)} IP ranges for {code}")
         
         # Remove duplicates and empty strings
         return [r for r in list(set(all_ranges)) if r]
+
+    def _download_country_ranges(self, code: str) -> List[str]:
+        response = requests.get(self._country_ranges_url(code), timeout=self.request_timeout)
+        response.raise_for_status()
+        return self._extract_ipv4_ranges(response.json())
+
+    async def _adownload_country_ranges(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, code: str) -> List[str]:
+        async with semaphore:
+            response = await client.get(self._country_ranges_url(code))
+        response.raise_for_status()
+        ipv4_ranges = self._extract_ipv4_ranges(response.json())
+        logging.debug(f"Found {len(ipv4_ranges)} IP ranges for {code}")
+        return ipv4_ranges
+
+    async def _fetch_country_ranges(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, code: str) -> List[str]:
+        """Ranges for one country from the RIR index, cache or RIPE, [] on error"""
+        offline = self._offline_country_ranges(code)
+        if offline is not None:
+            return offline
+
+        async def download():
+            # Refresh di background bisa berjalan setelah client request ini ditutup
+            if not client.is_closed:
+                return await self._adownload_country_ranges(client, semaphore, code)
+            async with httpx.AsyncClient(timeout=self.request_timeout) as own_client:
+                return await self._adownload_country_ranges(own_client, semaphore, code)
+
+        try:
+            # Single-flight: request bersamaan untuk negara yang sama menunggu satu download
+            return await self.cache.aget_or_load(f"ranges_{code}", download)
+        except Exception as e:
+            logging.error(f"Error fetching IP ranges for {code}: {str(e)}")
+            return []
+
+    async def fetch_country_ip_ranges(self, country_codes: List[str]) -> List[str]:
+        """Async get_country_ip_ranges: cached codes are served from memory, the rest fetched concurrently"""
+        codes = self._normalize_codes(country_codes)
+        if not codes:
+            return []
+        if not self._country_index_loaded:
+            # Build pertama dari file delegated bisa beberapa detik, jangan di event loop
+            await asyncio.to_thread(self.country_index)
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        async with httpx.AsyncClient(timeout=self.request_timeout) as client:
+            results = await asyncio.gather(*(self._fetch_country_ranges(client, semaphore, code) for code in codes))
+
+        all_ranges = set()
+        for ipv4_ranges in results:
+            all_ranges.update(ipv4_ranges)
+        # Remove duplicates and empty strings
+        return [r for r in all_ranges if r]
     
+    def normalize_ranges(self, ranges: List[str], exclude_ranges: List[str] = None) -> RangeSet:
+        """Merge target ranges and subtract excludes exactly; see RangeSet.invalid/adjusted for input problems"""
+        from range_summary import normalize_range_set
+        return normalize_range_set(ranges, exclude_ranges)
+
     def validate_ip_ranges(self, ranges: List[str], exclude_ranges: List[str] = None) -> List[str]:
-        """Validate custom IP ranges and remove excluded ranges"""
-        valid_ranges = []
-        exclude_ranges = set(exclude_ranges or [])
-        
-        for ip_range in ranges:
-            ip_range = ip_range.strip()
-            if not ip_range:
-                continue
-                
-            # Skip if in exclude list
-            if ip_range in exclude_ranges:
-                continue
-                
-            # Basic CIDR validation
-            try:
-                if '/' in ip_range:
-                    ip, prefix = ip_range.split('/')
-                    if 0 <= int(prefix) <= 32:
-                        valid_ranges.append(ip_range)
-            except:
-                continue
-                
-        return valid_ranges
+        """Validate custom IP ranges and remove excluded ranges
+
+        Returns the minimal list of CIDRs covering the targets minus the excludes,
+        so overlapping entries are merged and excludes may be any sub-range.
+        """
+        return self.normalize_ranges(ranges, exclude_ranges).to_cidrs()
     
-    def preview_ranges(self, ranges: List[str]) -> Dict:
-        """Generate preview statistics for IP ranges"""
-        total_ips = 0
-        range_count = len(ranges)
-        
-        for ip_range in ranges:
-            try:
-                if '/' in ip_range:
-                    _, prefix = ip_range.split('/')
-                    total_ips += 2 ** (32 - int(prefix))
-            except:
-                continue
-                
-        return {
-            'range_count': range_count,
-            'total_ips': total_ips,
-            'estimated_time': self._estimate_scan_time(total_ips)
-        }
+    def preview_ranges(self, ranges: List[str], exclude_ranges: List[str] = None) -> Dict:
+        """Generate preview statistics for IP ranges (unique addresses only)
+
+        Besides the totals, returns prefix_histogram (input CIDRs per prefix
+        length) and per_slash8 (unique addresses per /8 after excludes).
+        """
+        from range_summary import summarize_ranges
+        summary = summarize_ranges(ranges, exclude_ranges)
+        summary['estimated_time'] = self._estimate_scan_time(summary['total_ips'])
+        return summary
     
     def _estimate_scan_time(self, total_ips: int) -> str:
         """Estimate scan time based on number of IPs"""
@@ -155,10 +404,19 @@ class RIPEManager:
         except:
             return code
 
+    def _make_request(self, url: str) -> Optional[Dict]:
+        """GET a RIPEstat JSON endpoint, None on any error"""
+        try:
+            response = requests.get(url, timeout=self.request_timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Error requesting {url}: {str(e)}")
+            return None
+
     def get_country_resources(self, country_code: str) -> dict:
         """Get IP resources for a country"""
-        url = f"{self.base_url}/country/{country_code}"
-        response = self._make_request(url)
+        response = self._make_request(self._country_ranges_url(country_code.upper()))
         
         if not response or 'data' not in response:
             return {'asn': [], 'ipv4': [], 'ipv6': []}
@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Write generation per file database, dibagi semua koneksi di proses ini
+# (Database milik scanner dan AsyncDatabase milik app menulis ke file yang sama)
+_generations = {}
+_generations_lock = threading.Lock()
+
+def _db_key(db_name):
+    return os.path.abspath(db_name)
+
+def current_generation(db_name) -> int:
+    return _generations.get(_db_key(db_name), 0)
+
+def bump_generation(db_name) -> int:
+    """Mark that new data was committed to db_name; call after every commit"""
+    key = _db_key(db_name)
+    with _generations_lock:
+        _generations[key] = _generations.get(key, 0) + 1
+        return _generations[key]
+
+class QueryCache:
+    """Bounded LRU cache of query results stamped with the database write generation
+
+    An entry is only returned while the generation it was computed at is still
+    current, so any commit invalidates every cached result at once.
+    """
+
+    def __init__(self, db_name, max_size=256):
+        self.db_name = db_name
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        return current_generation(self.db_name)
+
+    def get(self, key):
+        """Return (found, value) for key if it was cached at the current generation"""
+        generation = self.generation()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != generation:
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key, value, generation):
+        """Store value computed while generation was current"""
+        if generation != self.generation():
+            # Ada commit selama query berjalan, hasilnya mungkin sudah basi
+            return
+        with self._lock:
+            self._items[key] = (generation, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._items)
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "generation": self.generation(),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,248 @@
+from typing import Dict, List
+
+from ip_utils import RangeSet, interval_to_cidrs
+
+try:
+    import numpy as np
+except ImportError:  # numpy opsional, tanpa numpy dipakai jalur Python murni
+    np = None
+
+def _parse_simple_cidrs(entries: List[str]):
+    """Vectorized parse of a.b.c.d/nn entries
+
+    Returns (indexes, ip ints, prefixes) for the entries that are well-formed
+    CIDRs, plus the indexes of every other entry for the slow path. The joined
+    text is scanned once as bytes; no per-entry Python work.
+    """
+    n_lines = len(entries)
+    # Padding supaya s+1, s+2 dan end+1 selalu valid sebagai index
+    buf = np.frombuffer('\n'.join(entries).encode('ascii', 'replace') + b'\n\n\n', dtype=np.uint8)
+
+    is_digit = (buf >= ord('0')) & (buf <= ord('9'))
+    start_mask = is_digit.copy()
+    start_mask[1:] &= ~is_digit[:-1]
+    end_mask = is_digit.copy()
+    end_mask[:-1] &= ~is_digit[1:]
+    token_starts = np.flatnonzero(start_mask)
+    token_ends = np.flatnonzero(end_mask)  # inclusive
+    is_space = (buf == ord(' ')) | (buf == ord('\t')) | (buf == ord('\r')) | (buf == ord('\n'))
+    other_positions = np.flatnonzero(~is_digit & ~is_space)
+
+    # Batas baris -> jumlah token dan karakter lain per baris lewat searchsorted
+    line_bounds = np.concatenate(([0], np.flatnonzero(buf == ord('\n'))[:n_lines - 1] + 1, [len(buf)]))
+    token_bounds = np.searchsorted(token_starts, line_bounds)
+    other_bounds = np.searchsorted(other_positions, line_bounds)
+    # Karakter non-digit non-spasi per baris harus tepat ". . . /"
+    lines = np.flatnonzero((np.diff(token_bounds) == 5) & (np.diff(other_bounds) == 4))
+
+    # Layout (5, n): satu baris per token (a, b, c, d, prefix), tiap baris contiguous
+    token_index = token_bounds[lines] + np.arange(5)[:, None]
+    starts = token_starts[token_index]
+    ends = token_ends[token_index]
+    lengths = ends - starts + 1
+    digits = [buf[starts + k].astype(np.int16) - ord('0') for k in range(3)]
+    values = np.where(lengths == 1, digits[0],
+                      np.where(lengths == 2, digits[0] * 10 + digits[1],
+                               digits[0] * 100 + digits[1] * 10 + digits[2]))
+
+    separators = np.array([ord('.'), ord('.'), ord('.'), ord('/')], dtype=np.uint8)[:, None]
+    valid = np.logical_and.reduce(np.concatenate((
+        buf[ends[:4] + 1] == separators,
+        starts[1:] == ends[:4] + 2,
+        lengths[:4] <= 3,
+        values[:4] <= 255,
+        # Nol di depan ('01') ditolak ipaddress, biar parser biasa yang memutuskan
+        (digits[0] != 0) | (lengths == 1),
+        [lengths[4] <= 2, values[4] <= 32],
+    )))
+    lines = lines[valid]
+    values = values[:, valid].astype(np.int64)
+
+    ip_ints = (values[0] << 24) | (values[1] << 16) | (values[2] << 8) | values[3]
+    prefixes = values[4]
+    simple = np.zeros(n_lines, dtype=bool)
+    simple[lines] = True
+    return lines, ip_ints, prefixes, np.flatnonzero(~simple)
+
+def _merge_np(firsts, lasts):
+    """Merge overlapping/adjacent intervals: sorted disjoint (firsts, lasts) arrays"""
+    if len(firsts) == 0:
+        return firsts, lasts
+    order = np.argsort(firsts, kind='stable')
+    firsts = firsts[order]
+    lasts = np.maximum.accumulate(lasts[order])
+    new_group = np.empty(len(firsts), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = firsts[1:] > lasts[:-1] + 1
+    group_starts = np.flatnonzero(new_group)
+    group_ends = np.concatenate((group_starts[1:] - 1, [len(firsts) - 1]))
+    return firsts[group_starts], lasts[group_ends]
+
+def _subtract_np(firsts, lasts, ex_firsts, ex_lasts):
+    """Exact interval difference via a sweep over all boundaries"""
+    if len(ex_firsts) == 0 or len(firsts) == 0:
+        return firsts, lasts
+    points = np.concatenate((firsts, lasts + 1, ex_firsts, ex_lasts + 1))
+    target_delta = np.concatenate((np.ones(len(firsts)), -np.ones(len(lasts)), np.zeros(len(ex_firsts) * 2)))
+    exclude_delta = np.concatenate((np.zeros(len(firsts) * 2), np.ones(len(ex_firsts)), -np.ones(len(ex_lasts))))
+    unique_points, inverse = np.unique(points, return_inverse=True)
+    target_cover = np.cumsum(np.bincount(inverse, weights=target_delta))
+    exclude_cover = np.cumsum(np.bincount(inverse, weights=exclude_delta))
+    keep = (target_cover[:-1] > 0) & (exclude_cover[:-1] == 0)
+    segment_firsts = unique_points[:-1][keep]
+    segment_lasts = unique_points[1:][keep] - 1
+    return _merge_np(segment_firsts, segment_lasts)
+
+def _count_cidrs_np(firsts, lasts) -> int:
+    """Number of CIDRs in the minimal cover of every interval (greedy, all intervals at once)"""
+    firsts = firsts.copy()
+    total = 0
+    active = firsts <= lasts
+    while active.any():
+        current = firsts[active]
+        remaining = lasts[active] - current + 1
+        lowest_bit = current & -current
+        lowest_bit[current == 0] = 1 << 32
+        fit = np.left_shift(1, np.floor(np.log2(remaining)).astype(np.int64))
+        fit = np.where(fit > remaining, fit >> 1, fit)
+        firsts[active] = current + np.minimum(lowest_bit, fit)
+        total += int(active.sum())
+        active = firsts <= lasts
+    return total
+
+def _per_slash8_np(firsts, lasts) -> Dict[int, int]:
+    """Unique addresses per /8, from cumulative coverage at each /8 boundary"""
+    boundaries = np.arange(257, dtype=np.int64) << 24
+    sizes = lasts - firsts + 1
+    covered_before = np.concatenate(([0], np.cumsum(sizes)))
+    # Interval pertama yang belum selesai sebelum boundary
+    i = np.searchsorted(lasts, boundaries, side='left')
+    coverage = covered_before[i]
+    inside = i < len(firsts)
+    partial = np.zeros(len(boundaries), dtype=np.int64)
+    partial[inside] = np.maximum(boundaries[inside] - firsts[i[inside]], 0)
+    coverage = coverage + partial
+    counts = np.diff(coverage)
+    return {int(octet): int(counts[octet]) for octet in np.flatnonzero(counts)}
+
+def _add_entry_prefixes(histogram, entries):
+    """Count the CIDR prefixes of each entry separately (single IP = /32, a-b split into CIDRs)"""
+    for entry in entries:
+        for first, last in RangeSet.parse([entry]).intervals:
+            for cidr in interval_to_cidrs(first, last):
+                histogram[int(cidr.rsplit('/', 1)[1])] += 1
+
+def _format_adjusted(entries, lines, firsts, prefixes, which) -> List[Dict]:
+    """Adjusted-entry records for the given simple CIDRs, the normalized text built with numpy string ops"""
+    if len(which) == 0:
+        return []
+    networks = firsts[which]
+    parts = [networks >> 24, (networks >> 16) & 255, (networks >> 8) & 255, networks & 255, prefixes[which]]
+    # Teks desimal 0..255 rata kiri, (256, 3) byte + panjangnya
+    digits = np.array([f"{value:<3}".encode('ascii') for value in range(256)], dtype='S3').view(np.uint8).reshape(256, 3)
+    lengths = np.array([len(str(value)) for value in range(256)])
+
+    # Semua "a.b.c.d/nn\n" ditulis ke satu buffer byte, lalu di-decode dan di-split sekali
+    widths = sum(lengths[part] + 1 for part in parts)
+    positions = np.concatenate(([0], np.cumsum(widths)[:-1]))
+    buf = np.empty(int(widths.sum()), dtype=np.uint8)
+    for part, separator in zip(parts, b'.../\n'):
+        part_lengths = lengths[part]
+        for k in range(3):
+            has_digit = part_lengths > k
+            buf[positions[has_digit] + k] = digits[part[has_digit], k]
+        buf[positions + part_lengths] = separator
+        positions = positions + part_lengths + 1
+    normalized = buf.tobytes().decode('ascii').split('\n')
+
+    return [{'input': entries[line].strip(), 'normalized': network}
+            for line, network in zip(lines[which].tolist(), normalized)]
+
+def _parse_fast(entries: List[str]):
+    """(firsts, lasts, prefix histogram, invalid, adjusted) using numpy plus RangeSet for odd entries"""
+    entries = [str(entry) for entry in entries or []]
+    if not entries:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(33, dtype=np.int64), [], []
+
+    lines, ip_ints, prefixes, others = _parse_simple_cidrs(entries)
+    masks = (0xFFFFFFFF << (32 - prefixes)) & 0xFFFFFFFF
+    firsts = ip_ints & masks
+    lasts = firsts | (~masks & 0xFFFFFFFF)
+    histogram = np.bincount(prefixes, minlength=33)
+
+    # Host bits terisi, mis. 10.0.0.5/8 -> 10.0.0.0/8
+    adjusted = _format_adjusted(entries, lines, firsts, prefixes, np.flatnonzero(firsts != ip_ints))
+
+    # Entri lain (IP tunggal, a-b, format aneh/invalid) lewat parser biasa
+    rest = [entries[i] for i in others]
+    rest_set = RangeSet.parse(rest)
+    if rest_set.intervals:
+        firsts = np.concatenate((firsts, np.array([first for first, _ in rest_set.intervals], dtype=np.int64)))
+        lasts = np.concatenate((lasts, np.array([last for _, last in rest_set.intervals], dtype=np.int64)))
+        _add_entry_prefixes(histogram, rest)
+    return firsts, lasts, histogram, rest_set.invalid, adjusted + rest_set.adjusted
+
+def normalize_range_set(ranges: List[str], exclude_ranges: List[str] = None) -> RangeSet:
+    """RangeSet of targets minus excludes, parsed with the vectorized path when numpy is available"""
+    if np is None:
+        targets = RangeSet.parse(ranges)
+        excludes = RangeSet.parse(exclude_ranges)
+        result = targets.subtract(excludes)
+        result.invalid.extend(excludes.invalid)
+        result.adjusted.extend(excludes.adjusted)
+        return result
+
+    firsts, lasts, _, invalid, adjusted = _parse_fast(ranges)
+    ex_firsts, ex_lasts, _, ex_invalid, ex_adjusted = _parse_fast(exclude_ranges)
+    firsts, lasts = _subtract_np(*_merge_np(firsts, lasts), *_merge_np(ex_firsts, ex_lasts))
+    result = RangeSet()
+    result.intervals = list(zip(firsts.tolist(), lasts.tolist()))
+    result.invalid = invalid + ex_invalid
+    result.adjusted = adjusted + ex_adjusted
+    return result
+
+def summarize_ranges(ranges: List[str], exclude_ranges: List[str] = None) -> Dict:
+    """Unique address count, CIDR count, prefix-length histogram and per-/8 breakdown of targets minus excludes"""
+    if np is None:
+        return _summarize_python(ranges, exclude_ranges)
+
+    firsts, lasts, histogram, invalid, adjusted = _parse_fast(ranges)
+    ex_firsts, ex_lasts, _, ex_invalid, ex_adjusted = _parse_fast(exclude_ranges)
+    firsts, lasts = _subtract_np(*_merge_np(firsts, lasts), *_merge_np(ex_firsts, ex_lasts))
+
+    return {
+        'range_count': _count_cidrs_np(firsts, lasts),
+        'total_ips': int((lasts - firsts + 1).sum()),
+        'prefix_histogram': {int(prefix): int(histogram[prefix]) for prefix in np.flatnonzero(histogram)},
+        'per_slash8': _format_slash8(_per_slash8_np(firsts, lasts)),
+        'invalid_ranges': invalid + ex_invalid,
+        'adjusted_ranges': adjusted + ex_adjusted
+    }
+
+def _format_slash8(counts: Dict[int, int]) -> List[Dict]:
+    return [{'network': f"{octet}.0.0.0/8", 'addresses': count} for octet, count in sorted(counts.items())]
+
+def _summarize_python(ranges, exclude_ranges) -> Dict:
+    targets = RangeSet.parse(ranges)
+    excludes = RangeSet.parse(exclude_ranges)
+    result = targets.subtract(excludes)
+
+    histogram = [0] * 33
+    _add_entry_prefixes(histogram, ranges or [])
+
+    per_slash8 = {}
+    for first, last in result.intervals:
+        while first <= last:
+            block_end = min(last, first | 0xFFFFFF)
+            per_slash8[first >> 24] = per_slash8.get(first >> 24, 0) + block_end - first + 1
+            first = block_end + 1
+
+    return {
+        'range_count': len(result.to_cidrs()),
+        'total_ips': result.size,
+        'prefix_histogram': {prefix: count for prefix, count in enumerate(histogram) if count},
+        'per_slash8': _format_slash8(per_slash8),
+        'invalid_ranges': result.invalid + excludes.invalid,
+        'adjusted_ranges': result.adjusted + excludes.adjusted
+    }
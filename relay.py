@@ -0,0 +1,139 @@
+import os
+import sys
+import socket
+import asyncio
+import logging
+
+# splice() memindahkan data socket -> pipe -> socket di kernel, tanpa copy ke userspace
+SPLICE_AVAILABLE = sys.platform.startswith('linux') and hasattr(os, 'splice')
+_F_SETPIPE_SZ = 1031
+
+# Setelah sebanyak ini byte tanpa pernah menunggu, beri giliran ke task lain
+_YIELD_EVERY = 1 << 20
+
+class _SpliceUnsupported(Exception):
+    """splice() rejected this socket pair before any data moved"""
+
+async def _wait_fd(loop, fd, writable=False):
+    """Wait until fd is readable (or writable) using the loop's selector"""
+    future = loop.create_future()
+
+    def ready():
+        if not future.done():
+            future.set_result(None)
+
+    if writable:
+        loop.add_writer(fd, ready)
+    else:
+        loop.add_reader(fd, ready)
+    try:
+        await future
+    finally:
+        if writable:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+def _open_pipe(size):
+    read_fd, write_fd = os.pipe()
+    try:
+        import fcntl
+        fcntl.fcntl(write_fd, _F_SETPIPE_SZ, size)
+    except (ImportError, OSError):
+        pass  # Ukuran default pipe (64 KiB) tetap jalan
+    return read_fd, write_fd
+
+async def _copy_splice(loop, src, dst, chunk_size):
+    """Copy src -> dst through a pipe with splice; returns bytes copied"""
+    read_fd, write_fd = _open_pipe(chunk_size)
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    total = 0
+    since_yield = 0
+    try:
+        while True:
+            try:
+                count = os.splice(src.fileno(), write_fd, chunk_size, flags=flags)
+            except BlockingIOError:
+                since_yield = 0
+                await _wait_fd(loop, src.fileno())
+                continue
+            except OSError as e:
+                # mis. EINVAL untuk jenis socket yang tidak didukung splice
+                if total == 0 and not isinstance(e, ConnectionError):
+                    raise _SpliceUnsupported(str(e))
+                raise
+            if count == 0:
+                return total
+
+            remaining = count
+            while remaining:
+                try:
+                    remaining -= os.splice(read_fd, dst.fileno(), remaining, flags=flags)
+                except BlockingIOError:
+                    since_yield = 0
+                    await _wait_fd(loop, dst.fileno(), writable=True)
+
+            total += count
+            since_yield += count
+            if since_yield >= _YIELD_EVERY:
+                since_yield = 0
+                await asyncio.sleep(0)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+async def _copy_buffered(loop, src, dst, buffer_size):
+    """Copy src -> dst with one preallocated buffer; sock_sendall handles short writes"""
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    total = 0
+    since_yield = 0
+    while True:
+        count = await loop.sock_recv_into(src, buffer)
+        if not count:
+            return total
+        await loop.sock_sendall(dst, view[:count])
+        total += count
+        since_yield += count
+        if since_yield >= _YIELD_EVERY:
+            since_yield = 0
+            await asyncio.sleep(0)
+
+async def copy_stream(src: socket.socket, dst: socket.socket, buffer_size=262144, use_splice=True) -> int:
+    """Copy src -> dst until EOF, then half-close dst (SHUT_WR) so the peer sees EOF too"""
+    loop = asyncio.get_running_loop()
+    if use_splice and SPLICE_AVAILABLE:
+        try:
+            total = await _copy_splice(loop, src, dst, buffer_size)
+        except _SpliceUnsupported as e:
+            logging.debug(f"splice unavailable ({str(e)}), using buffered copy")
+            total = await _copy_buffered(loop, src, dst, buffer_size)
+    else:
+        total = await _copy_buffered(loop, src, dst, buffer_size)
+
+    try:
+        dst.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+    return total
+
+async def relay(a: socket.socket, b: socket.socket, buffer_size=262144, use_splice=True) -> tuple:
+    """Relay both directions between two connected non-blocking sockets
+
+    Each direction runs until its own EOF (TCP half-close is passed on);
+    an error in either direction aborts both. Returns (bytes a->b, bytes b->a).
+    The caller closes the sockets.
+    """
+    tasks = [
+        asyncio.ensure_future(copy_stream(a, b, buffer_size, use_splice)),
+        asyncio.ensure_future(copy_stream(b, a, buffer_size, use_splice)),
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        return tasks[0].result(), tasks[1].result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
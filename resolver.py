@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import errno
+import socket
+import asyncio
+import logging
+import ipaddress
+from collections import OrderedDict
+from typing import List, Optional
+
+try:
+    import aiodns
+    from aiodns.error import DNSError, ARES_ENOTFOUND, ARES_ENODATA
+except ImportError:  # tanpa aiodns: getaddrinfo di thread pool, TTL tetap
+    aiodns = None
+
+HOSTS_PATH = (os.path.join(os.environ.get('SystemRoot', r'C:\Windows'), 'System32', 'drivers', 'etc', 'hosts')
+              if sys.platform == 'win32' else '/etc/hosts')
+
+def read_hosts(path: str) -> dict:
+    """{name: [addresses]} from a hosts file"""
+    hosts = {}
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) < 2:
+                continue
+            try:
+                address = str(ipaddress.ip_address(fields[0].split('%', 1)[0]))
+            except ValueError:
+                continue
+            for name in fields[1:]:
+                addresses = hosts.setdefault(name.lower().rstrip('.'), [])
+                if address not in addresses:
+                    addresses.append(address)
+    return hosts
+
+class ResolveError(OSError):
+    """Name could not be resolved (reply_code is the SOCKS5 reply: 4 = host unreachable)"""
+    reply_code = 4
+
+class CachingResolver:
+    """Async A/AAAA resolution with a TTL-respecting cache
+
+    - positive answers are kept for the smallest record TTL, clamped to
+      [min_ttl, max_ttl]
+    - NXDOMAIN / no data is cached for negative_ttl, resolver failures
+      (timeout, SERVFAIL) for error_ttl, so a dead name is not re-queried
+      by every client
+    - concurrent lookups of the same name share one query
+    - the hosts file is checked first (c-ares queries only DNS), and names
+      DNS does not know are retried with getaddrinfo before being cached
+      as missing
+    """
+
+    def __init__(self, min_ttl=5, max_ttl=3600, negative_ttl=30, error_ttl=5, max_entries=10000,
+                 timeout=3, tries=2, ipv6=True, default_ttl=60, hosts_path=HOSTS_PATH):
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.tries = tries
+        self.ipv6 = ipv6
+        # TTL untuk jawaban getaddrinfo (fallback tanpa aiodns tidak tahu TTL record)
+        self.default_ttl = default_ttl
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._resolver = None
+        self.hosts_path = hosts_path
+        self._hosts = {}
+        self._hosts_mtime = None
+        self._hosts_checked = None
+
+    async def resolve(self, host: str) -> List[str]:
+        """Addresses of host (IPv6 first when present), raises ResolveError"""
+        try:
+            return [str(ipaddress.ip_address(host))]
+        except ValueError:
+            pass
+
+        key = host.lower().rstrip('.')
+        addresses = self._hosts_lookup(key)
+        if addresses:
+            return addresses
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires, addresses, error = entry
+            if expires > time.monotonic():
+                self._cache.move_to_end(key)
+                if addresses is None:
+                    raise ResolveError(error)
+                return addresses
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _hosts_lookup(self, host) -> Optional[List[str]]:
+        """Addresses of host in the hosts file (re-read when it changes, checked at most once a second)"""
+        now = time.monotonic()
+        if self._hosts_checked is None or now - self._hosts_checked >= 1:
+            self._hosts_checked = now
+            try:
+                mtime = os.stat(self.hosts_path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._hosts_mtime:
+                self._hosts_mtime = mtime
+                try:
+                    self._hosts = read_hosts(self.hosts_path) if mtime is not None else {}
+                except OSError as e:
+                    logging.warning(f"Could not read hosts file {self.hosts_path}: {str(e)}")
+                    self._hosts = {}
+        addresses = self._hosts.get(host)
+        if addresses and not self.ipv6:
+            addresses = [a for a in addresses if ':' not in a]
+        return addresses
+
+    def _store(self, key, ttl, addresses, error=None):
+        self._cache[key] = (time.monotonic() + ttl, addresses, error)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _lookup(self, host) -> List[str]:
+        if aiodns is None:
+            return await self._lookup_getaddrinfo(host)
+
+        if self._resolver is None:
+            self._resolver = aiodns.DNSResolver(timeout=self.timeout, tries=self.tries)
+        qtypes = ('AAAA', 'A') if self.ipv6 else ('A',)
+        results = await asyncio.gather(*(self._query(host, qtype) for qtype in qtypes), return_exceptions=True)
+
+        addresses = []
+        ttls = []
+        failure = None
+        for result in results:
+            if isinstance(result, Exception):
+                failure = result
+                continue
+            for address, ttl in result:
+                addresses.append(address)
+                ttls.append(ttl)
+
+        if addresses:
+            self._store(host, min(max(min(ttls), self.min_ttl), self.max_ttl), addresses)
+            return addresses
+        if failure is None:
+            # DNS tidak kenal nama ini; getaddrinfo masih bisa (nsswitch, search domain, mDNS).
+            # Hasilnya (termasuk negatif) di-cache oleh _lookup_getaddrinfo
+            return await self._lookup_getaddrinfo(host)
+        message = f"{host}: DNS lookup failed ({failure.args[-1] if failure.args else type(failure).__name__})"
+        self._store(host, self.error_ttl, None, message)
+        logging.debug(message)
+        raise ResolveError(message)
+
+    async def _query(self, host, qtype) -> list:
+        """[(address, ttl)] for one record type; [] for NXDOMAIN/no data, raises on resolver errors"""
+        # aiodns >= 4 punya query_dns (pycares DNSResult), versi lama hanya query()
+        query = getattr(self._resolver, 'query_dns', None) or self._resolver.query
+        try:
+            result = await query(host, qtype)
+        except DNSError as e:
+            if e.args and e.args[0] in (ARES_ENOTFOUND, ARES_ENODATA):
+                return []
+            raise
+        if hasattr(result, 'answer'):
+            return [(record.data.addr, record.ttl) for record in result.answer if hasattr(record.data, 'addr')]
+        return [(record.host, record.ttl) for record in result]
+
+    async def _lookup_getaddrinfo(self, host) -> List[str]:
+        family = socket.AF_UNSPEC if self.ipv6 else socket.AF_INET
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, family=family, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            negative = e.errno in (socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME))
+            message = f"{host}: {'name not found' if negative else 'DNS lookup failed'} ({str(e)})"
+            self._store(host, self.negative_ttl if negative else self.error_ttl, None, message)
+            raise ResolveError(message)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._store(host, self.default_ttl, addresses)
+        return addresses
+
+def interleave_families(addresses: List[str]) -> List[str]:
+    """IPv6 and IPv4 alternated, IPv6 first (RFC 8305 section 4)"""
+    v6 = [a for a in addresses if ':' in a]
+    v4 = [a for a in addresses if ':' not in a]
+    ordered = []
+    for i in range(max(len(v6), len(v4))):
+        ordered.extend(family[i] for family in (v6, v4) if i < len(family))
+    return ordered
+
+async def _connect_one(loop, address, port, timeout) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (address, port)), timeout)
+    except asyncio.TimeoutError:
+        sock.close()
+        raise OSError(errno.ETIMEDOUT, f"Connect to {address}:{port} timed out")
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+async def happy_eyeballs_connect(addresses: List[str], port: int, delay=0.25, attempt_timeout=5) -> socket.socket:
+    """Connect to the first address that answers (RFC 8305 style)
+
+    Attempts start one at a time in interleaved family order; the next one
+    starts when the previous fails or after delay seconds, and the first
+    successful socket wins. Each attempt is bounded by attempt_timeout.
+    """
+    if not addresses:
+        raise ResolveError("No addresses to connect to")
+    loop = asyncio.get_running_loop()
+    remaining = interleave_families(addresses)
+    started = []
+    winner = None
+    try:
+        while True:
+            if remaining:
+                started.append(asyncio.ensure_future(_connect_one(loop, remaining.pop(0), port, attempt_timeout)))
+            running = [task for task in started if not task.done()]
+            if running:
+                await asyncio.wait(running, timeout=delay if remaining else None,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            for task in started:
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    winner = task.result()
+                    return winner
+            if not remaining and all(task.done() for task in started):
+                errors = [task.exception() for task in started if not task.cancelled()]
+                raise errors[-1] if errors else OSError(f"Could not connect to port {port}")
+    finally:
+        # Yang kalah dibatalkan; socket yang ikut tersambung bersamaan ditutup
+        for task in started:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*started, return_exceptions=True)
+        for task in started:
+            if task.done() and not task.cancelled() and task.exception() is None and task.result() is not winner:
+                task.result().close()
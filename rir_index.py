@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import glob
+import gzip
+import struct
+import bisect
+import hashlib
+import logging
+from array import array
+from typing import Iterable, List, Optional
+
+from ip_utils import ip_to_int, interval_to_cidrs, merge_ranges
+
+# Status delegasi yang benar-benar dipakai oleh suatu negara
+DELEGATED_STATUSES = {'allocated', 'assigned'}
+
+_MAGIC = b'IVX1'
+
+class IntervalIndex:
+    """Sorted, non-overlapping IPv4 intervals with one label each
+
+    Stored as three parallel arrays (start, end, label id) so a lookup is a
+    single bisect over a C array, and the whole index stays a few MB even for
+    all RIR delegations.
+    """
+
+    def __init__(self, starts=None, ends=None, label_ids=None, labels=None):
+        self.starts = starts if starts is not None else array('I')
+        self.ends = ends if ends is not None else array('I')
+        self.label_ids = label_ids if label_ids is not None else array('I')
+        self.labels = labels or []
+        self._label_to_id = {label: i for i, label in enumerate(self.labels)}
+        self._cidr_cache = {}
+        self._by_label = None
+
+    @classmethod
+    def build(cls, intervals: Iterable[tuple]) -> 'IntervalIndex':
+        """Build from (first, last, label) tuples; adjacent intervals with the same label are merged"""
+        index = cls()
+        for first, last, label in sorted(intervals):
+            if index.starts and first <= index.ends[-1]:
+                # Overlap antar sumber: interval yang lebih dulu menang
+                if last <= index.ends[-1]:
+                    continue
+                first = index.ends[-1] + 1
+            label_id = index._label_id(label)
+            if index.starts and first == index.ends[-1] + 1 and index.label_ids[-1] == label_id:
+                index.ends[-1] = last
+                continue
+            index.starts.append(first)
+            index.ends.append(last)
+            index.label_ids.append(label_id)
+        return index
+
+    def _label_id(self, label) -> int:
+        label_id = self._label_to_id.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self._label_to_id[label] = label_id
+        return label_id
+
+    def __len__(self):
+        return len(self.starts)
+
+    def fingerprint(self) -> str:
+        """Digest of the intervals and labels, changes whenever the index is rebuilt with other data"""
+        digest = hashlib.sha1(json.dumps(self.labels).encode('utf-8'))
+        for values in (self.starts, self.ends, self.label_ids):
+            digest.update(values.tobytes())
+        return digest.hexdigest()
+
+    def lookup_int(self, value: int):
+        """Label of the interval containing an integer IPv4 address, None if not covered"""
+        i = bisect.bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.labels[self.label_ids[i]]
+        return None
+
+    def lookup(self, ip: str):
+        value = ip_to_int(ip)
+        return self.lookup_int(value) if value is not None else None
+
+    def intervals(self, label) -> List[tuple]:
+        if self._by_label is None:
+            # Satu pass untuk semua label, berikutnya cukup dict lookup
+            by_label = {}
+            for first, last, label_id in zip(self.starts, self.ends, self.label_ids):
+                by_label.setdefault(label_id, []).append((first, last))
+            self._by_label = by_label
+        label_id = self._label_to_id.get(label)
+        return self._by_label.get(label_id, []) if label_id is not None else []
+
+    def cidrs(self, label) -> List[str]:
+        """CIDRs covering every interval of a label, computed once per label"""
+        cidrs = self._cidr_cache.get(label)
+        if cidrs is None:
+            cidrs = []
+            for first, last in merge_ranges(self.intervals(label)):
+                cidrs.extend(interval_to_cidrs(first, last))
+            self._cidr_cache[label] = cidrs
+        return cidrs
+
+    def save(self, path: str):
+        labels = json.dumps(self.labels).encode('utf-8')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('>II', len(labels), len(self.starts)))
+            f.write(labels)
+            for values in (self.starts, self.ends, self.label_ids):
+                data = array('I', values)
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                f.write(data.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IntervalIndex':
+        with open(path, 'rb') as f:
+            if f.read(4) != _MAGIC:
+                raise ValueError(f"Not an interval index file: {path}")
+            labels_size, count = struct.unpack('>II', f.read(8))
+            labels = json.loads(f.read(labels_size).decode('utf-8'))
+            columns = []
+            for _ in range(3):
+                data = array('I')
+                data.frombytes(f.read(count * data.itemsize))
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                columns.append(data)
+        return cls(*columns, labels=labels)
+
+def parse_delegated(lines: Iterable[str]):
+    """Yield (first, last, country) IPv4 intervals from a RIR delegated(-extended) stats file
+
+    Format: registry|cc|type|start|value|date|status[|opaque-id|...]; the version
+    line, summary lines (cc '*') and comments are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split('|')
+        if len(fields) < 7 or fields[2] != 'ipv4' or fields[1] in ('*', '', 'ZZ'):
+            continue
+        if fields[6].lower() not in DELEGATED_STATUSES:
+            continue
+        first = ip_to_int(fields[3])
+        try:
+            count = int(fields[4])
+        except ValueError:
+            continue
+        if first is None or count <= 0:
+            continue
+        yield first, min(first + count - 1, 0xFFFFFFFF), fields[1].upper()
+
+def build_country_index(paths: Iterable[str]) -> IntervalIndex:
+    """Parse delegated stats files (one per RIR) into a country interval index"""
+    intervals = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            before = len(intervals)
+            intervals.extend(parse_delegated(f))
+        logging.info(f"Parsed {len(intervals) - before} IPv4 delegations from {path}")
+    return IntervalIndex.build(intervals)
+
+def parse_ip2asn(lines: Iterable[str]):
+    """Yield (first, last, asn) from an ip2asn-v4 TSV (range_start, range_end, AS number, country, description)
+
+    Ranges with AS number 0 (not routed) are skipped.
+    """
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 3:
+            continue
+        first = ip_to_int(fields[0])
+        last = ip_to_int(fields[1])
+        try:
+            asn = int(fields[2])
+        except ValueError:
+            continue
+        if first is None or last is None or not asn or last < first:
+            continue
+        yield first, last, asn
+
+def build_asn_index(paths: Iterable[str]) -> IntervalIndex:
+    """Parse ip2asn TSV files (plain or .gz) into an ASN interval index"""
+    intervals = []
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            before = len(intervals)
+            intervals.extend(parse_ip2asn(f))
+        logging.info(f"Parsed {len(intervals) - before} ASN ranges from {path}")
+    return IntervalIndex.build(intervals)
+
+def delegated_files(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, 'delegated-*')))
+
+def ip2asn_files(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, 'ip2asn-v4*.tsv*')))
+
+def _load_index(sources: List[str], index_path: str, builder) -> Optional[IntervalIndex]:
+    """Load the prebuilt index, rebuilding it with builder(sources) when a source file is newer"""
+    newest_source = max((os.path.getmtime(path) for path in sources), default=0)
+
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= newest_source:
+        try:
+            return IntervalIndex.load(index_path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load RIR index {index_path}: {str(e)}")
+
+    if not sources:
+        return None
+    index = builder(sources)
+    index.save(index_path)
+    logging.info(f"Built {index_path} with {len(index)} intervals from {len(sources)} files")
+    return index
+
+def load_country_index(rir_dir: str, index_path: str) -> Optional[IntervalIndex]:
+    """Country index from rir_dir/delegated-* files, cached at index_path"""
+    sources = delegated_files(rir_dir) if os.path.isdir(rir_dir) else []
+    return _load_index(sources, index_path, build_country_index)
+
+def load_asn_index(rir_dir: str, index_path: str) -> Optional[IntervalIndex]:
+    """ASN index from rir_dir/ip2asn-v4*.tsv(.gz) files, cached at index_path"""
+    sources = ip2asn_files(rir_dir) if os.path.isdir(rir_dir) else []
+    return _load_index(sources, index_path, build_asn_index)
+
+class IPEnricher:
+    """Country and ASN of an address from preloaded interval indexes (missing index -> None)"""
+
+    def __init__(self, country_index: Optional[IntervalIndex] = None, asn_index: Optional[IntervalIndex] = None):
+        self.country_index = country_index
+        self.asn_index = asn_index
+
+    def __bool__(self):
+        return self.country_index is not None or self.asn_index is not None
+
+    def fingerprint(self) -> str:
+        """Identifies the loaded indexes, so a backfill over them only has to run once"""
+        return ':'.join(index.fingerprint() if index is not None else '-'
+                        for index in (self.country_index, self.asn_index))
+
+    def lookup_int(self, value: Optional[int]) -> tuple:
+        if value is None:
+            return None, None
+        country = self.country_index.lookup_int(value) if self.country_index is not None else None
+        asn = self.asn_index.lookup_int(value) if self.asn_index is not None else None
+        return country, asn
+
+if __name__ == '__main__':
+    # python rir_index.py [rir_dir] [cache_dir]
+    logging.basicConfig(level=logging.INFO)
+    rir_dir = sys.argv[1] if len(sys.argv) > 1 else 'rir'
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else 'cache'
+    if cache_dir.endswith('.idx') or os.path.isfile(cache_dir):
+        # Format lama (path file index) sudah diganti folder cache
+        sys.exit(f"Second argument is the cache directory, not an index file: {cache_dir} "
+                 f"(indexes are written to <cache_dir>/rir_country.idx and rir_asn.idx)")
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, loader, pattern in (('rir_country.idx', load_country_index, 'delegated-*'),
+                                  ('rir_asn.idx', load_asn_index, 'ip2asn-v4*.tsv')):
+        index_path = os.path.join(cache_dir, name)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        index = loader(rir_dir, index_path)
+        if index is None:
+            print(f"No {pattern} files found in {rir_dir}")
+        else:
+            print(f"{len(index)} intervals, {len(index.labels)} labels -> {index_path}")
@@ -0,0 +1,46 @@
+import asyncio
+import json
+import threading
+import logging
+
+class ScanEventBroker:
+    """Fan out scanner events published from worker threads to asyncio subscribers"""
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a queue bound to the running event loop"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event: str, data: dict):
+        """Thread-safe: deliver (event, data) to every subscriber"""
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, (event, data))
+            except RuntimeError:
+                # Event loop sudah ditutup
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Client terlalu lambat; event dibuang, client bisa resync lewat /api/status
+            logging.debug("Dropping scan event for slow subscriber")
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -3,13 +3,16 @@ import socket
 from queue import Queue
 import threading
 from database import Database
+from scan_events import ScanEventBroker
+from ip_utils import RangeSet
+from target_stream import TargetStream
 import json
 from datetime import datetime
 import os
 import logging
 import ipaddress
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from typing import List, Dict, Optional, Iterator
 import sqlite3
 from pathlib import Path
@@ -32,7 +35,16 @@ class EternalsSearchScanner:
         self.progress = 0
         self.results = []
         self.discovered_devices = []
+        self._discovered_lock = threading.Lock()
+        # Nomor urut device yang ditemukan, tidak di-reset antar scan (cursor untuk client)
+        self._device_seq = 0
+        self.completed_ips = 0
+        self.total_ips = 0
         self.scan_start_time = None
+        # Push progress/device baru ke subscriber SSE
+        self.events = ScanEventBroker()
+        self.progress_interval = 0.5
+        self._last_progress_event = 0
         self.executor = ThreadPoolExecutor(max_workers=500)
         self.db = Database()
         self.thread_limit = threading.Semaphore(500)  # Batasi jumlah thread aktif
@@ -44,6 +56,14 @@ class EternalsSearchScanner:
             "https": "scraperapi:59f79d65e9107daec3b98b8b348a00b2@proxy-server.scraperapi.com:8001"
         }
         self.max_retries = 3
+        # Batas future yang belum diproses; scan jutaan IP tidak menumpuk future di memori
+        self.max_pending_futures = 5000
+        self.proxies = []
+        self.current_proxy_index = 0
+        # Endpoint lokal socks5.py --upstreams proxies.txt (mis. 'socks5h://127.0.0.1:1080', butuh PySocks);
+        # kalau diisi, scan network dan scan_single_device lewat endpoint ini (pemilihan dan failover
+        # proxy dilakukan di sana), bukan ScraperAPI / rotasi proxies.txt di sini
+        self.local_proxy = None
 
     def _save_status(self):
         """Save scanner status to JSON file"""
@@ -74,10 +94,25 @@ class EternalsSearchScanner:
                     self.progress = status.get('progress', 0)
                     self.current_ip = status.get('current_ip')
                     self.results = status.get('results', [])
-                    self.discovered_devices = status.get('discovered_devices', [])
+                    devices = self._number_devices(status.get('discovered_devices', []))
+                    with self._discovered_lock:
+                        self.discovered_devices = devices
+                        if devices:
+                            self._device_seq = max(self._device_seq, devices[-1]['seq'])
         except Exception as e:
             logging.error(f"Error loading status: {e}")
 
+    @staticmethod
+    def _number_devices(devices: List[Dict]) -> List[Dict]:
+        """Give devices consecutive 'seq' numbers (status files from older versions have none)"""
+        first = devices[0].get('seq') if devices else None
+        if not isinstance(first, int):
+            first = 1
+        if any(device.get('seq') != first + i for i, device in enumerate(devices)):
+            # Penomoran ulang deterministik: reload file yang sama memberi seq yang sama
+            devices = [dict(device, seq=first + i) for i, device in enumerate(devices)]
+        return devices
+
     def get_status(self):
         if not self.is_active:
             return {
@@ -94,6 +129,67 @@ class EternalsSearchScanner:
             "total_devices": self.db.get_total_devices()
         }
 
+    def status_snapshot(self) -> Dict:
+        """Scan counters without the result lists"""
+        status = "idle"
+        if self.is_active:
+            status = "Scanning" if not self._is_paused else "paused"
+        return {
+            "status": status,
+            "is_scanning": self._is_scanning,
+            "is_paused": self._is_paused,
+            "progress": self.progress,
+            "current_ip": self.current_ip,
+            "completed_ips": self.completed_ips,
+            "total_ips": self.total_ips,
+            "discovered_count": len(self.discovered_devices),
+            "start_time": self.scan_start_time.isoformat() if self.scan_start_time else None
+        }
+
+    def discovered_since(self, cursor: int, limit: int = 500) -> Dict:
+        """Devices discovered after a sequence cursor, plus the cursor to resume from"""
+        with self._discovered_lock:
+            if cursor > self._device_seq:
+                # Cursor dari proses server sebelumnya, mulai dari awal
+                cursor = 0
+            devices = self.discovered_devices
+            if devices:
+                # Seq dalam satu scan berurutan, jadi index bisa dihitung langsung
+                start = min(max(cursor - devices[0]['seq'] + 1, 0), len(devices))
+            else:
+                start = 0
+            batch = devices[start:start + limit]
+            has_more = start + limit < len(devices)
+
+        return {
+            'cursor': batch[-1]['seq'] if batch else cursor,
+            'devices': batch,
+            'has_more': has_more
+        }
+
+    def _publish_status(self):
+        self.events.publish('status', self.status_snapshot())
+
+    def _publish_progress(self):
+        """Publish a progress tick, throttled to one per progress_interval"""
+        now = time.monotonic()
+        if now - self._last_progress_event < self.progress_interval:
+            return
+        self._last_progress_event = now
+        self.events.publish('progress', self.status_snapshot())
+
+    def _record_discovered(self, ip: str, ports: List[int]):
+        with self._discovered_lock:
+            self._device_seq += 1
+            device = {
+                'seq': self._device_seq,
+                'ip': ip,
+                'ports': ports,
+                'timestamp': datetime.now().isoformat()
+            }
+            self.discovered_devices.append(device)
+        self.events.publish('device', device)
+
     def banner_grab(self, ip, port, queue):
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -106,7 +202,9 @@ class EternalsSearchScanner:
         except:
             pass
 
-    def scan_network(self, ip_ranges: List[str], exclude_ranges: Optional[List[str]] = None):
+    def scan_network(self, ip_ranges: List[str], exclude_ranges: Optional[List[str]] = None,
+                     targets: Optional[TargetStream] = None):
+        """Scan ip_ranges minus exclude_ranges, or a TargetStream that is still being uploaded"""
         self.logger.info("Scan network started")
         try:
             # Buat executor baru setiap kali scan dimulai
@@ -120,13 +218,18 @@ class EternalsSearchScanner:
             self.progress = 0
             self.current_ip = None
             self.completed_ips = 0
-            self.total_ips = self._estimate_total_ips(ip_ranges, exclude_ranges)
+            # Range dinormalisasi dulu: overlap digabung, exclude dikurangi, tiap IP hanya sekali
+            streaming = targets is not None
+            if not streaming:
+                targets = self._build_targets(ip_ranges, exclude_ranges)
+            self.total_ips = targets.size
             
             # Start logging
             self._start_logging(ip_ranges)
+            self._publish_status()
             
             # Gunakan generator untuk IP list
-            ip_generator = self._generate_ip_generator(ip_ranges, exclude_ranges)
+            ip_generator = targets.iter_ips()
             
             futures = []
             for ip in ip_generator:
@@ -140,13 +243,19 @@ class EternalsSearchScanner:
                         
                 self.current_ip = ip
                 self.completed_ips += 1
+                if streaming:
+                    # Total bertambah selama file target masih di-upload
+                    self.total_ips = targets.size
                 if self.total_ips:
                     self.progress = int((self.completed_ips) / self.total_ips * 100)
+                self._publish_progress()
                 
                 # Submit scan task ke thread pool
                 if self._is_scanning and not self._is_paused:
                     future = self.executor.submit(self._scan_single_ip, ip)
                     futures.append(future)
+                    if len(futures) >= self.max_pending_futures:
+                        futures = self._drain_futures(futures)
             
             # Process results
             for future in as_completed(futures):
@@ -166,6 +275,15 @@ class EternalsSearchScanner:
         finally:
             self._is_scanning = False
             self._stop_logging()
+            self._publish_status()
+
+    def _drain_futures(self, futures):
+        """Process finished futures (waiting for at least one), return the ones still running"""
+        done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            if self._is_scanning:
+                self._process_future(future)
+        return list(not_done)
 
     def _parse_port_range(self, port_range: str) -> List[int]:
         ports = []
@@ -178,29 +296,24 @@ class EternalsSearchScanner:
                 ports.append(int(part))
         return ports
 
+    def _build_targets(self, ip_ranges: List[str], exclude_ranges: Optional[List[str]] = None) -> RangeSet:
+        """Merge target ranges and subtract excludes exactly"""
+        targets = RangeSet.parse(ip_ranges)
+        excludes = RangeSet.parse(exclude_ranges)
+        for entry in targets.invalid:
+            self.logger.warning(f"Invalid IP range: {entry}")
+        for entry in excludes.invalid:
+            self.logger.warning(f"Invalid exclude IP range: {entry}")
+        for item in targets.adjusted + excludes.adjusted:
+            self.logger.warning(f"IP range {item['input']} has host bits set, using {item['normalized']}")
+        return targets.subtract(excludes)
+
     def _generate_ip_generator(self, ip_ranges: List[str], exclude_ranges: Optional[List[str]] = None) -> Iterator[str]:
         """Generate IP addresses using a generator to handle large IP ranges."""
-        exclude_ips = set()
-        if exclude_ranges:
-            for exclude_range in exclude_ranges:
-                try:
-                    network = ipaddress.ip_network(exclude_range)
-                    exclude_ips.update(str(ip) for ip in network)
-                except ValueError:
-                    self.logger.warning(f"Invalid exclude IP range: {exclude_range}")
-
-        for ip_range in ip_ranges:
-            try:
-                network = ipaddress.ip_network(ip_range)
-                for ip in network:
-                    ip_str = str(ip)
-                    if ip_str not in exclude_ips:
-                        yield ip_str
-            except ValueError:
-                self.logger.warning(f"Invalid IP range: {ip_range}")
+        return self._build_targets(ip_ranges, exclude_ranges).iter_ips()
         
     def _scan_single_ip(self, ip: str) -> tuple:
-        """Scan IP menggunakan Shodan InternetDB dengan ScraperAPI proxy"""
+        """Scan IP menggunakan Shodan InternetDB lewat local_proxy atau ScraperAPI proxy"""
         with self.thread_limit:
             if not self._is_scanning:
                 return ip, []
@@ -208,11 +321,11 @@ class EternalsSearchScanner:
             retries = 0
             while retries < self.max_retries:
                 try:
-                    # Gunakan ScraperAPI proxy
+                    # local_proxy kalau diisi, selain itu ScraperAPI proxy
                     url = f"https://internetdb.shodan.io/{ip}"
                     response = requests.get(
                         url, 
-                        proxies=self.proxy_config,
+                        proxies=self._scan_proxies(),
                         timeout=10,
                         verify=False
                     )
@@ -258,25 +371,15 @@ class EternalsSearchScanner:
 
     def _process_scan_result(self, ip: str, open_ports: List[Dict]):
         try:
-            with sqlite3.connect(self.db.db_name) as conn:
-                c = conn.cursor()
-                
-                for port_info in open_ports:
-                    if port_info['service'] is not None:
-                        # Simpan langsung sebagai JSON string
-                        c.execute('''
-                            INSERT INTO devices (ip, port, banner, timestamp)
-                            VALUES (?, ?, ?, datetime('now'))
-                            ON CONFLICT(ip, port) DO UPDATE SET
-                                banner = excluded.banner,
-                                timestamp = datetime('now')
-                        ''', (
-                            ip,
-                            port_info['port'],
-                            port_info['service']  # Service sudah dalam format JSON string
-                        ))
-                
-                conn.commit()
+            # Service sudah dalam format JSON string
+            services = [
+                (port_info['port'], port_info['service'])
+                for port_info in open_ports
+                if port_info['service'] is not None
+            ]
+            self.db.save_scan_result(ip, services)
+            if services:
+                self._record_discovered(ip, [port for port, _ in services])
                 
             # Log hasil scan
             self._log_scan_result(ip, open_ports)
@@ -401,6 +504,7 @@ class EternalsSearchScanner:
                         self.logger.error(f"Error pausing executor: {str(e)}")
                 
                 self._save_status()
+                self._publish_status()
                 return True
         except Exception as e:
             self.logger.error(f"Error pausing scan: {str(e)}")
@@ -413,6 +517,7 @@ class EternalsSearchScanner:
                 self._is_paused = False
                 self.current_status = "scanning"
                 self._save_status()
+                self._publish_status()
                 return True
         except Exception as e:
             self.logger.error(f"Error resuming scan: {str(e)}")
@@ -444,6 +549,7 @@ class EternalsSearchScanner:
             
             # Save final status
             self._save_status()
+            self._publish_status()
             
             # Stop logging
             self._stop_logging()
@@ -646,12 +752,12 @@ class EternalsSearchScanner:
 
     def get_scan_history(self, limit: int = 100) -> List[Dict]:
         try:
-            with sqlite3.connect(self.db.db_name) as conn:
+            with self.db.connect() as conn:
                 conn.row_factory = sqlite3.Row
                 c = conn.cursor()
                 
                 results = c.execute('''
-                    SELECT ip, port, banner, timestamp
+                    SELECT ip, port, banner_text(banner) AS banner, timestamp
                     FROM devices
                     ORDER BY timestamp DESC
                     LIMIT ?
@@ -708,16 +814,7 @@ class EternalsSearchScanner:
                             }
                             
                             # Save to database
-                            with sqlite3.connect(self.db.db_name) as conn:
-                                c = conn.cursor()
-                                c.execute('''
-                                    INSERT INTO devices (ip, port, banner, timestamp)
-                                    VALUES (?, ?, ?, datetime('now'))
-                                    ON CONFLICT(ip, port) DO UPDATE SET
-                                        banner = excluded.banner,
-                                        timestamp = datetime('now')
-                                ''', (ip, port, json.dumps(service_info)))
-                                conn.commit()
+                            self.db.save_scan_result(ip, [(port, json.dumps(service_info))])
                                 
                             self.logger.info(f"Port {port} is open on {ip}")
                             return service_info
@@ -754,11 +851,8 @@ class EternalsSearchScanner:
                 file_handler.close()
 
     def _estimate_total_ips(self, ip_ranges: List[str], exclude_ranges: Optional[List[str]] = None) -> int:
-        total_ips = 0
-        for ip_range in ip_ranges:
-            network = ipaddress.ip_network(ip_range)
-            total_ips += network.num_addresses  # Menggunakan num_addresses
-        return total_ips
+        # Jumlah IP unik setelah overlap digabung dan exclude dikurangi
+        return RangeSet.parse(ip_ranges).subtract(RangeSet.parse(exclude_ranges)).size
 
     def _process_future(self, future):
         try:
@@ -836,8 +930,17 @@ class EternalsSearchScanner:
             self.logger.error(f"❌ Error saat membaca 'proxies.txt': {str(e)}")
             self.proxies = []
 
+    def _scan_proxies(self):
+        """Proxy untuk scan network: local_proxy kalau diisi, selain itu proxy_config (ScraperAPI)"""
+        if self.local_proxy:
+            return {'http': self.local_proxy, 'https': self.local_proxy}
+        return self.proxy_config
+
     def _get_next_proxy(self):
         """Dapatkan proxy berikutnya dengan rotasi"""
+        if self.local_proxy:
+            return self.local_proxy
+
         if not self.proxies:
             self._get_proxies()
         
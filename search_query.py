@@ -0,0 +1,220 @@
+import re
+from datetime import datetime
+from typing import List, Tuple
+
+from ip_utils import ip_to_int, cidr_bounds
+
+# Batas ukuran query supaya satu request tidak bisa membuat SQL raksasa
+MAX_TERMS = 64
+
+# field -> nama facet di device_facets (lookup lewat index, bukan LIKE)
+FACET_FIELDS = {'tag': 'tag', 'vuln': 'vuln', 'cpe': 'cpe', 'server': 'server'}
+# field yang hanya bisa dicari sebagai substring banner
+BANNER_FIELDS = {'banner', 'title', 'hostname'}
+QUERY_FIELDS = {'port', 'ip', 'cidr', 'net', 'after', 'before', 'country', 'asn'} | set(FACET_FIELDS) | BANNER_FIELDS
+
+_TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<lparen>\() |
+        (?P<rparen>\)) |
+        (?P<neg>-)?(?P<field>[A-Za-z_]+):(?P<value>"(?:[^"\\]|\\.)*"|[^\s()]+) |
+        (?P<quoted>"(?:[^"\\]|\\.)*") |
+        (?P<word>[^\s()]+)
+    )
+''', re.VERBOSE)
+
+class QuerySyntaxError(ValueError):
+    """Invalid structured search query"""
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+def tokenize(q: str) -> List[tuple]:
+    tokens = []
+    position = 0
+    q = q.strip()
+    while position < len(q):
+        match = _TOKEN_RE.match(q, position)
+        if not match or match.end() == position:
+            raise QuerySyntaxError(f"Unexpected character at {position}: {q[position:position + 10]!r}")
+        position = match.end()
+
+        if match.group('lparen'):
+            tokens.append(('(',))
+        elif match.group('rparen'):
+            tokens.append((')',))
+        elif match.group('field'):
+            field = match.group('field').lower()
+            if field not in QUERY_FIELDS:
+                raise QuerySyntaxError(f"Unknown field: {field} (use {', '.join(sorted(QUERY_FIELDS))})")
+            term = ('term', field, _unquote(match.group('value')))
+            tokens.append(('not', term) if match.group('neg') else term)
+        elif match.group('quoted'):
+            tokens.append(('text', _unquote(match.group('quoted'))))
+        else:
+            word = match.group('word')
+            if word.upper() in ('AND', 'OR', 'NOT'):
+                tokens.append((word.upper(),))
+            elif word.startswith('-') and len(word) > 1:
+                tokens.append(('not', ('text', word[1:])))
+            else:
+                tokens.append(('text', word))
+    return tokens
+
+class _Parser:
+    """Recursive descent: or := and (OR and)*, and := unary ([AND] unary)*, unary := NOT unary | ( or ) | term"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Empty query")
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise QuerySyntaxError(f"Unexpected {self.peek()!r}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_unary()]
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.next()
+            nodes.append(self.parse_unary())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_unary(self):
+        kind = self.peek()
+        if kind is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        if kind == 'NOT':
+            self.next()
+            return ('not', self.parse_unary())
+        if kind == '(':
+            self.next()
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QuerySyntaxError("Missing closing parenthesis")
+            self.next()
+            return node
+        if kind in ('term', 'text', 'not'):
+            return self.next()
+        raise QuerySyntaxError(f"Unexpected {kind!r}")
+
+def parse_query(q: str):
+    """Parse a query string such as 'port:22 tag:cloud NOT vuln:CVE-2021-44228' into an AST"""
+    tokens = tokenize(q)
+    terms = sum(1 for token in tokens if token[0] in ('term', 'text', 'not'))
+    if terms > MAX_TERMS:
+        raise QuerySyntaxError(f"Too many terms (max {MAX_TERMS})")
+    return _Parser(tokens).parse()
+
+def _like(value: str) -> str:
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _parse_date(field, value):
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise QuerySyntaxError(f"Invalid date for {field}: {value}")
+
+def _compile_term(field, value) -> Tuple[str, list]:
+    if field == 'port':
+        try:
+            ports = [int(p) for p in value.split(',') if p]
+        except ValueError:
+            raise QuerySyntaxError(f"Invalid port: {value}")
+        if not ports:
+            raise QuerySyntaxError("Empty port")
+        if len(ports) == 1:
+            return "port = ?", ports
+        return f"port IN ({', '.join('?' * len(ports))})", ports
+
+    if field == 'ip':
+        if '/' in value:
+            field = 'cidr'
+        else:
+            ip_int = ip_to_int(value)
+            if ip_int is None:
+                raise QuerySyntaxError(f"Invalid IPv4 address: {value}")
+            return "ip_int = ?", [ip_int]
+
+    if field in ('cidr', 'net'):
+        try:
+            first, last = cidr_bounds(value)
+        except ValueError as e:
+            raise QuerySyntaxError(str(e))
+        return "ip_int BETWEEN ? AND ?", [first, last]
+
+    if field in FACET_FIELDS:
+        # Semi-join ke index (facet, value, ip) di device_facets
+        if field == 'vuln':
+            value = value.upper()
+        return ("(ip, port) IN (SELECT ip, port FROM device_facets WHERE facet = ? AND value = ?)",
+                [FACET_FIELDS[field], value])
+
+    if field == 'country':
+        codes = [code.strip().upper() for code in value.split(',') if code.strip()]
+        if not codes:
+            raise QuerySyntaxError("Empty country")
+        if len(codes) == 1:
+            return "country = ?", codes
+        return f"country IN ({', '.join('?' * len(codes))})", codes
+
+    if field == 'asn':
+        try:
+            asns = [int(a.strip().upper().removeprefix('AS')) for a in value.split(',') if a.strip()]
+        except ValueError:
+            raise QuerySyntaxError(f"Invalid ASN: {value}")
+        if not asns:
+            raise QuerySyntaxError("Empty ASN")
+        if len(asns) == 1:
+            return "asn = ?", asns
+        return f"asn IN ({', '.join('?' * len(asns))})", asns
+
+    if field == 'after':
+        return "timestamp >= ?", [_parse_date(field, value)]
+    if field == 'before':
+        return "timestamp < ?", [_parse_date(field, value)]
+
+    # banner/title/hostname: tidak ada index, substring pada banner yang sudah di-decode
+    return "banner_text(banner) LIKE ? ESCAPE '\\'", [_like(value)]
+
+def _compile(node) -> Tuple[str, list]:
+    kind = node[0]
+    if kind == 'term':
+        return _compile_term(node[1], node[2])
+    if kind == 'text':
+        return "(ip LIKE ? ESCAPE '\\' OR banner_text(banner) LIKE ? ESCAPE '\\')", [_like(node[1]), _like(node[1])]
+    if kind == 'not':
+        sql, params = _compile(node[1])
+        return f"NOT ({sql})", params
+
+    parts = [_compile(child) for child in node[1]]
+    joiner = ' AND ' if kind == 'and' else ' OR '
+    sql = joiner.join(f"({sql})" for sql, _ in parts)
+    params = [param for _, child_params in parts for param in child_params]
+    return sql, params
+
+def compile_query(q: str) -> Tuple[str, list]:
+    """Compile a structured query into a parameterized WHERE expression over devices"""
+    return _compile(parse_query(q))
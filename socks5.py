@@ -1,8 +1,18 @@
+import asyncio
 import socket
-import threading
 import logging
-import select
 import sys
+import errno
+import argparse
+
+from relay import relay
+from resolver import CachingResolver, happy_eyeballs_connect
+from upstream_pool import UpstreamPool
+
+try:
+    import uvloop  # opsional, event loop lebih cepat untuk puluhan ribu tunnel
+except ImportError:
+    uvloop = None
 
 # Setup logging
 logging.basicConfig(
@@ -11,188 +21,309 @@ logging.basicConfig(
 )
 
 class SOCKS5Server:
+    """SOCKS5 (no auth, CONNECT) on asyncio: one event loop, one task per tunnel
+
+    max_connections caps concurrent tunnels; clients beyond it are closed
+    right after accept. backlog is the listen queue length (the kernel also
+    caps it at net.core.somaxconn). Tunnels are relayed on the raw sockets
+    (splice on Linux, otherwise recv_into a preallocated buffer).
+
+    Direct CONNECTs resolve domain names through a cached async resolver
+    and race the returned addresses Happy-Eyeballs style: a new attempt
+    every happy_eyeballs_delay seconds, each bounded by attempt_timeout, the
+    whole resolve + connect bounded by connect_timeout.
+
+    With upstream_pool set, CONNECTs are chained through the pool's best
+    upstream proxy instead of dialing the target directly.
+    """
     SOCKS_VERSION = 5
-    
-    def __init__(self, host='0.0.0.0', port=1080):
+
+    def __init__(self, host='0.0.0.0', port=1080, max_connections=50000, backlog=8192,
+                 handshake_timeout=10, connect_timeout=10, buffer_size=262144, use_splice=True,
+                 upstream_pool: UpstreamPool = None, resolver: CachingResolver = None,
+                 happy_eyeballs_delay=0.25, attempt_timeout=5):
         self.host = host
         self.port = port
+        self.max_connections = max_connections
+        self.backlog = backlog
+        self.handshake_timeout = handshake_timeout
+        self.connect_timeout = connect_timeout
+        self.buffer_size = buffer_size
+        self.use_splice = use_splice
+        self.upstream_pool = upstream_pool
+        self.resolver = resolver or CachingResolver()
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.attempt_timeout = attempt_timeout
+        self.active_connections = 0
+        self._tasks = set()
 
-    def handle_client(self, client_socket):
-        try:
-            # Menerima header (2 byte)
-            header = self._recvall(client_socket, 2)
-            if not header:
-                logging.error("Failed to receive header")
-                client_socket.close()
-                return
-
-            version, nmethods = header[0], header[1]
-
-            # Pastikan versi SOCKS sesuai
-            if version != self.SOCKS_VERSION:
-                logging.error("Invalid SOCKS version")
-                client_socket.close()
-                return
+    async def handle_client(self, client_socket):
+        if self.active_connections >= self.max_connections:
+            # Penuh: tolak langsung daripada menumpuk socket yang menunggu
+            logging.warning(f"Connection limit reached ({self.max_connections}), rejecting client")
+            client_socket.close()
+            return
 
-            # Menerima daftar metode autentikasi
-            methods = self._recvall(client_socket, nmethods)
-            if not methods:
-                logging.error("Failed to receive authentication methods")
-                client_socket.close()
+        self.active_connections += 1
+        remote = None
+        try:
+            # Handshake dibatasi waktu supaya client yang diam tidak memakan slot
+            target = await asyncio.wait_for(self._handshake(client_socket), self.handshake_timeout)
+            if target is None:
                 return
 
-            # Lakukan autentikasi
-            if not self._handle_auth(client_socket):
-                client_socket.close()
+            remote = await self._open_remote(client_socket, *target)
+            if remote is None:
                 return
 
-            # Tangani permintaan client
-            if not self._handle_request(client_socket):
-                client_socket.close()
-                return
+            # Meneruskan data antara client dan server tujuan
+            await self._forward_data(client_socket, remote)
 
+        except asyncio.TimeoutError:
+            logging.debug("Handshake timed out")
+        except ConnectionError as e:
+            logging.debug(f"Connection closed: {str(e)}")
         except Exception as e:
             logging.error(f"Error handling client: {str(e)}")
+        finally:
+            self.active_connections -= 1
             client_socket.close()
+            if remote is not None:
+                remote.close()
 
-    def _handle_auth(self, client_socket):
+    async def _handshake(self, client_socket):
+        """Greeting, auth and request; returns the requested (address, port) or None"""
+        # Menerima header (2 byte)
+        header = await self._recvall(client_socket, 2)
+        if not header:
+            logging.error("Failed to receive header")
+            return None
+
+        version, nmethods = header[0], header[1]
+
+        # Pastikan versi SOCKS sesuai
+        if version != self.SOCKS_VERSION:
+            logging.error("Invalid SOCKS version")
+            return None
+
+        # Menerima daftar metode autentikasi
+        methods = await self._recvall(client_socket, nmethods)
+        if methods is None:
+            logging.error("Failed to receive authentication methods")
+            return None
+
+        # Lakukan autentikasi
+        if not await self._handle_auth(client_socket):
+            return None
+
+        # Tangani permintaan client
+        return await self._handle_request(client_socket)
+
+    async def _handle_auth(self, client_socket):
         """Handle SOCKS5 authentication"""
         try:
             # Mengirimkan respons bahwa tidak diperlukan autentikasi
-            client_socket.sendall(bytes([self.SOCKS_VERSION, 0]))
+            await self.loop.sock_sendall(client_socket, bytes([self.SOCKS_VERSION, 0]))
             return True
         except Exception as e:
             logging.error(f"Authentication error: {str(e)}")
             return False
 
-    def _handle_request(self, client_socket):
-        """Handle SOCKS5 client request"""
-        try:
-            # Menerima header permintaan (4 byte)
-            header = self._recvall(client_socket, 4)
-            if not header:
-                logging.error("Failed to receive request header")
-                return False
-
-            version, cmd, _, address_type = header
-
-            if version != self.SOCKS_VERSION:
-                logging.error("Invalid SOCKS version in request")
-                return False
-
-            if cmd != 1:
-                logging.error("Unsupported command")
-                self._send_reply(client_socket, 7)
-                return False
-
-            # Menangani alamat tujuan berdasarkan tipe
-            if address_type == 1:  # IPv4
-                addr = self._recvall(client_socket, 4)
-                address = socket.inet_ntoa(addr)
-            elif address_type == 3:  # Domain name
-                domain_length = self._recvall(client_socket, 1)[0]
-                domain = self._recvall(client_socket, domain_length)
-                address = domain.decode()
-            else:
-                logging.error("Unsupported address type")
-                self._send_reply(client_socket, 8)
-                return False
+    async def _handle_request(self, client_socket):
+        """Handle SOCKS5 client request, returns the requested (address, port) or None"""
+        # Menerima header permintaan (4 byte)
+        header = await self._recvall(client_socket, 4)
+        if not header:
+            logging.error("Failed to receive request header")
+            return None
 
-            # Menerima port tujuan
-            port_bytes = self._recvall(client_socket, 2)
-            port = int.from_bytes(port_bytes, 'big')
+        version, cmd, _, address_type = header
 
-            # Mencoba terhubung ke server tujuan
-            remote = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            remote.connect((address, port))
-            logging.info(f"Connected to {address}:{port}")
+        if version != self.SOCKS_VERSION:
+            logging.error("Invalid SOCKS version in request")
+            return None
 
-            # Mengirimkan respons sukses ke client
-            bind_address = remote.getsockname()
-            self._send_reply(client_socket, 0, bind_address)
+        if cmd != 1:
+            logging.error("Unsupported command")
+            await self._send_reply(client_socket, 7)
+            return None
 
-            # Meneruskan data antara client dan server tujuan
-            self._forward_data(client_socket, remote)
-            return True
+        # Menangani alamat tujuan berdasarkan tipe
+        if address_type == 1:  # IPv4
+            addr = await self._recvall(client_socket, 4)
+            address = socket.inet_ntoa(addr) if addr else None
+        elif address_type == 4:  # IPv6
+            addr = await self._recvall(client_socket, 16)
+            address = socket.inet_ntop(socket.AF_INET6, bytes(addr)) if addr else None
+        elif address_type == 3:  # Domain name
+            domain_length = await self._recvall(client_socket, 1)
+            domain = await self._recvall(client_socket, domain_length[0]) if domain_length else None
+            address = domain.decode() if domain else None
+        else:
+            logging.error("Unsupported address type")
+            await self._send_reply(client_socket, 8)
+            return None
 
+        # Menerima port tujuan
+        port_bytes = await self._recvall(client_socket, 2)
+        if address is None or port_bytes is None:
+            logging.error("Failed to receive destination address")
+            return None
+        return address, int.from_bytes(port_bytes, 'big')
+
+    async def _open_remote(self, client_socket, address, port):
+        """Connect to the target (directly or through an upstream) and send the reply; remote socket or None"""
+        leftover = b''
+        try:
+            # Mencoba terhubung ke server tujuan
+            if self.upstream_pool is not None:
+                # Pool membatasi waktu sendiri per percobaan upstream
+                remote, leftover = await self.upstream_pool.open_tunnel(address, port)
+            else:
+                remote = await asyncio.wait_for(self._connect(address, port), self.connect_timeout)
         except Exception as e:
-            logging.error(f"Request handling error: {str(e)}")
-            self._send_reply(client_socket, 1)
-            return False
+            logging.error(f"Request handling error: {address}:{port} {str(e) or type(e).__name__}")
+            await self._send_reply(client_socket, self._reply_code(e))
+            return None
+
+        logging.debug(f"Connected to {address}:{port}")
+
+        # Mengirimkan respons sukses ke client
+        bind_address = remote.getsockname()
+        await self._send_reply(client_socket, 0, bind_address)
+        if leftover:
+            # Data target yang ikut terbaca bersama respons CONNECT upstream
+            await self.loop.sock_sendall(client_socket, leftover)
+        return remote
 
-    def _send_reply(self, client_socket, reply_code, bind_address=None):
+    async def _connect(self, address, port):
+        """Non-blocking socket connected to address:port (domain names via the cached resolver)"""
+        addresses = await self.resolver.resolve(address)
+        return await happy_eyeballs_connect(addresses, port, self.happy_eyeballs_delay, self.attempt_timeout)
+
+    @staticmethod
+    def _reply_code(error):
+        """SOCKS5 reply code for a failed connect"""
+        if hasattr(error, 'reply_code'):
+            return error.reply_code
+        if isinstance(error, ConnectionRefusedError):
+            return 5
+        if isinstance(error, asyncio.TimeoutError) or getattr(error, 'errno', None) in (errno.ETIMEDOUT, errno.EHOSTUNREACH):
+            return 4
+        if getattr(error, 'errno', None) == errno.ENETUNREACH:
+            return 3
+        return 1
+
+    async def _send_reply(self, client_socket, reply_code, bind_address=None):
         """Send SOCKS5 reply"""
         if bind_address is None:
             bind_address = ('0.0.0.0', 0)
-        
-        addr_bytes = socket.inet_aton(bind_address[0])
+
+        if ':' in bind_address[0]:
+            address_type, addr_bytes = 4, socket.inet_pton(socket.AF_INET6, bind_address[0])
+        else:
+            address_type, addr_bytes = 1, socket.inet_aton(bind_address[0])
         port_bytes = bind_address[1].to_bytes(2, 'big')
-        
+
         reply = bytes([
             self.SOCKS_VERSION,
             reply_code,
             0,  # Reserved
-            1,  # IPv4
+            address_type,
         ]) + addr_bytes + port_bytes
-        
-        client_socket.send(reply)
-
-    def _forward_data(self, client_socket, remote_socket):
-        """Forward data between client and remote using select"""
-        while True:
-            # Wait until client or remote is available for read
-            r, w, e = select.select([client_socket, remote_socket], [], [])
-            
-            if client_socket in r:
-                data = client_socket.recv(4096)
-                if not data:
-                    break
-                remote_socket.send(data)
-                
-            if remote_socket in r:
-                data = remote_socket.recv(4096)
-                if not data:
-                    break
-                client_socket.send(data)
-                
-        client_socket.close()
-        remote_socket.close()
 
-    def start(self):
         try:
-            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server.bind((self.host, self.port))
-            server.listen(100)
-            
-            logging.info(f"SOCKS5 server listening on {self.host}:{self.port}")
-            
-            while True:
-                client_socket, addr = server.accept()
-                logging.info(f"Accepted connection from {addr[0]}:{addr[1]}")
-                
-                client_handler = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket,)
-                )
-                client_handler.daemon = True
-                client_handler.start()
-                
-        except Exception as e:
-            logging.error(f"Server error: {str(e)}")
-            server.close()
-            sys.exit(1)
+            await self.loop.sock_sendall(client_socket, reply)
+        except ConnectionError:
+            pass
+
+    async def _forward_data(self, client_socket, remote_socket):
+        """Forward data between client and remote until both directions reach EOF"""
+        for sock in (client_socket, remote_socket):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sent, received = await relay(client_socket, remote_socket, self.buffer_size, self.use_splice)
+        logging.debug(f"Tunnel closed: {sent} bytes up, {received} bytes down")
 
-    def _recvall(self, sock, n):
+    async def _recvall(self, sock, n):
         """Menerima tepat n byte data dari socket"""
-        data = b''
-        while len(data) < n:
-            packet = sock.recv(n - len(data))
-            if not packet:
+        data = bytearray(n)
+        view = memoryview(data)
+        received = 0
+        while received < n:
+            count = await self.loop.sock_recv_into(sock, view[received:])
+            if not count:
                 return None
-            data += packet
+            received += count
         return data
 
+    def _increase_file_limit(self):
+        """Satu tunnel = 2 file descriptor, naikkan soft limit ke hard limit"""
+        try:
+            import resource
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            target = 1048576 if hard == resource.RLIM_INFINITY else hard
+            if target > soft:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except Exception as e:
+            logging.warning(f"Failed to increase file limit: {e}")
+
+    def _spawn(self, coro):
+        # Simpan referensi task supaya tidak di-GC sebelum selesai
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def serve(self, server_socket=None):
+        """Accept clients forever on server_socket (or a new socket on host:port)"""
+        self.loop = asyncio.get_running_loop()
+        self._increase_file_limit()
+        if server_socket is None:
+            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind((self.host, self.port))
+            server_socket.listen(self.backlog)
+        server_socket.setblocking(False)
+
+        logging.info(f"SOCKS5 server listening on {self.host}:{self.port} "
+                     f"(max {self.max_connections} connections, backlog {self.backlog})")
+        if self.upstream_pool is not None:
+            await self.upstream_pool.start()
+        try:
+            while True:
+                try:
+                    client_socket, addr = await self.loop.sock_accept(server_socket)
+                except OSError as e:
+                    # mis. EMFILE: fd habis, tunggu tunnel lain selesai
+                    logging.error(f"Accept error: {str(e)}")
+                    await asyncio.sleep(0.1)
+                    continue
+                client_socket.setblocking(False)
+                self._spawn(self.handle_client(client_socket))
+        finally:
+            server_socket.close()
+            if self.upstream_pool is not None:
+                await self.upstream_pool.close()
+
+    def start(self):
+        try:
+            if uvloop is not None:
+                uvloop.install()
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            logging.error(f"Server error: {str(e)}")
+            sys.exit(1)
+
 if __name__ == "__main__":
-    server = SOCKS5Server()
+    parser = argparse.ArgumentParser(description="SOCKS5 server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1080)
+    parser.add_argument('--max-connections', type=int, default=50000)
+    parser.add_argument('--upstreams', help="proxy list (mis. proxies.txt): chain CONNECT lewat upstream tercepat")
+    args = parser.parse_args()
+
+    pool = UpstreamPool.from_file(args.upstreams) if args.upstreams else None
+    server = SOCKS5Server(args.host, args.port, max_connections=args.max_connections, upstream_pool=pool)
     server.start()
@@ -1,5 +1,6 @@
 let deviceModal = null;
-let statusPollingInterval = null;
+let scanEventSource = null;
+let deviceRefreshTimer = null;
 let currentPage = 1;
 const PER_PAGE = 100;
 let historyCurrentPage = 1;
@@ -182,6 +183,11 @@ function initScanControls() {
             }
             config.ip_range = ipRange.value;
         }
+
+        const excludeIps = document.getElementById('excludeIps');
+        if (excludeIps && excludeIps.value.trim()) {
+            config.exclude_ranges = excludeIps.value;
+        }
         
         // Disable start button
         const startButton = document.getElementById('startScanBtn');
@@ -200,9 +206,8 @@ function initScanControls() {
                 alert(data.message);
                 startButton.disabled = false;  // Re-enable if error
             } else {
-                if (!statusPollingInterval) {
-                    statusPollingInterval = setInterval(updateStatus, 2000);
-                }
+                // Progress selanjutnya datang lewat SSE
+                subscribeScanEvents();
             }
         })
         .catch(error => {
@@ -252,8 +257,6 @@ function updateStatus() {
         .then(response => {
             if (response.status === 401) {
                 console.warn('User is not authenticated');
-                clearInterval(statusPollingInterval);
-                statusPollingInterval = null;
                 return;
             }
             if (!response.ok) {
@@ -263,54 +266,7 @@ function updateStatus() {
         })
         .then(data => {
             if (data) {
-                const statusElement = document.getElementById('scanStatus');
-                const detailsElement = document.getElementById('scanDetails');
-                const startButton = document.getElementById('startScanBtn');
-                const progressBar = document.getElementById('scanProgress');
-                
-                if (!statusElement || !detailsElement || !startButton || !progressBar) {
-                    console.warn('Some status elements not found');
-                    return;
-                }
-
-                statusElement.textContent = data.status;
-                startButton.disabled = data.is_scanning;
-                
-                if (data.is_scanning) {
-                    statusElement.classList.add('text-primary');
-                    if (data.start_time) {
-                        const startTime = new Date(data.start_time);
-                        const duration = Math.floor((new Date() - startTime) / 1000);
-                        detailsElement.textContent = 
-                            `Running for ${duration}s - Found ${data.discovered_devices} devices`;
-                        
-                        const progress = Math.min(
-                            (data.discovered_devices / (data.total_devices || 1)) * 100, 
-                            100
-                        );
-                        progressBar.style.width = `${progress}%`;
-                        progressBar.textContent = `${Math.round(progress)}%`;
-                    }
-                } else {
-                    if (statusPollingInterval) {
-                        clearInterval(statusPollingInterval);
-                        statusPollingInterval = null;
-                    }
-                    
-                    statusElement.classList.remove('text-primary');
-                    if (data.discovered_devices > 0) {
-                        detailsElement.textContent = 
-                            `Last scan found ${data.discovered_devices} devices`;
-                        progressBar.style.width = '100%';
-                        progressBar.textContent = '100%';
-                    } else {
-                        detailsElement.textContent = '';
-                        progressBar.style.width = '0%';
-                        progressBar.textContent = '0%';
-                    }
-                }
-                
-                updateControlButtons(data);
+                renderStatus(data);
             }
         })
         .catch(error => {
@@ -318,6 +274,80 @@ function updateStatus() {
         });
 }
 
+function renderStatus(data) {
+    const statusElement = document.getElementById('scanStatus');
+    const detailsElement = document.getElementById('scanDetails');
+    const startButton = document.getElementById('startScanBtn');
+    const progressBar = document.getElementById('scanProgress');
+    
+    if (!statusElement || !detailsElement || !startButton || !progressBar) {
+        console.warn('Some status elements not found');
+        return;
+    }
+
+    statusElement.textContent = data.status;
+    startButton.disabled = data.is_scanning;
+
+    const currentIpElement = document.getElementById('currentIp');
+    if (currentIpElement) {
+        currentIpElement.textContent = data.current_ip || 'N/A';
+    }
+    
+    if (data.is_scanning) {
+        statusElement.classList.add('text-primary');
+        if (data.start_time) {
+            const startTime = new Date(data.start_time);
+            const duration = Math.floor((new Date() - startTime) / 1000);
+            detailsElement.textContent = 
+                `Running for ${duration}s - Scanned ${data.completed_ips}/${data.total_ips} IPs - Found ${data.discovered_count} devices`;
+            
+            const progress = Math.min(data.progress || 0, 100);
+            progressBar.style.width = `${progress}%`;
+            progressBar.textContent = `${Math.round(progress)}%`;
+        }
+    } else {
+        statusElement.classList.remove('text-primary');
+        if (data.discovered_count > 0) {
+            detailsElement.textContent = 
+                `Last scan found ${data.discovered_count} devices`;
+            progressBar.style.width = '100%';
+            progressBar.textContent = '100%';
+        } else {
+            detailsElement.textContent = '';
+            progressBar.style.width = '0%';
+            progressBar.textContent = '0%';
+        }
+    }
+    
+    updateControlButtons(data);
+}
+
+// Terima status, progress dan device baru dari server (SSE) tanpa polling
+function subscribeScanEvents() {
+    if (scanEventSource || !window.EventSource) {
+        return;
+    }
+
+    scanEventSource = new EventSource('/api/scan/events');
+    scanEventSource.addEventListener('status', event => renderStatus(JSON.parse(event.data)));
+    scanEventSource.addEventListener('progress', event => renderStatus(JSON.parse(event.data)));
+    scanEventSource.addEventListener('device', () => {
+        // Gabungkan banyak device baru jadi satu refresh list
+        if (!deviceRefreshTimer) {
+            deviceRefreshTimer = setTimeout(() => {
+                deviceRefreshTimer = null;
+                loadDevices();
+            }, 2000);
+        }
+    });
+    scanEventSource.onerror = () => {
+        // EventSource reconnect otomatis; kalau ditutup (mis. 401) jangan dibuka ulang terus
+        if (scanEventSource.readyState === EventSource.CLOSED) {
+            scanEventSource = null;
+        }
+    };
+}
+
 function loadDevices() {
     const ipFilter = document.getElementById('ipFilter').value;
     const portFilter = document.getElementById('portFilter').value;
@@ -578,62 +608,8 @@ function updateControlButtons(status) {
     }
 }
 
-function updateScanStatus(data) {
-    const progressBar = document.getElementById('scanProgress');
-    const statusText = document.getElementById('scanStatus');
-    const startButton = document.getElementById('startScanBtn');
-    
-    // Update progress bar
-    progressBar.style.width = `${data.progress}%`;
-    progressBar.textContent = `${data.progress}%`;
-    
-    // Update status
-    statusText.textContent = data.status;
-    statusText.className = `text-${data.status === 'scanning' ? 'primary' : 'secondary'}`;
-    
-    // Disable/enable start button
-    startButton.disabled = data.status === 'scanning';
-    
-    // Update current IP
-    const currentIpElement = document.getElementById('currentIp');
-    if (currentIpElement) {
-        currentIpElement.textContent = data.current_ip || 'N/A';
-    }
-    
-    // Update scan details
-    const detailsElement = document.getElementById('scanDetails');
-    if (detailsElement) {
-        if (data.status === 'scanning') {
-            const duration = Math.floor((new Date() - new Date(data.start_time)) / 1000);
-            detailsElement.textContent = 
-                `Running for ${duration}s - Scanned ${data.completed_ips}/${data.total_ips} IPs`;
-        } else {
-            detailsElement.textContent = '';
-        }
-    }
-}
-
-async function pollScanStatus() {
-    try {
-        document.getElementById('startScanBtn').disabled = true;
-        const response = await fetch('/api/status');
-        const data = await response.json();
-        
-        updateScanStatus(data);
-        
-        if (data.status === 'scanning') {
-            setTimeout(pollScanStatus, 1000);  // Poll every second
-        } else {
-            document.getElementById('startScanBtn').disabled = false;
-        }
-    } catch (error) {
-        console.error('Error fetching scan status:', error);
-        document.getElementById('startScanBtn').disabled = false;
-    }
-}
-
-// Start polling when page loads
-document.addEventListener('DOMContentLoaded', pollScanStatus);
+// Subscribe ke event scan saat halaman dibuka
+document.addEventListener('DOMContentLoaded', subscribeScanEvents);
 
 async function fetchHistory() {
     try {
@@ -0,0 +1,156 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs
+from typing import Dict, Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli opsional, gzip selalu tersedia
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# URL dengan ?v=<hash> tidak pernah berubah isinya, boleh di-cache lama
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+_PLACEHOLDER_RE = re.compile(r'{{\s*(\w+)\s*}}')
+
+def _accepted_encodings(headers: Headers) -> set:
+    encodings = set()
+    for part in headers.get('accept-encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        encodings.add(token.strip().lower())
+    return encodings
+
+class Asset:
+    """Response body kept in memory with precomputed ETag and compressed variants"""
+
+    def __init__(self, content: bytes, media_type: str, mtime: Optional[float] = None):
+        self.content = content
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        self.etag = f'"{self.digest}"'
+        # Nilai ?v= di URL static yang di-version
+        self.version = self.digest[:10]
+        self.last_modified = formatdate(mtime, usegmt=True) if mtime else None
+        self.mtime = int(mtime) if mtime else None
+        self.variants = {}
+
+        if media_type.startswith(COMPRESSIBLE_TYPES) and len(content) > 512:
+            self.variants['gzip'] = gzip.compress(content, 9)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(content)
+
+    def _not_modified(self, headers: Headers) -> bool:
+        if_none_match = headers.get('if-none-match')
+        if if_none_match:
+            # ETag varian (-gzip/-br) menunjuk ke konten yang sama
+            tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+            return '*' in tags or any(tag.split('-')[0] == self.digest for tag in tags)
+
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since and self.mtime:
+            try:
+                return self.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request_headers: Headers, cache_control: str = REVALIDATE_CACHE) -> Response:
+        """Build a 200/304 response, choosing the best encoding the client accepts"""
+        encoding = None
+        if self.variants:
+            accepted = _accepted_encodings(request_headers)
+            for candidate in ('br', 'gzip'):
+                if candidate in self.variants and candidate in accepted:
+                    encoding = candidate
+                    break
+
+        headers = {
+            'ETag': f'"{self.digest}-{encoding}"' if encoding else self.etag,
+            'Cache-Control': cache_control,
+        }
+        if self.variants:
+            headers['Vary'] = 'Accept-Encoding'
+        if self.last_modified:
+            headers['Last-Modified'] = self.last_modified
+
+        if self._not_modified(request_headers):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.content, media_type=self.media_type, headers=headers)
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves every file from memory with gzip/brotli variants and cache headers"""
+
+    def __init__(self, *, directory: str, url_prefix: str = "/static", **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.assets: Dict[str, Asset] = {}
+
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, directory).replace(os.sep, '/')
+                media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                with open(full_path, 'rb') as f:
+                    self.assets[rel_path] = Asset(f.read(), media_type, os.path.getmtime(full_path))
+
+    def versioned_url(self, rel_path: str) -> str:
+        asset = self.assets.get(rel_path)
+        url = f"{self.url_prefix}/{rel_path}"
+        return f"{url}?v={asset.version}" if asset else url
+
+    def version_urls(self, html: str) -> str:
+        """Rewrite /static/... references in HTML to content-versioned URLs"""
+        for rel_path in self.assets:
+            html = html.replace(f'"{self.url_prefix}/{rel_path}"', f'"{self.versioned_url(rel_path)}"')
+            html = html.replace(f"'{self.url_prefix}/{rel_path}'", f"'{self.versioned_url(rel_path)}'")
+        return html
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        asset = self.assets.get(path.replace(os.sep, '/').lstrip('/'))
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        # Immutable hanya kalau ?v= cocok dengan isi sekarang; versi lama/tebakan tetap revalidate
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        cache_control = IMMUTABLE_CACHE if query.get('v') == [asset.version] else REVALIDATE_CACHE
+        return asset.response(Headers(scope=scope), cache_control)
+
+class Template:
+    """HTML template read once at startup and split into static parts and {{ placeholder }}s"""
+
+    def __init__(self, path: str, static_files: Optional[PrecompressedStaticFiles] = None):
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        if static_files is not None:
+            source = static_files.version_urls(source)
+
+        # parts bergantian: teks, nama placeholder, teks, ...
+        self.parts = _PLACEHOLDER_RE.split(source)
+        self.placeholders = set(self.parts[1::2])
+        # Template tanpa placeholder langsung jadi Asset siap kirim (ETag + gzip)
+        self.asset = Asset(source.encode('utf-8'), 'text/html', os.path.getmtime(path)) if not self.placeholders else None
+
+    def render(self, **context) -> str:
+        rendered = list(self.parts)
+        for i in range(1, len(rendered), 2):
+            rendered[i] = context.get(rendered[i], '')
+        return ''.join(rendered)
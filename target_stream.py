@@ -0,0 +1,203 @@
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import List, Optional
+
+from ip_utils import RangeSet, int_to_ip, merge_ranges, parse_range_entry, subtract_ranges
+
+# Contoh entri invalid yang disimpan untuk response/log, sisanya hanya dihitung
+MAX_INVALID_SAMPLES = 100
+
+# Ukuran chunk interval: insert menggeser paling banyak ~2x ini, bukan seluruh list
+_CHUNK = 1024
+
+class _IntervalSet:
+    """Disjoint sorted intervals stored in chunks, adjacent intervals coalesced
+
+    add() locates the affected neighbours with bisect and only rewrites those,
+    so each insert costs O(log n + chunk) however many addresses are queued.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        # End terakhir per chunk, untuk bisect chunk yang benar
+        self._maxes = []
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._starts)
+
+    def add(self, first: int, last: int) -> list:
+        """Add [first, last], returning the sub-intervals that were not in the set yet"""
+        starts, ends, maxes = self._starts, self._ends, self._maxes
+        ci = bisect_left(maxes, first - 1)
+        if ci == len(maxes):
+            # Di belakang semua interval (input terurut): cukup append
+            if not maxes or len(starts[-1]) >= _CHUNK:
+                starts.append([])
+                ends.append([])
+                maxes.append(last)
+            starts[-1].append(first)
+            ends[-1].append(last)
+            maxes[-1] = last
+            return [(first, last)]
+
+        # Interval yang overlap atau bersebelahan, mulai dari (ci, i) sampai sebelum (c, p)
+        i = bisect_left(ends[ci], first - 1)
+        fresh = []
+        cursor, lo, hi = first, first, last
+        c, p = ci, i
+        while c < len(starts):
+            chunk_starts, chunk_ends = starts[c], ends[c]
+            while p < len(chunk_starts) and chunk_starts[p] <= last + 1:
+                start, end = chunk_starts[p], chunk_ends[p]
+                if start > cursor:
+                    fresh.append((cursor, start - 1))
+                cursor = max(cursor, end + 1)
+                lo, hi = min(lo, start), max(hi, end)
+                p += 1
+            if p < len(chunk_starts):
+                break
+            c, p = c + 1, 0
+        if cursor <= last:
+            fresh.append((cursor, last))
+
+        # Ganti interval yang tersentuh dengan satu interval gabungan
+        if c == ci:
+            starts[ci][i:p] = [lo]
+            ends[ci][i:p] = [hi]
+        else:
+            starts[ci][i:] = [lo]
+            ends[ci][i:] = [hi]
+            if c < len(starts):
+                del starts[c][:p]
+                del ends[c][:p]
+            del starts[ci + 1:c], ends[ci + 1:c], maxes[ci + 1:c]
+            if ci + 1 < len(starts) and not starts[ci + 1]:
+                del starts[ci + 1], ends[ci + 1], maxes[ci + 1]
+        maxes[ci] = ends[ci][-1]
+
+        if len(starts[ci]) > 2 * _CHUNK:
+            half = len(starts[ci]) // 2
+            starts.insert(ci + 1, starts[ci][half:])
+            ends.insert(ci + 1, ends[ci][half:])
+            maxes.insert(ci + 1, maxes[ci])
+            del starts[ci][half:], ends[ci][half:]
+            maxes[ci] = ends[ci][-1]
+        return fresh
+
+class TargetStream:
+    """Scan targets parsed from an upload while it is still arriving
+
+    write() appends each chunk to the upload file and parses complete lines
+    (IP, CIDR or 'first-last', '#' comments ignored) into intervals. Every
+    flushed batch is merged, minus the excludes and minus everything already
+    queued, so iter_ips() yields each address once and can start scanning as
+    soon as the first batch is in. Only merged intervals are kept in memory,
+    never the list of entries (N scattered single IPs still cost N intervals).
+    """
+
+    def __init__(self, path: str, exclude_ranges: Optional[List[str]] = None, batch_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.excludes = RangeSet.parse(exclude_ranges)
+        self._exclude_starts = [first for first, _ in self.excludes.intervals]
+        self._exclude_ends = [last for _, last in self.excludes.intervals]
+        self.entries = 0
+        self.invalid_count = 0
+        self.invalid = []
+        self.adjusted_count = 0
+        # Jumlah IP unik yang sudah masuk antrian scan (bertambah selama upload)
+        self.size = 0
+        self.closed = False
+        self._file = open(path, 'wb')
+        self._remainder = b''
+        self._pending = []
+        self._queued = _IntervalSet()
+        self._ready = deque()
+        self._cond = threading.Condition()
+
+    def write(self, chunk: bytes):
+        """Store a chunk and parse the complete lines in it"""
+        if not chunk:
+            return
+        self._file.write(chunk)
+        lines = (self._remainder + chunk).split(b'\n')
+        self._remainder = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+        # Flush per batch, atau langsung kalau scanner sedang menunggu target
+        if len(self._pending) >= self.batch_size or not self._ready:
+            self._flush()
+
+    def close(self):
+        """End of upload: parse the last line and let iter_ips() finish"""
+        if self.closed:
+            return
+        if self._remainder:
+            self._parse_line(self._remainder)
+            self._remainder = b''
+        self._flush()
+        self._file.close()
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        logging.info(f"Target upload {self.path}: {self.entries} entries, {self.size} unique IPs, "
+                     f"{self.invalid_count} invalid, {self.adjusted_count} adjusted")
+
+    def _parse_line(self, line: bytes):
+        entry = line.decode('utf-8', errors='replace').strip()
+        if not entry or entry.startswith('#'):
+            return
+        self.entries += 1
+        try:
+            first, last, normalized = parse_range_entry(entry)
+        except ValueError:
+            self.invalid_count += 1
+            if len(self.invalid) < MAX_INVALID_SAMPLES:
+                self.invalid.append(entry)
+            return
+        if normalized:
+            self.adjusted_count += 1
+        self._pending.append((first, last))
+
+    def _flush(self):
+        if not self._pending:
+            return
+        batch = merge_ranges(self._pending)
+        self._pending = []
+        # Hanya exclude yang berada di rentang batch ini yang perlu dicek
+        lo = bisect_left(self._exclude_ends, batch[0][0])
+        hi = bisect_right(self._exclude_starts, batch[-1][1])
+        batch = subtract_ranges(batch, self.excludes.intervals[lo:hi])
+        # Yang sudah pernah diantrikan tidak discan dua kali
+        batch = [piece for first, last in batch for piece in self._queued.add(first, last)]
+        if not batch:
+            return
+        with self._cond:
+            self._ready.extend(batch)
+            self.size += sum(last - first + 1 for first, last in batch)
+            self._cond.notify_all()
+
+    def iter_ips(self):
+        """Yield every queued address once, blocking until more arrive or the upload is closed"""
+        while True:
+            with self._cond:
+                while not self._ready and not self.closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                first, last = self._ready.popleft()
+            for value in range(first, last + 1):
+                yield int_to_ip(value)
+
+    def summary(self) -> dict:
+        return {
+            'path': self.path,
+            'entries': self.entries,
+            'total_ips': self.size,
+            'invalid_count': self.invalid_count,
+            'invalid_ranges': self.invalid,
+            'adjusted_count': self.adjusted_count
+        }
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+import app as app_module
+
+class StreamRequest:
+    """Minimal Request stand-in: only stream() is used by the body readers"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+def read_text(chunks):
+    return asyncio.run(app_module._read_text_targets(StreamRequest(chunks)))
+
+def test_text_targets_split_across_chunks():
+    chunks = [b'1.2.3.4\n10.0.', b'0.0/8, 192.168', b'.1.1', b'\n\n5.6.7.8']
+    assert read_text(chunks) == ['1.2.3.4', '10.0.0.0/8', '192.168.1.1', '5.6.7.8']
+
+def test_text_targets_chunk_boundary_on_separator():
+    assert read_text([b'1.1.1.1,', b'2.2.2.2 ', b'\n3.3.3.3']) == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+
+def test_too_many_text_targets_stops_reading(monkeypatch):
+    monkeypatch.setattr(app_module, 'BULK_LOOKUP_MAX_TARGETS', 3)
+    request = StreamRequest([b'1.1.1.1\n2.2.2.2\n', b'3.3.3.3\n4.4.4.4\n', b'5.5.5.5\n'])
+    with pytest.raises(ValueError, match='Too many targets'):
+        asyncio.run(app_module._read_text_targets(request))
+    assert request.read == 2
+
+def test_json_targets(monkeypatch):
+    request = StreamRequest([b'{"targets": ["1.2.3.4",', b' "10.0.0.0/8"]}'])
+    assert asyncio.run(app_module._read_json_targets(request)) == ['1.2.3.4', '10.0.0.0/8']
+
+    monkeypatch.setattr(app_module, 'BULK_LOOKUP_MAX_JSON_BYTES', 10)
+    with pytest.raises(ValueError, match='too large'):
+        asyncio.run(app_module._read_json_targets(StreamRequest([b'["1.2.3.4", ', b'"5.6.7.8"]'])))
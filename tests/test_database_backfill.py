@@ -0,0 +1,89 @@
+import json
+import sqlite3
+
+import pytest
+
+from database import Database
+from ip_utils import ip_to_int
+from rir_index import IntervalIndex, IPEnricher
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    db.init_db()
+    return db
+
+def insert_raw_devices(db, count):
+    """Devices written without facets, as by a version before the facet tables"""
+    with sqlite3.connect(db.db_name) as conn:
+        conn.executemany(
+            "INSERT INTO devices (ip, port, banner, timestamp) VALUES (?, ?, ?, datetime('now'))",
+            [(f'10.0.0.{i}', 80, json.dumps({'tags': ['cdn'] if i % 2 else ['vpn']})) for i in range(count)]
+        )
+
+def reset_facets(db, **meta):
+    with sqlite3.connect(db.db_name) as conn:
+        conn.execute('DELETE FROM device_facets')
+        conn.execute('DELETE FROM facet_counts')
+        conn.execute('DELETE FROM db_meta')
+        conn.executemany('INSERT INTO db_meta VALUES (?, ?)', list(meta.items()))
+
+def facet_counts(db):
+    with sqlite3.connect(db.db_name) as conn:
+        return dict(((f, v), n) for f, v, n in conn.execute('SELECT facet, value, count FROM facet_counts'))
+
+def test_facet_backfill_in_batches(db):
+    insert_raw_devices(db, 11)
+    reset_facets(db)
+    with db.connect() as conn:
+        db._backfill_facets(conn, batch_size=3)
+    counts = facet_counts(db)
+    assert counts[('port', '80')] == 11
+    assert counts[('tag', 'cdn')] == 5 and counts[('tag', 'vpn')] == 6
+    with sqlite3.connect(db.db_name) as conn:
+        assert dict(conn.execute('SELECT key, value FROM db_meta').fetchall()) == {'facets_backfilled': '1'}
+
+def test_facet_backfill_resumes_and_runs_once(db):
+    insert_raw_devices(db, 10)
+    # Backfill terputus setelah rowid 6: hanya sisanya yang diproses saat start berikutnya
+    reset_facets(db, facet_backfill_rowid='6')
+    db.init_db()
+    assert facet_counts(db)[('port', '80')] == 4
+
+    # Sudah selesai: start berikutnya tidak membangun ulang
+    with sqlite3.connect(db.db_name) as conn:
+        conn.execute('DELETE FROM device_facets')
+    db.init_db()
+    with sqlite3.connect(db.db_name) as conn:
+        assert conn.execute('SELECT count(*) FROM device_facets').fetchone()[0] == 0
+
+def country_enricher(*intervals):
+    return IPEnricher(IntervalIndex.build(
+        (ip_to_int(first), ip_to_int(last), label) for first, last, label in intervals
+    ))
+
+def test_enrichment_backfill_runs_once_per_index(tmp_path, monkeypatch):
+    db = Database(str(tmp_path / 'test.db'), enricher=country_enricher(('1.0.0.0', '1.0.0.255', 'AU')))
+    db.init_db()
+    with sqlite3.connect(db.db_name) as conn:
+        conn.executemany("INSERT INTO devices (ip, port, banner, ip_int) VALUES (?, 80, '{}', ?)",
+                         [('1.0.0.5', ip_to_int('1.0.0.5')), ('10.0.0.1', ip_to_int('10.0.0.1'))])
+        conn.execute('DELETE FROM db_meta')
+
+    calls = []
+    original = Database._backfill_enrichment
+    monkeypatch.setattr(Database, '_backfill_enrichment', lambda self, c: (calls.append(1), original(self, c)))
+
+    db.init_db()
+    with sqlite3.connect(db.db_name) as conn:
+        assert dict(conn.execute('SELECT ip, country FROM devices')) == {'1.0.0.5': 'AU', '10.0.0.1': None}
+    # 10.0.0.1 tidak pernah resolve, tapi start berikutnya tidak memindai ulang
+    db.init_db()
+    assert len(calls) == 1
+
+    # Index dengan data baru: backfill jalan lagi untuk device yang masih kosong
+    db.enricher = country_enricher(('1.0.0.0', '1.0.0.255', 'AU'), ('10.0.0.0', '10.255.255.255', 'ZZ'))
+    db.init_db()
+    assert len(calls) == 2
+    with sqlite3.connect(db.db_name) as conn:
+        assert conn.execute("SELECT country FROM devices WHERE ip = '10.0.0.1'").fetchone()[0] == 'ZZ'
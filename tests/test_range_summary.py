@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+import range_summary
+from range_summary import summarize_ranges, _summarize_python
+
+pytestmark = pytest.mark.skipif(range_summary.np is None, reason="numpy not installed")
+
+
+def ip(value):
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+
+def random_entry(rng):
+    value = rng.getrandbits(32)
+    prefix = rng.randint(8, 32)
+    network = value & ((0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF)
+    kind = rng.randrange(7)
+    if kind == 0:
+        return f"{ip(network)}/{prefix}"
+    if kind == 1:
+        return f" {ip(value | 1)}/{prefix} "  # host bits
+    if kind == 2:
+        return ip(value)
+    if kind == 3:
+        return f"{ip(value)}-{ip(value + rng.randint(0, 5000) & 0xFFFFFFFF)}"
+    if kind == 4:
+        return rng.choice(['10.0.0.256/8', '10.0.0.0/33', '10.01.0.0/16', 'abc', '', '1.2.3/24', '1.2.3.4/'])
+    if kind == 5:
+        return f"10.{rng.randrange(4)}.0.0/{rng.choice([15, 16, 24])}"  # banyak overlap
+    return f"{ip(network)}/{prefix}\t"
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_python_reference(seed):
+    rng = random.Random(seed)
+    ranges = [random_entry(rng) for _ in range(2000)]
+    excludes = [random_entry(rng) for _ in range(200)]
+    assert summarize_ranges(ranges, excludes) == _summarize_python(ranges, excludes)
+
+
+def test_adjusted_entries_are_normalized():
+    summary = summarize_ranges(['10.0.0.5/8', '192.168.1.77/24', '172.16.0.0/12'])
+    assert summary['adjusted_ranges'] == [
+        {'input': '10.0.0.5/8', 'normalized': '10.0.0.0/8'},
+        {'input': '192.168.1.77/24', 'normalized': '192.168.1.0/24'},
+    ]
+
+
+def test_empty_input():
+    assert summarize_ranges([]) == _summarize_python([], None)
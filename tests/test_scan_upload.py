@@ -0,0 +1,84 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import app as app_module
+from scanner import EternalsSearchScanner
+
+class StreamRequest:
+    """Request stand-in for the upload handler: body chunks from stream()"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+@pytest.fixture
+def scanner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scanner = EternalsSearchScanner()
+    scanner._status_file = str(tmp_path / 'scanner_status.json')
+    scanner.scanned = []
+    scanner.finished = threading.Event()
+
+    def scan_network(ip_ranges, targets):
+        # Scan palsu: hanya catat IP yang diantrikan
+        scanner._is_scanning = True
+        scanner.scanned.extend(targets.iter_ips())
+        scanner._is_scanning = False
+        scanner.finished.set()
+
+    monkeypatch.setattr(scanner, 'scan_network', scan_network)
+    monkeypatch.setattr(app_module, 'scanner', scanner)
+    monkeypatch.setattr(app_module, 'UPLOAD_DIR', str(tmp_path / 'uploads'))
+    os.makedirs(app_module.UPLOAD_DIR)
+    yield scanner
+    scanner.executor.shutdown(wait=False)
+
+def upload(chunks, exclude_ranges=None):
+    return asyncio.run(app_module.upload_scan_targets(StreamRequest(chunks), exclude_ranges))
+
+def test_empty_upload_is_rejected_and_removed(scanner):
+    for chunks in ([], [b'# hanya komentar\n', b'\n\n'], [b'bukan-ip\n10.0.0.0/33\n']):
+        with pytest.raises(HTTPException) as exc:
+            upload(chunks)
+        assert exc.value.status_code == 400
+        assert not scanner.is_scanning
+        assert os.listdir(app_module.UPLOAD_DIR) == []
+
+def test_duplicate_heavy_upload_scans_each_ip_once(scanner):
+    chunks = [b'10.0.0.0/30\n10.0.0.1\n' * 500, b'10.0.0.2-10.0.0.5\n10.0.', b'0.4/31\n', b'10.0.0.3\n' * 500]
+    result = upload(chunks, exclude_ranges='10.0.0.5')
+    assert scanner.finished.wait(5)
+
+    assert result['total_ips'] == 5
+    assert result['entries'] == 1502
+    assert sorted(scanner.scanned) == [f'10.0.0.{i}' for i in range(5)]
+    assert os.listdir(app_module.UPLOAD_DIR) == [os.path.basename(result['path'])]
+
+def test_uploads_get_distinct_files(scanner):
+    paths = []
+    for _ in range(2):
+        paths.append(upload([b'10.0.0.1\n'])['path'])
+        assert scanner.finished.wait(5)
+        scanner.finished.clear()
+    assert paths[0] != paths[1]
+    assert sorted(os.listdir(app_module.UPLOAD_DIR)) == sorted(os.path.basename(p) for p in paths)
+
+def test_concurrent_upload_gets_409(scanner):
+    async def both():
+        first = app_module.upload_scan_targets(StreamRequest([b'10.0.0.1\n', b'10.0.0.2\n']), None)
+        second = app_module.upload_scan_targets(StreamRequest([b'10.0.0.3\n']), None)
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(both())
+    assert first['total_ips'] == 2
+    assert isinstance(second, HTTPException) and second.status_code == 409
+    assert scanner.finished.wait(5)
+    assert len(os.listdir(app_module.UPLOAD_DIR)) == 1
@@ -0,0 +1,34 @@
+import pytest
+import requests
+
+from scanner import EternalsSearchScanner
+
+class Response:
+    status_code = 404
+
+@pytest.fixture
+def scanner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scanner = EternalsSearchScanner()
+    scanner._status_file = str(tmp_path / 'scanner_status.json')
+    scanner._is_scanning = True
+    scanner.used_proxies = []
+
+    def get(url, proxies=None, **kwargs):
+        scanner.used_proxies.append(proxies)
+        return Response()
+
+    monkeypatch.setattr(requests, 'get', get)
+    yield scanner
+    scanner.executor.shutdown(wait=False)
+
+def test_network_scan_uses_local_proxy(scanner):
+    scanner.local_proxy = 'socks5h://127.0.0.1:1080'
+    scanner._scan_single_ip('10.0.0.1')
+    scanner.scan_single_device('10.0.0.2', 80)
+    expected = {'http': 'socks5h://127.0.0.1:1080', 'https': 'socks5h://127.0.0.1:1080'}
+    assert scanner.used_proxies == [expected, expected]
+
+def test_network_scan_defaults_to_proxy_config(scanner):
+    assert scanner._scan_single_ip('10.0.0.1') == ('10.0.0.1', [])
+    assert scanner.used_proxies == [scanner.proxy_config]
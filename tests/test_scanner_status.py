@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from scanner import EternalsSearchScanner
+
+@pytest.fixture
+def scanner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scanner = EternalsSearchScanner()
+    scanner._status_file = str(tmp_path / 'scanner_status.json')
+    yield scanner
+    scanner.executor.shutdown(wait=False)
+
+def write_status(path, devices):
+    with open(path, 'w') as f:
+        json.dump({'is_scanning': True, 'progress': 10, 'discovered_devices': devices}, f)
+
+def test_old_status_file_without_seq(scanner):
+    # Format sebelum cursor: device tanpa 'seq'
+    write_status(scanner._status_file, [
+        {'ip': f'10.0.0.{i}', 'ports': [80], 'timestamp': '2024-01-01T00:00:00'} for i in range(5)
+    ])
+    scanner._load_status()
+
+    page = scanner.discovered_since(0, limit=3)
+    assert [d['seq'] for d in page['devices']] == [1, 2, 3]
+    assert page['has_more']
+    page = scanner.discovered_since(page['cursor'])
+    assert [d['ip'] for d in page['devices']] == ['10.0.0.3', '10.0.0.4']
+    assert not page['has_more']
+
+    # Device baru melanjutkan nomor, dan reload file yang sama tidak mengubah seq
+    scanner._record_discovered('10.0.0.9', [22])
+    assert scanner.discovered_since(5)['devices'][0]['seq'] == 6
+    scanner._load_status()
+    assert [d['seq'] for d in scanner.discovered_devices] == [1, 2, 3, 4, 5]
+
+def test_status_file_with_seq_is_kept(scanner):
+    write_status(scanner._status_file, [
+        {'seq': 41 + i, 'ip': f'10.0.0.{i}', 'ports': [80], 'timestamp': None} for i in range(3)
+    ])
+    scanner._load_status()
+    assert scanner.discovered_since(41)['devices'][0]['seq'] == 42
+    assert scanner.discovered_since(43)['devices'] == []
@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+from search_query import MAX_TERMS, QuerySyntaxError, compile_query, parse_query
+
+@pytest.mark.parametrize('q, message', [
+    ('', 'Empty query'),
+    ('   ', 'Empty query'),
+    ('foo:bar', 'Unknown field: foo'),
+    ('(port:22', 'Missing closing parenthesis'),
+    ('port:22)', "Unexpected ')'"),
+    ('port:22 OR', 'Unexpected end of query'),
+    ('NOT', 'Unexpected end of query'),
+    ('AND port:22', "Unexpected 'AND'"),
+    ('()', "Unexpected ')'"),
+    ('port:abc', 'Invalid port: abc'),
+    ('port:,', 'Empty port'),
+    ('ip:999.1.1.1', 'Invalid IPv4 address'),
+    ('cidr:10.0.0.0/33', 'does not appear to be an IPv4'),
+    ('after:yesterday', 'Invalid date for after'),
+    ('asn:ASx', 'Invalid ASN'),
+    (' '.join(['port:22'] * (MAX_TERMS + 1)), 'Too many terms'),
+])
+def test_invalid_queries(q, message):
+    with pytest.raises(QuerySyntaxError, match=re.escape(message)):
+        compile_query(q)
+
+def test_syntax_error_is_value_error():
+    # Handler API menerjemahkan ValueError menjadi 400
+    with pytest.raises(ValueError):
+        parse_query('(')
+
+def test_precedence_and_negation():
+    assert parse_query('port:22 tag:cloud OR -vuln:cve-1') == (
+        'or', [
+            ('and', [('term', 'port', '22'), ('term', 'tag', 'cloud')]),
+            ('not', ('term', 'vuln', 'cve-1')),
+        ]
+    )
+    assert parse_query('NOT (a OR "b c")') == ('not', ('or', [('text', 'a'), ('text', 'b c')]))
+
+def test_compiled_sql_is_parameterized():
+    sql, params = compile_query('port:22,80 banner:"50%_off" after:2024-01-01')
+    assert '50' not in sql and '2024' not in sql
+    assert params == [22, 80, '%50\\%\\_off%', '2024-01-01 00:00:00']
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+import target_stream
+from target_stream import TargetStream, _IntervalSet
+
+def addresses(intervals):
+    return {value for first, last in intervals for value in range(first, last + 1)}
+
+def intervals_of(interval_set):
+    return [(first, last) for starts, ends in zip(interval_set._starts, interval_set._ends)
+            for first, last in zip(starts, ends)]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_add_returns_only_new_addresses(monkeypatch, seed):
+    # Chunk kecil supaya split dan gabung lintas chunk ikut teruji
+    monkeypatch.setattr(target_stream, '_CHUNK', 4)
+    rng = random.Random(seed)
+    interval_set = _IntervalSet()
+    seen = set()
+    for _ in range(500):
+        first = rng.randrange(2000)
+        last = first + rng.choice([0, 0, 1, 5, 40, 300])
+        fresh = interval_set.add(first, last)
+        new = addresses([(first, last)]) - seen
+        assert addresses(fresh) == new
+        assert sum(b - a + 1 for a, b in fresh) == len(new)
+        seen |= new
+
+        stored = intervals_of(interval_set)
+        assert addresses(stored) == seen
+        # Tetap terurut, disjoint dan tidak bersebelahan
+        assert all(prev[1] + 1 < cur[0] for prev, cur in zip(stored, stored[1:]))
+        assert interval_set._maxes == [ends[-1] for ends in interval_set._ends]
+
+def test_sorted_input_appends_and_coalesces():
+    interval_set = _IntervalSet()
+    assert interval_set.add(10, 20) == [(10, 20)]
+    assert interval_set.add(21, 30) == [(21, 30)]
+    assert interval_set.add(5, 40) == [(5, 9), (31, 40)]
+    assert interval_set.add(12, 18) == []
+    assert intervals_of(interval_set) == [(5, 40)]
+    assert len(interval_set) == 1
+
+def test_stream_deduplicates_across_batches(tmp_path):
+    targets = TargetStream(str(tmp_path / 'targets.txt'), ['10.0.0.7'], batch_size=2)
+    targets.write(b'10.0.0.0/29\n10.0.0.1\n10.0.0.1\n')
+    targets.write(b'10.0.0.4-10.0.0.9\n10.0.0.')
+    targets.write(b'8/31\n# komentar\nbukan-ip')
+    targets.close()
+
+    scanned = list(targets.iter_ips())
+    assert len(scanned) == len(set(scanned))
+    assert set(scanned) == {f'10.0.0.{i}' for i in range(10) if i != 7}
+    assert targets.size == 9
+    assert targets.entries == 6
+    assert targets.invalid == ['bukan-ip']
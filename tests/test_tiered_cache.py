@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from ip_utils import RIPEManager
+from tiered_cache import TieredCache
+
+def make_stale(cache, key, value, age):
+    """Write key to disk as if it was stored age seconds ago"""
+    path = cache._path(key)
+    with open(path, 'w') as f:
+        json.dump(value, f)
+    stored_at = time.time() - age
+    os.utime(path, (stored_at, stored_at))
+
+def wait_for_refresh(cache, timeout=5):
+    deadline = time.time() + timeout
+    while cache._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+    assert not cache._refreshing
+
+def test_fresh_value_skips_loader(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60)
+    cache.set('a', [1])
+    assert cache.get_or_load('a', lambda: pytest.fail('loader called')) == [1]
+    # Cache baru (proses baru) membaca dari disk
+    assert TieredCache(str(tmp_path), ttl=60).get('a') == [1]
+
+def test_concurrent_misses_share_one_load(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+
+def test_stale_value_returned_and_refreshed(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60, stale_ttl=600)
+    make_stale(cache, 'k', 'old', age=120)
+    assert cache.get('k') is None
+    assert cache.get_or_load('k', lambda: 'new') == 'old'
+    wait_for_refresh(cache)
+    assert cache.get('k') == 'new'
+
+def test_expired_beyond_stale_window_loads_synchronously(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60, stale_ttl=600)
+    make_stale(cache, 'k', 'old', age=1000)
+    assert cache.get_or_load('k', lambda: 'new') == 'new'
+
+def test_failed_refresh_keeps_stale_value(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60, stale_ttl=600)
+    make_stale(cache, 'k', 'old', age=120)
+
+    def broken():
+        raise OSError('network down')
+
+    assert cache.get_or_load('k', broken) == 'old'
+    wait_for_refresh(cache)
+    assert cache.get_or_load('k', broken) == 'old'
+
+def test_async_stale_refresh(tmp_path):
+    cache = TieredCache(str(tmp_path), ttl=60, stale_ttl=600)
+    make_stale(cache, 'k', 'old', age=120)
+
+    async def main():
+        async def loader():
+            return 'new'
+        assert await cache.aget_or_load('k', loader) == 'old'
+        while cache._inflight:
+            await asyncio.sleep(0.01)
+        return await cache.aget_or_load('k', loader)
+
+    assert asyncio.run(main()) == 'new'
+
+def test_stale_country_refresh_keeps_its_own_code(tmp_path, monkeypatch):
+    # Refresh background untuk ranges_AA harus men-download AA, bukan negara terakhir di loop
+    ripe = RIPEManager()
+    ripe.cache = TieredCache(str(tmp_path), ttl=60, stale_ttl=600)
+    monkeypatch.setattr(ripe, '_offline_country_ranges', lambda code: None)
+    monkeypatch.setattr(ripe, '_download_country_ranges', lambda code: [f'{code}-new'])
+    make_stale(ripe.cache, 'ranges_AA', ['AA-old'], age=120)
+    make_stale(ripe.cache, 'ranges_BB', ['BB-old'], age=120)
+
+    # Lock per key ditahan supaya refresh baru jalan setelah loop selesai
+    with ripe.cache._key_lock('ranges_AA'), ripe.cache._key_lock('ranges_BB'):
+        assert sorted(ripe.get_country_ip_ranges(['AA', 'BB'])) == ['AA-old', 'BB-old']
+    wait_for_refresh(ripe.cache)
+    assert ripe.cache.get('ranges_AA') == ['AA-new']
+    assert ripe.cache.get('ranges_BB') == ['BB-new']
+    with open(ripe.cache._path('ranges_AA')) as f:
+        assert json.load(f) == ['AA-new']
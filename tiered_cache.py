@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+def _seconds(value) -> float:
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+class TieredCache:
+    """In-process LRU in front of a directory of JSON files
+
+    - reads hit memory first; the disk is only touched on a memory miss
+    - writes go to a temp file and are renamed into place (never half-written)
+    - get_or_load/aget_or_load run one loader per key at a time (single-flight)
+    - entries older than ttl but younger than ttl + stale_ttl are returned
+      immediately while one background load refreshes them
+    """
+
+    def __init__(self, directory, ttl, max_items=256, stale_ttl=timedelta(days=7)):
+        self.directory = directory
+        self.ttl = _seconds(ttl)
+        self.stale_ttl = _seconds(stale_ttl)
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+        self._inflight = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _memory_get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def _memory_set(self, key, value, stored_at):
+        with self._lock:
+            self._items[key] = (value, stored_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if time.time() - stored_at >= self.ttl + self.stale_ttl:
+                return None
+            with open(path, 'r') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable cache file {path}: {str(e)}")
+            return None
+        self._memory_set(key, value, stored_at)
+        return value, stored_at
+
+    def _lookup(self, key):
+        """(value, fresh) or None if missing/expired beyond the stale window"""
+        item = self._memory_get(key) or self._disk_get(key)
+        if item is None:
+            return None
+        value, stored_at = item
+        age = time.time() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            return None
+        return value, age < self.ttl
+
+    def get(self, key):
+        """Fresh value for key, or None"""
+        found = self._lookup(key)
+        return found[0] if found and found[1] else None
+
+    def set(self, key, value):
+        """Store value in memory and atomically on disk"""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._memory_set(key, value, time.time())
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    # Sync (thread) API
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get_or_load(self, key, loader):
+        """Cached value for key, calling loader() at most once per miss across threads"""
+        found = self._lookup(key)
+        if found is not None:
+            value, fresh = found
+            if not fresh:
+                self._refresh_in_thread(key, loader)
+            return value
+
+        with self._key_lock(key):
+            # Thread lain mungkin sudah load selama kita menunggu lock
+            found = self._lookup(key)
+            if found is not None:
+                return found[0]
+            value = loader()
+            self.set(key, value)
+            return value
+
+    def _refresh_in_thread(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self.set(key, loader())
+            except Exception as e:
+                logging.warning(f"Background refresh of {key} failed, keeping stale value: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    # Async API
+
+    async def aget_or_load(self, key, loader):
+        """Async get_or_load: loader is an async callable, concurrent misses share one load"""
+        item = self._memory_get(key)
+        if item is None:
+            # Cache disk bisa besar, baca di thread
+            found = await asyncio.to_thread(self._lookup, key)
+        else:
+            found = self._lookup(key)
+
+        if found is not None:
+            value, fresh = found
+            if not fresh and key not in self._inflight:
+                self._start_load(key, loader).add_done_callback(self._log_refresh_error)
+            return value
+
+        task = self._inflight.get(key) or self._start_load(key, loader)
+        return await asyncio.shield(task)
+
+    def _start_load(self, key, loader) -> asyncio.Task:
+        async def load():
+            try:
+                value = await loader()
+                await asyncio.to_thread(self.set, key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.get_running_loop().create_task(load())
+        self._inflight[key] = task
+        return task
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Background cache refresh failed, keeping stale value: {str(task.exception())}")
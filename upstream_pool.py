@@ -0,0 +1,368 @@
+import time
+import base64
+import random
+import socket
+import asyncio
+import logging
+import ipaddress
+from collections import deque
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+class UpstreamError(Exception):
+    """The upstream proxy failed (connect, handshake or proxy-side error); try another one"""
+
+class TargetError(Exception):
+    """The upstream works but could not reach the target; reply_code is the SOCKS5 reply to send"""
+
+    def __init__(self, message, reply_code=1):
+        super().__init__(message)
+        self.reply_code = reply_code
+
+# Status CONNECT dari proxy HTTP -> reply SOCKS5 untuk client
+_HTTP_REPLY_CODES = {'403': 2, '502': 5, '503': 5, '504': 4}
+
+class Upstream:
+    """One upstream proxy from proxies.txt: 'host:port' (HTTP CONNECT), 'http://...' or 'socks5://[user:pass@]host:port'"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url if '://' in url else f"http://{url}")
+        if parts.scheme not in ('http', 'socks5', 'socks5h') or not parts.hostname or not parts.port:
+            raise ValueError(f"Unsupported upstream proxy: {url}")
+        self.url = url
+        self.scheme = 'socks5' if parts.scheme.startswith('socks5') else 'http'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.username = parts.username
+        self.password = parts.password or ''
+        # None = belum pernah dicek; latency dalam detik (EWMA)
+        self.latency = None
+        self.healthy = None
+        self.failures = 0
+        self.active = 0
+        self.next_check = 0
+        self.standby = deque()
+
+    def score(self) -> float:
+        # Latency dikali beban: upstream cepat yang sedang ramai tidak selalu dipilih
+        return (self.latency or 1.0) * (1 + self.active)
+
+    def record_success(self, elapsed: Optional[float] = None):
+        if elapsed is not None:
+            self.latency = elapsed if self.latency is None else self.latency * 0.7 + elapsed * 0.3
+        elif self.latency is None:
+            return  # Belum ada ukuran latency, biarkan health check yang menilai
+        self.healthy = True
+        self.failures = 0
+
+    def record_failure(self, max_failures: int):
+        self.failures += 1
+        if self.failures >= max_failures:
+            self.healthy = False
+
+    def __repr__(self):
+        return f"Upstream({self.url}, latency={self.latency}, healthy={self.healthy})"
+
+def load_upstreams(path: str) -> List[Upstream]:
+    upstreams = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                upstreams.append(Upstream(line))
+            except ValueError as e:
+                logging.warning(str(e))
+    return upstreams
+
+class UpstreamPool:
+    """Health-checked set of upstream proxies for chaining CONNECTs
+
+    - a background loop checks every upstream (tunnel to check_target) and
+      keeps a latency EWMA; dead upstreams are re-checked with backoff
+    - open_tunnel picks among the fastest healthy upstreams (two random
+      choices, lower latency * active tunnels wins)
+    - the fastest upstreams keep warm_standby pre-connected sockets so a
+      new tunnel skips the TCP handshake to the proxy
+    - an upstream error moves on to the next upstream, up to max_attempts;
+      failover is only possible before the tunnel carries data
+    """
+
+    def __init__(self, upstreams: List[Upstream], check_target=('internetdb.shodan.io', 443),
+                 check_interval=60, check_concurrency=200, attempt_timeout=5, max_attempts=3,
+                 max_failures=2, fastest=8, warm_standby=2, standby_max_idle=30):
+        self.upstreams = upstreams
+        self.check_target = check_target
+        self.check_interval = check_interval
+        self.check_concurrency = check_concurrency
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.max_failures = max_failures
+        self.fastest = fastest
+        self.warm_standby = warm_standby
+        self.standby_max_idle = standby_max_idle
+        self._ranked = []
+        self._ranked_at = 0
+        self._dirty = False
+        self._tasks = []
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'UpstreamPool':
+        return cls(load_upstreams(path), **kwargs)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        logging.info(f"Upstream pool: {len(self.upstreams)} proxies, checking via "
+                     f"{self.check_target[0]}:{self.check_target[1]}")
+        self._tasks = [self.loop.create_task(self._check_loop()), self.loop.create_task(self._standby_loop())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for upstream in self.upstreams:
+            while upstream.standby:
+                upstream.standby.popleft()[0].close()
+
+    # Pemilihan upstream
+
+    def _rank(self):
+        healthy = [u for u in self.upstreams if u.healthy]
+        healthy.sort(key=lambda u: u.latency)
+        self._ranked = healthy
+        self._ranked_at = time.monotonic()
+        self._dirty = False
+
+    def pick(self, exclude=()) -> Optional[Upstream]:
+        # Ranking diperbarui maksimal sekali per detik selama health check berjalan
+        if self._dirty and time.monotonic() - self._ranked_at >= 1:
+            self._rank()
+        candidates = [u for u in self._ranked[:self.fastest * 2] if u not in exclude and u.healthy][:self.fastest]
+        if not candidates:
+            # Belum ada hasil health check: coba yang belum terbukti mati
+            candidates = [u for u in self.upstreams if u.healthy is not False and u not in exclude]
+            if not candidates:
+                return None
+            return random.choice(candidates)
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if a.score() <= b.score() else b
+
+    async def open_tunnel(self, host: str, port: int) -> Tuple[socket.socket, bytes]:
+        """Socket tunneled to host:port through the best upstream, plus bytes already received from the target"""
+        tried = []
+        last_error = None
+        for _ in range(self.max_attempts):
+            upstream = self.pick(exclude=tried)
+            if upstream is None:
+                break
+            tried.append(upstream)
+            upstream.active += 1
+            started = time.monotonic()
+            sock = self._take_standby(upstream)
+            # Socket standby melewati TCP connect, waktunya tidak dipakai untuk latency
+            measure = sock is None
+            try:
+                if sock is None:
+                    sock = await asyncio.wait_for(self._connect(upstream), self.attempt_timeout)
+                leftover = await asyncio.wait_for(self._handshake(upstream, sock, host, port), self.attempt_timeout)
+                upstream.record_success(time.monotonic() - started if measure else None)
+                return sock, leftover
+            except TargetError as e:
+                sock.close()
+                if upstream.healthy:
+                    # Upstream terbukti sehat, target yang tidak bisa dihubungi: tidak perlu failover
+                    upstream.record_success(time.monotonic() - started if measure else None)
+                    raise
+                # Belum pernah lolos health check: bisa jadi proxy yang menolak semua CONNECT
+                upstream.record_failure(self.max_failures)
+                last_error = e
+            except (OSError, asyncio.TimeoutError, UpstreamError) as e:
+                if sock is not None:
+                    sock.close()
+                upstream.record_failure(self.max_failures)
+                last_error = e
+                logging.debug(f"Upstream {upstream.url} failed for {host}:{port}: {str(e) or type(e).__name__}")
+            finally:
+                upstream.active -= 1
+        raise UpstreamError(f"No upstream could reach {host}:{port} ({len(tried)} tried): "
+                            f"{str(last_error) or type(last_error).__name__ if last_error else 'no healthy upstream'}")
+
+    # Koneksi dan handshake ke upstream
+
+    async def _connect(self, upstream: Upstream) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            infos = await self.loop.getaddrinfo(upstream.host, upstream.port, family=socket.AF_INET,
+                                                type=socket.SOCK_STREAM)
+            await self.loop.sock_connect(sock, infos[0][4])
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _recv_exact(self, sock, n) -> bytes:
+        data = bytearray(n)
+        view = memoryview(data)
+        received = 0
+        while received < n:
+            count = await self.loop.sock_recv_into(sock, view[received:])
+            if not count:
+                raise UpstreamError("Upstream closed the connection during handshake")
+            received += count
+        return bytes(data)
+
+    async def _handshake(self, upstream, sock, host, port) -> bytes:
+        if upstream.scheme == 'socks5':
+            await self._socks5_handshake(upstream, sock, host, port)
+            return b''
+        return await self._http_connect(upstream, sock, host, port)
+
+    async def _http_connect(self, upstream, sock, host, port) -> bytes:
+        target = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+        request = f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n"
+        if upstream.username:
+            credentials = base64.b64encode(f"{upstream.username}:{upstream.password}".encode()).decode()
+            request += f"Proxy-Authorization: Basic {credentials}\r\n"
+        await self.loop.sock_sendall(sock, (request + "\r\n").encode())
+
+        response = b''
+        while b'\r\n\r\n' not in response:
+            chunk = await self.loop.sock_recv(sock, 4096)
+            if not chunk:
+                raise UpstreamError("Upstream closed the connection during CONNECT")
+            response += chunk
+            if len(response) > 16384:
+                raise UpstreamError("CONNECT response too large")
+        header, leftover = response.split(b'\r\n\r\n', 1)
+        status_line = header.split(b'\r\n', 1)[0].decode('latin-1')
+        parts = status_line.split(' ', 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise UpstreamError(f"Invalid CONNECT response: {status_line!r}")
+        if parts[1] == '407':
+            raise UpstreamError(f"Upstream requires authentication: {status_line}")
+        if parts[1] != '200':
+            raise TargetError(f"CONNECT rejected: {status_line}", _HTTP_REPLY_CODES.get(parts[1], 1))
+        # Target bisa langsung mengirim data (mis. banner SSH) di segmen yang sama
+        return leftover
+
+    async def _socks5_handshake(self, upstream, sock, host, port):
+        method = 2 if upstream.username else 0
+        await self.loop.sock_sendall(sock, bytes([5, 1, method]))
+        version, chosen = await self._recv_exact(sock, 2)
+        if version != 5 or chosen != method:
+            raise UpstreamError(f"SOCKS5 upstream refused auth method {method}")
+        if method == 2:
+            user, password = upstream.username.encode(), upstream.password.encode()
+            await self.loop.sock_sendall(sock, bytes([1, len(user)]) + user + bytes([len(password)]) + password)
+            if (await self._recv_exact(sock, 2))[1] != 0:
+                raise UpstreamError("SOCKS5 upstream authentication failed")
+
+        try:
+            address = ipaddress.IPv4Address(host).packed
+            request = bytes([5, 1, 0, 1]) + address
+        except ValueError:
+            # Domain di-resolve oleh upstream
+            name = host.encode('idna')
+            request = bytes([5, 1, 0, 3, len(name)]) + name
+        await self.loop.sock_sendall(sock, request + port.to_bytes(2, 'big'))
+
+        version, reply, _, address_type = await self._recv_exact(sock, 4)
+        if version != 5:
+            raise UpstreamError("Invalid SOCKS5 reply from upstream")
+        if address_type == 1:
+            await self._recv_exact(sock, 4 + 2)
+        elif address_type == 4:
+            await self._recv_exact(sock, 16 + 2)
+        elif address_type == 3:
+            await self._recv_exact(sock, (await self._recv_exact(sock, 1))[0] + 2)
+        if reply in (3, 4, 5, 6):
+            # network/host unreachable, connection refused, TTL expired: masalah target
+            raise TargetError(f"Upstream could not reach {host}:{port} (reply {reply})", reply)
+        if reply != 0:
+            raise UpstreamError(f"SOCKS5 upstream error reply {reply}")
+
+    # Warm standby
+
+    def _take_standby(self, upstream: Upstream) -> Optional[socket.socket]:
+        now = time.monotonic()
+        while upstream.standby:
+            sock, created = upstream.standby.popleft()
+            if now - created < self.standby_max_idle and self._is_alive(sock):
+                return sock
+            sock.close()
+        return None
+
+    @staticmethod
+    def _is_alive(sock) -> bool:
+        try:
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        except BlockingIOError:
+            return True  # Tidak ada data dan tidak ditutup: masih hidup
+        except OSError:
+            return False
+
+    async def _fill_standby(self, upstream: Upstream):
+        try:
+            while len(upstream.standby) < self.warm_standby:
+                sock = await asyncio.wait_for(self._connect(upstream), self.attempt_timeout)
+                upstream.standby.append((sock, time.monotonic()))
+        except (OSError, asyncio.TimeoutError):
+            upstream.record_failure(self.max_failures)
+
+    async def _standby_loop(self):
+        while True:
+            keep = set(self._ranked[:self.fastest])
+            for upstream in self.upstreams:
+                if upstream not in keep:
+                    while upstream.standby:
+                        upstream.standby.popleft()[0].close()
+            # Buang socket yang sudah terlalu lama idle, lalu isi ulang
+            now = time.monotonic()
+            for upstream in keep:
+                while upstream.standby and now - upstream.standby[0][1] >= self.standby_max_idle:
+                    upstream.standby.popleft()[0].close()
+            await asyncio.gather(*(self._fill_standby(u) for u in keep))
+            await asyncio.sleep(1)
+
+    # Health check
+
+    async def _check(self, upstream: Upstream, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            started = time.monotonic()
+            sock = None
+            try:
+                sock = await asyncio.wait_for(self._connect(upstream), self.attempt_timeout)
+                await asyncio.wait_for(self._handshake(upstream, sock, *self.check_target), self.attempt_timeout)
+                upstream.record_success(time.monotonic() - started)
+                upstream.next_check = time.monotonic() + self.check_interval
+                self._dirty = True
+            except (OSError, asyncio.TimeoutError, UpstreamError, TargetError):
+                upstream.record_failure(self.max_failures)
+                if upstream.healthy is False:
+                    # Backoff untuk upstream mati: 1x, 2x, 4x ... interval (maks 16x)
+                    backoff = min(2 ** (upstream.failures - self.max_failures), 16)
+                    upstream.next_check = time.monotonic() + self.check_interval * backoff
+                else:
+                    # Belum mencapai max_failures: konfirmasi lagi segera
+                    upstream.next_check = time.monotonic() + self.attempt_timeout
+                self._dirty = True
+            finally:
+                if sock is not None:
+                    sock.close()
+
+    async def _check_loop(self):
+        semaphore = asyncio.Semaphore(self.check_concurrency)
+        while True:
+            now = time.monotonic()
+            due = [u for u in self.upstreams if u.next_check <= now]
+            if due:
+                await asyncio.gather(*(self._check(u, semaphore) for u in due))
+                self._rank()
+                logging.info(f"Upstream check: {len(self._ranked)}/{len(self.upstreams)} healthy"
+                             + (f", fastest {self._ranked[0].url} {self._ranked[0].latency * 1000:.0f} ms"
+                                if self._ranked else ""))
+            await asyncio.sleep(1)